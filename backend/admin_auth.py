@@ -0,0 +1,29 @@
+"""
+Shared admin authentication for operator-only endpoints (profiling, bulk data).
+
+Requests must carry X-Admin-Token matching ADMIN_TOKEN. PROFILING_ADMIN_TOKEN is
+still honoured for deployments that only configured the profiling token.
+"""
+import os
+import hmac
+from functools import wraps
+
+from flask import request, jsonify
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or os.environ.get('PROFILING_ADMIN_TOKEN')
+
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def admin_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'message': 'Admin access required'}), 403
+        return func(*args, **kwargs)
+    return wrapper
@@ -1,109 +1,32 @@
 from flask import Flask, request, jsonify
-import sqlite3
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import uuid
 import json
-import requests
 import threading
+from contextlib import nullcontext
 from pydantic import BaseModel, ValidationError
-from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-import torch.nn as nn
-import pytorch_lightning as pl
-from torchvision import transforms
-from PIL import Image
-import io
-
-# Model definitions (unchanged)
-class BasicBlock(nn.Module):
-    expansion = 1
-    def __init__(self, inplanes, planes, stride=1, downsample=None):
-        super().__init__()
-        self.conv1 = nn.Conv2d(inplanes, planes, kernel_size=3, stride=stride, padding=1, bias=False)
-        self.bn1 = nn.BatchNorm2d(planes)
-        self.relu = nn.ReLU(inplace=True)
-        self.conv2 = nn.Conv2d(planes, planes, kernel_size=3, stride=1, padding=1, bias=False)
-        self.bn2 = nn.BatchNorm2d(planes)
-        self.downsample = downsample
-        self.stride = stride
-    
-    def forward(self, x):
-        identity = x
-        out = self.conv1(x)
-        out = self.bn1(out)
-        out = self.relu(out)
-        out = self.conv2(out)
-        out = self.bn2(out)
-        if self.downsample is not None:
-            identity = self.downsample(x)
-        out += identity
-        return out
-
-class ResNet(nn.Module):
-    def __init__(self, block, layers, num_classes=4):
-        super().__init__()
-        self.inplanes = 64
-        self.conv1 = nn.Conv2d(3, self.inplanes, kernel_size=7, stride=2, padding=3, bias=False)
-        self.bn1 = nn.BatchNorm2d(self.inplanes)
-        self.relu = nn.ReLU(inplace=True)
-        self.maxpool = nn.MaxPool2d(kernel_size=3, stride=2, padding=1)
-        self.layer1 = self._make_layer(block, 64, layers[0])
-        self.layer2 = self._make_layer(block, 128, layers[1], stride=2)
-        self.layer3 = self._make_layer(block, 256, layers[2], stride=2)
-        self.layer4 = self._make_layer(block, 512, layers[3], stride=2)
-        self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
-        self.fc = nn.Linear(512, num_classes)
-    
-    def _make_layer(self, block, planes, blocks, stride=1):
-        downsample = None
-        if stride != 1 or self.inplanes != planes:
-            downsample = nn.Sequential(
-                nn.Conv2d(self.inplanes, planes, 1, stride, bias=False), 
-                nn.BatchNorm2d(planes)
-            )
-        layers = []
-        layers.append(block(self.inplanes, planes, stride, downsample))
-        self.inplanes = planes
-        for _ in range(1, blocks):
-            layers.append(block(self.inplanes, planes))
-        return nn.Sequential(*layers)
-    
-    def forward(self, x):
-        x = self.conv1(x)
-        x = self.bn1(x)
-        x = self.relu(x)
-        x = self.maxpool(x)
-        x = self.layer1(x)
-        x = self.layer2(x)
-        x = self.layer3(x)
-        x = self.layer4(x)
-        x = self.avgpool(x)
-        x = torch.flatten(x, 1)
-        x = self.fc(x)
-        return x
-
-def resnet34():
-    return ResNet(BasicBlock, [3, 4, 6, 3])
-
-def get_model():
-    return resnet34()
-
-class ImageClassifier(pl.LightningModule):
-    def __init__(self, model, num_classes=4, lr=1e-3):
-        super().__init__()
-        self.save_hyperparameters(ignore=['model'])
-        self.model = model
-    
-    def forward(self, x):
-        return self.model(x)
-
+import os
+from profiling import init_profiling
+from bulk_api import init_bulk_api
+from rag_api import init_rag_api
+from rag_client import RAG_API_URL
+from cohort_analytics import init_cohort_api
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from database import init_db
+import repositories
+from auth import password_hasher, HashPoolBusy
+from cpu_resources import cpu_manager
+# The checkpoints were pickled from __main__, so the model classes must be importable here
+from vision_models import BasicBlock, ResNet, ImageClassifier, get_model
+from vision_cascade import init_cascade_api
+from model_registry import ModelRegistry, classify, init_model_registry_api
+from report_generation import load_report_system, extract_patient_context, generate_maternal_report, GENERATION_ERROR
+from report_scheduler import init_report_scheduler, context_digest, is_material
+from query_planner import plan_queries
+from model_server import MODEL_SERVER_ADDRESS, ModelClient
 
 app = Flask(__name__)
 
@@ -111,52 +34,20 @@ app = Flask(__name__)
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 print(f"Running on {device}")
 
-# Define class names
-orientation_classes = ('hdvb', 'hdvf', 'huvb', 'huvf')
-plane_classes = ('AC_PLANE', 'BPD_PLANE', 'NO_Plane', 'FL_PLANE')
-
-# Load models
-orientation_model_path = 'Orientation_RES34.pth'
-plane_model_path = 'PLANE_34.pth'
-
-try:
-    orientation_classifier = torch.load(orientation_model_path, map_location=device, weights_only=False)
-    orientation_classifier.to(device)
-    orientation_classifier.eval()
-except Exception as e:
-    print(f"Error loading orientation model: {e}")
-    raise
-
-try:
-    plane_model = get_model()
-    plane_classifier = ImageClassifier(plane_model)
-    state_dict = torch.load(plane_model_path, map_location=device, weights_only=False)
-    plane_classifier.load_state_dict(state_dict)
-    plane_classifier.to(device)
-    plane_classifier.eval()
-except Exception as e:
-    print(f"Error loading plane model: {e}")
-    raise
-
-def preprocess_image(image_data):
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-    ])
-    image = Image.open(io.BytesIO(image_data)).convert('RGB')
-    image = transform(image)
-    image = image.unsqueeze(0)
-    return image
-
-def predict(image, model, device, classes):
-    image = image.to(device)
-    with torch.no_grad():
-        outputs = model(image)
-        probabilities = torch.softmax(outputs, dim=1)[0]
-        predicted_class_idx = torch.argmax(probabilities).item()
-        predicted_class = classes[predicted_class_idx]
-        confidence = probabilities[predicted_class_idx].item() * 100
-    return predicted_class, confidence
+# Per-workload torch thread budgets (see cpu_resources.py)
+cpu_manager.configure_torch()
+print(cpu_manager.report())
+
+if MODEL_SERVER_ADDRESS:
+    # Weights live in model_server.py, this process only proxies to it
+    model_client = ModelClient(MODEL_SERVER_ADDRESS)
+    model_registry = None
+    print(f"Using model server at {MODEL_SERVER_ADDRESS}")
+else:
+    model_client = None
+    # Versioned, hot-swappable classifiers and cascade student (see model_registry.py)
+    model_registry = ModelRegistry(device)
+    model_registry.load('vision')
 
 @app.route('/predict', methods=['POST', 'OPTIONS'])
 def predict_image():
@@ -179,26 +70,13 @@ def predict_image():
             return jsonify({'error': 'Invalid file type. Please upload an image.'}), 400
 
         image_data = file.read()
-        image = preprocess_image(image_data)
-        
-        orientation_pred, orientation_conf = predict(
-            image, orientation_classifier, device, orientation_classes
-        )
-        
-        plane_pred, plane_conf = predict(
-            image, plane_classifier, device, plane_classes
-        )
-        
-        result = {
-            'orientation': {
-                'prediction': orientation_pred,
-                'confidence': float(orientation_conf)
-            },
-            'plane': {
-                'prediction': plane_pred,
-                'confidence': float(plane_conf)
-            }
-        }
+        if model_client is not None:
+            result = model_client.predict(image_data)
+        else:
+            # Runs on this process's torch pool: background pre-generation yields to it
+            with report_scheduler.interactive() if report_scheduler is not None else nullcontext():
+                # Pin the current version: a concurrent swap does not affect this request
+                result = classify(model_registry.current('vision'), image_data, device)
         
         return jsonify(result), 200
         
@@ -210,6 +88,26 @@ app.config['JWT_SECRET_KEY'] = 'a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
 jwt = JWTManager(app)
 
+# Admin-only profiling hooks (see profiling.py)
+init_profiling(app)
+
+# Admin-only cascade escalation/agreement stats (see vision_cascade.py)
+init_cascade_api(app, model_client)
+
+# Admin-only model versions, hot-swap and rollback (see model_registry.py)
+if model_registry is not None:
+    init_model_registry_api(app, model_registry)
+
+# Admin-only bulk import/export (see bulk_api.py)
+init_bulk_api(app)
+
+# Admin-only panel analytics for clinicians (see cohort_analytics.py)
+init_cohort_api(app)
+
+# Patient-facing report generation proxied to a separate RAG service (see rag_api.py)
+if RAG_API_URL:
+    init_rag_api(app)
+
 # Enable CORS with proper configuration
 CORS(app, resources={r"/*": {
     "origins": "*",  # Allows all origins
@@ -217,69 +115,6 @@ CORS(app, resources={r"/*": {
     "allow_headers": ["Content-Type", "Authorization"]
 }})
 
-# Database setup
-def init_db():
-    conn = sqlite3.connect('hack.db')
-    c = conn.cursor()
-    # Users table with patient_id
-    c.execute('''CREATE TABLE IF NOT EXISTS users 
-                 (user_id VARCHAR(50) PRIMARY KEY,
-                  username TEXT UNIQUE NOT NULL, 
-                  password TEXT NOT NULL,
-                  patient_id VARCHAR(50) UNIQUE NOT NULL)''')
-    
-    # Patients table with patient_id as foreign key
-    c.execute('''CREATE TABLE IF NOT EXISTS Patients (
-        patient_id VARCHAR(50) PRIMARY KEY,
-        first_name VARCHAR(50),
-        last_name VARCHAR(50),
-        gender VARCHAR(10),
-        dob DATE,
-        contact_number VARCHAR(20),
-        email VARCHAR(100),
-        address TEXT,
-        emergency_contact VARCHAR(50),
-        emergency_number VARCHAR(20),
-        height_cm INT,
-        pre_pregnancy_weight FLOAT,
-        current_weight FLOAT,
-        lmp DATE,
-        due_date DATE,
-        gravida INT,
-        para INT,
-        blood_group VARCHAR(5),
-        healthcare_provider VARCHAR(100),
-        hospital VARCHAR(100),
-        registration_date TIMESTAMP,
-        last_updated TIMESTAMP
-    )''')
-
-    # MedicalReports table to store reports and analysis
-    c.execute('''CREATE TABLE IF NOT EXISTS MedicalReports (
-        report_id VARCHAR(50) PRIMARY KEY,
-        patient_id VARCHAR(50) NOT NULL,
-        type TEXT NOT NULL,
-        category TEXT NOT NULL,
-        date TEXT NOT NULL,
-        file_url TEXT NOT NULL,
-        notes TEXT,
-        analysis_results TEXT,
-        created_at TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES Patients(patient_id)
-    )''')
-    # GeneratedReports table to store generated reports
-    c.execute('''CREATE TABLE IF NOT EXISTS GeneratedReports (
-        report_id TEXT PRIMARY KEY,
-        patient_id VARCHAR(50) NOT NULL,
-        report_content TEXT,
-        status TEXT NOT NULL,
-        created_at TIMESTAMP,
-        completed_at TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES Patients(patient_id)
-    )''')
-    conn.commit()
-    conn.close()
-
 # Generate a unique patient ID
 def generate_id():
     return str(uuid.uuid4())[:8]
@@ -299,17 +134,15 @@ def signup():
 
     user_id = generate_id()
     patient_id = generate_id()
-    hashed_password = generate_password_hash(password)
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HashPoolBusy:
+        return jsonify({'message': 'Server busy, please try again'}), 503
 
     try:
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO users (user_id, username, password, patient_id) VALUES (?, ?, ?, ?)", 
-                  (user_id, username, hashed_password, patient_id))
-        conn.commit()
-        conn.close()
+        repositories.users.create(user_id, username, hashed_password, patient_id)
         return jsonify({'message': 'User created successfully', 'patient_id': patient_id}), 201
-    except sqlite3.IntegrityError:
+    except IntegrityError:
         return jsonify({'message': 'Username already exists'}), 400
 
 # Login route
@@ -322,15 +155,18 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
-    conn = sqlite3.connect('hack.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
+    user = repositories.users.get_by_username(username)
 
-    if user and check_password_hash(user[2], password):
-        access_token = create_access_token(identity=user[3])
-        return jsonify({'access_token': access_token, 'patient_id': user[3]}), 200
+    try:
+        # Hashing runs on the bounded auth pool, see auth.py
+        valid = user is not None and password_hasher.verify_and_upgrade(
+            user['password'], password, lambda new_hash: repositories.users.update_password(user['user_id'], new_hash))
+    except HashPoolBusy:
+        return jsonify({'message': 'Server busy, please try again'}), 503
+
+    if valid:
+        access_token = create_access_token(identity=user['patient_id'])
+        return jsonify({'access_token': access_token, 'patient_id': user['patient_id']}), 200
     return jsonify({'message': 'Invalid credentials'}), 401
 
 # Register patient data
@@ -396,20 +232,12 @@ def register_patient():
         return jsonify({'message': 'Missing required fields'}), 400
 
     try:
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute('''INSERT OR REPLACE INTO Patients 
-                     (patient_id, first_name, last_name, gender, dob, contact_number, email, address, 
-                      emergency_contact, emergency_number, height_cm, pre_pregnancy_weight, current_weight, 
-                      lmp, due_date, gravida, para, blood_group, healthcare_provider, hospital, 
-                      registration_date, last_updated) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  tuple(patient_data.values()))
-        print("Rows affected:", c.rowcount)
-        conn.commit()
-        conn.close()
+        # Bound by column name; the old positional insert depended on the dict's key order
+        repositories.patients.upsert(patient_data)
+        if report_scheduler is not None:
+            report_scheduler.notify(patient_id, 'registration')
         return jsonify({'message': 'Patient data saved successfully', 'patient_id': patient_id}), 201
-    except sqlite3.Error as e:
+    except SQLAlchemyError as e:
         print("Database error:", str(e))
         return jsonify({'message': f'Error saving patient data: {str(e)}'}), 500
 
@@ -421,38 +249,34 @@ def get_patient_data():
         return jsonify({'status': 'OK'}), 200
 
     patient_id = get_jwt_identity()
-    conn = sqlite3.connect('hack.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM Patients WHERE patient_id = ?", (patient_id,))
-    patient = c.fetchone()
-    conn.close()
+    patient = repositories.patients.get(patient_id)
 
     if not patient:
         return jsonify({'message': 'Patient not found'}), 404
 
     patient_data = {
-        'patient_id': patient[0],
-        'firstName': patient[1],
-        'lastName': patient[2],
-        'gender': patient[3],
-        'dob': patient[4],
-        'phoneNumber': patient[5],
-        'email': patient[6],
-        'address': patient[7],
-        'emergencyContact': patient[8],
-        'emergencyPhone': patient[9],
-        'height': patient[10],
-        'preWeight': patient[11],
-        'currentWeight': patient[12],
-        'lmp': patient[13],
-        'dueDate': patient[14],
-        'gravida': patient[15],
-        'para': patient[16],
-        'bloodGroup': patient[17],
-        'primaryProvider': patient[18],
-        'preferredHospital': patient[19],
-        'registration_date': patient[20],
-        'last_updated': patient[21]
+        'patient_id': patient['patient_id'],
+        'firstName': patient['first_name'],
+        'lastName': patient['last_name'],
+        'gender': patient['gender'],
+        'dob': patient['dob'],
+        'phoneNumber': patient['contact_number'],
+        'email': patient['email'],
+        'address': patient['address'],
+        'emergencyContact': patient['emergency_contact'],
+        'emergencyPhone': patient['emergency_number'],
+        'height': patient['height_cm'],
+        'preWeight': patient['pre_pregnancy_weight'],
+        'currentWeight': patient['current_weight'],
+        'lmp': patient['lmp'],
+        'dueDate': patient['due_date'],
+        'gravida': patient['gravida'],
+        'para': patient['para'],
+        'bloodGroup': patient['blood_group'],
+        'primaryProvider': patient['healthcare_provider'],
+        'preferredHospital': patient['hospital'],
+        'registration_date': patient['registration_date'],
+        'last_updated': patient['last_updated']
     }
     return jsonify(patient_data), 200
 
@@ -482,16 +306,11 @@ def store_report():
         return jsonify({'message': 'Missing required fields'}), 400
 
     try:
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO MedicalReports 
-                     (report_id, patient_id, type, category, date, file_url, notes, analysis_results, created_at) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  tuple(report_data.values()))
-        conn.commit()
-        conn.close()
+        repositories.medical_reports.add(report_data, data.get('analysisResults', {}))
+        if report_scheduler is not None and is_material(data.get('analysisResults')):
+            report_scheduler.notify(patient_id, 'report')
         return jsonify({'message': 'Report stored successfully', 'report_id': report_data['report_id']}), 201
-    except sqlite3.Error as e:
+    except SQLAlchemyError as e:
         return jsonify({'message': f'Error storing report: {str(e)}'}), 500
 
 # Get medical reports
@@ -502,11 +321,7 @@ def get_medical_reports():
         return jsonify({'status': 'OK'}), 200
 
     patient_id = get_jwt_identity()
-    conn = sqlite3.connect('hack.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM MedicalReports WHERE patient_id = ?", (patient_id,))
-    reports = c.fetchall()
-    conn.close()
+    reports = repositories.medical_reports.list_for_patient(patient_id)
 
     if not reports:
         return jsonify([]), 200
@@ -514,23 +329,21 @@ def get_medical_reports():
     medical_reports = []
     for report in reports:
         medical_reports.append({
-            'id': report[0],
-            'patient_id': report[1],
-            'type': report[2],
-            'category': report[3],
-            'date': report[4],
-            'fileUrl': report[5],
-            'notes': report[6],
-            'analysisResults': json.loads(report[7]) if report[7] else None,
-            'created_at': report[8]
+            'id': report['report_id'],
+            'patient_id': report['patient_id'],
+            'type': report['type'],
+            'category': report['category'],
+            'date': report['date'],
+            'fileUrl': report['file_url'],
+            'notes': report['notes'],
+            'analysisResults': json.loads(report['analysis_results']) if report['analysis_results'] else None,
+            'created_at': report['created_at']
         })
 
     return jsonify(medical_reports), 200
 
 
-# Global variables for model, tokenizer, and vector store (loaded at startup)
-model = None
-tokenizer = None
+# Vector store loaded at startup; the LLM and tokenizer live in model_registry
 vector_store = None
 
 # Pydantic model for JSON input validation
@@ -538,211 +351,70 @@ class PatientRequest(BaseModel):
     patient_id: str
     patient_data: dict  # JSON object containing patient data
 
-# [All unchanged functions remain the same: load_and_split_pdf, create_vector_store, 
-# initialize_model_and_tokenizer, calculate_pregnancy_week, extract_patient_context, 
-# generate_maternal_report]
-
-def load_and_split_pdf(pdf_path):
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Your PDF has been split into {len(chunks)} chunks")
-    return chunks
-
-def create_vector_store(chunks, model_name="sentence-transformers/all-MiniLM-L6-v2", save_path="faiss_index"):
-    embeddings = HuggingFaceEmbeddings(model_name=model_name)
-    vector_store = FAISS.from_documents(chunks, embeddings)
-    vector_store.save_local(save_path)
-    return vector_store
-
-def initialize_model_and_tokenizer(model_name="ritvik77/Medical_Doctor_AI_LoRA-Mistral-7B-Instruct_FullModel"):
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        torch_dtype=torch.float16,
-        device_map="auto",
-        load_in_4bit=True
-    )
-    return tokenizer, model
-
-def calculate_pregnancy_week(lmp_date):
-    lmp = datetime.strptime(lmp_date, '%Y-%m-%d')
-    current_date = datetime.now()
-    days_pregnant = (current_date - lmp).days
-    weeks_pregnant = days_pregnant // 7
-    return weeks_pregnant
-
-def extract_patient_context(patient_data, patient_id):
-    if patient_id not in patient_data:
-        return "Patient not found."
-    
-    patient = patient_data[patient_id]
-    personal_info = patient['personal_info']
-    questionnaire = patient['questionnaire']
-    risk_factors = patient.get('risk_factors', [])
-    test_results = patient.get('test_results', [])
-    
-    context = f"""
-Patient Summary:
-Name: {personal_info['first_name']} {personal_info['last_name']}
-Age: {2025 - int(personal_info['dob'].split('-')[0])} years
-Gender: {personal_info['gender']}
-Due Date: {personal_info['due_date']}
-Last Menstrual Period: {personal_info['lmp']}
-Current Week: {calculate_pregnancy_week(personal_info['lmp'])}
-Blood Group: {personal_info['blood_group']}
-Pre-existing Conditions: {personal_info['preexisting_conditions']}
-Height: {personal_info['height_cm']} cm
-Current Weight: {personal_info['current_weight']} kg
-Pre-pregnancy Weight: {personal_info['pre_pregnancy_weight']} kg
-
-Questionnaire Information:
-First Pregnancy: {questionnaire['is_first_pregnancy']}
-Exercise Frequency: {questionnaire['exercise_frequency']}
-Emotional Wellbeing: {questionnaire['emotional_wellbeing']}
-Prenatal Vitamins: {questionnaire['prenatal_vitamins']}
-"""
-    
-    if risk_factors:
-        context += "Risk Factors: ,"
-        for risk in risk_factors:
-            context += f"- {risk['test_name']}: {risk['result_value']} {risk['result_unit']} (Reference Range: {risk['reference_range']}), Risk Level: {risk['risk_level']},"
-    
-    abnormal_results = [result for result in test_results if result['risk_level'] in ['borderline', 'high_risk']]
-    if abnormal_results:
-        context += "Abnormal Test Results: ,"
-        for result in abnormal_results:
-            context += f"- {result['test_name']}: {result['result_value']} {result['result_unit']} (Reference Range: {result['ref_range_low']} - {result['ref_range_high']}), Risk Level: {result['risk_level']},"
-    
-    return context
-
-def generate_maternal_report(patient_info, vector_store, model, tokenizer):
-    if not tokenizer:
-        raise ValueError("Tokenizer failed to initialize. Ensure 'sentencepiece' is installed.")
-    retrieved_docs = vector_store.similarity_search(patient_info, k=3)
-    medical_context = "\n".join([doc.page_content[:300] for doc in retrieved_docs])
-    
-    prompt = f"""You are an expert obstetrician. Analyze this maternal patient profile and provide a health assessment:
-
-Patient Profile:
-{patient_info}
-
-Guidelines:
-{medical_context}
-
-Provide a profile analysis with:
-1. Patient Overview
-2. Health Status Analysis
-3. Potential Risk Indicators
-4. Recommendations
-5. Next Steps
-"""
-
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
-    
-    inputs = tokenizer(
-        prompt, 
-        return_tensors="pt", 
-        padding=True,
-        truncation=True,
-        max_length=3000
-    )
-    inputs = inputs.to(model.device)
-    
-    print("Starting generation...")
-    
-    try:
-        outputs = model.generate(
-            inputs.input_ids,
-            attention_mask=inputs.attention_mask,
-            max_new_tokens=800,
-            temperature=0.3,
-            top_p=0.9,
-            do_sample=False,
-            num_beams=1,
-            pad_token_id=tokenizer.pad_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-        )
-        
-        report = tokenizer.decode(outputs[0][inputs.input_ids.size(1):], skip_special_tokens=True)
-        
-        print(f"Generation complete, produced {len(outputs[0]) - inputs.input_ids.size(1)} tokens")
-        
-        if not report or len(report) < 50:
-            print("Generated report too short, returning fallback")
-            return """
-# Maternal Health Assessment
-
-## Patient Overview
-The patient is currently pregnant and receiving prenatal care.
-
-## Health Status Analysis
-Based on the available information, the patient appears to be in stable condition.
-
-## Potential Risk Indicators
-A comprehensive risk assessment requires in-person evaluation.
-
-## Recommendations
-- Continue prenatal vitamins
-- Maintain regular checkups
-- Monitor for warning signs
-- Stay hydrated and maintain a balanced diet
-
-## Next Steps
-Schedule next prenatal appointment within 4 weeks.
-"""
-        
-        return report
-    
-    except Exception as e:
-        print(f"Error during generation: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
-        return "Error generating report. Please try again with simpler parameters."
-
 # Startup initialization
 def initialize_system():
-    global model, tokenizer, vector_store
-    pdf_path = "maternacare.pdf"
-    
-    try:
-        print("Loading and splitting PDF...")
-        chunks = load_and_split_pdf(pdf_path)
-        
-        print("Creating vector store...")
-        vector_store = create_vector_store(chunks, save_path="maternal_care_faiss_index")
-        
-        print("Initializing model and tokenizer...")
-        tokenizer, model = initialize_model_and_tokenizer()  
-        print("System initialized successfully.")
-    except Exception as e:
-        print(f"Error during initialization: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+    global vector_store
+    if model_client is not None:
+        print(f"Using model server at {MODEL_SERVER_ADDRESS}, skipping local LLM initialization.")
+        return
+    version, spec = model_registry.resolve('llm')
+    tokenizer, model, vector_store = load_report_system(model_name=spec['model_name'])
+    model_registry.install('llm', {'tokenizer': tokenizer, 'model': model}, version, spec)
 
 # Initialize system when app starts
 with app.app_context():
     initialize_system()
 
-def generate_report_task(report_id, patient_id, patient_info):
-    # Generate the report
-    report = generate_maternal_report(patient_info, vector_store, model, tokenizer)
+def run_generation(patient_info, queries=None, cancelled=None):
+    """(report, model_version), on the shared model server or in-process; report is None if cancelled."""
+    if model_client is not None:
+        try:
+            result = model_client.generate_report(patient_info, queries)
+            return result['report'], result['model_version']
+        except Exception as e:
+            print(f"Model server error during generation: {e}")
+            return GENERATION_ERROR, None
+    # Pin the current version for the whole generation
+    llm = model_registry.current('llm')
+    report = generate_maternal_report(patient_info, vector_store, llm['model'], llm['tokenizer'], queries=queries,
+                                      cancelled=cancelled)
+    return report, llm.version
+
+def current_llm_version():
+    """The version new reports would be generated with, or None when the model server cannot tell."""
+    if model_client is not None:
+        try:
+            return model_client.llm_version()
+        except Exception as e:
+            print(f"Model server version check failed: {e}")
+            return None
+    return model_registry.current('llm').version
+
+def generation_inputs(patient_id, patient_data):
+    """
+    (patient_info, queries) for a report. Known patients are read from the stored
+    summary, exactly as pre-generation does, so both produce the same context digest;
+    the request payload is only used for patients this database does not have.
+    """
+    patient = repositories.patients.load_patient_data(patient_id)
+    if patient is not None:
+        patient_data = {patient_id: patient}
+    patient_info = extract_patient_context(patient_data, patient_id)
+    if patient_info == "Patient not found.":
+        return None, None
+    # Short targeted retrieval queries instead of embedding the whole summary
+    return patient_info, plan_queries(patient_data[patient_id])
+
+# Opt-in background pre-generation on patient data changes (see report_scheduler.py)
+report_scheduler = init_report_scheduler(app, run_generation, current_version=current_llm_version)
+
+def generate_report_task(report_id, patient_id, patient_info, queries=None):
+    # Background pre-generation yields while this runs
+    with report_scheduler.interactive() if report_scheduler is not None else nullcontext():
+        report, model_version = run_generation(patient_info, queries)
     
-    # Update database with the completed report
-    conn = sqlite3.connect('hack.db')
-    c = conn.cursor()
-    c.execute('''UPDATE GeneratedReports 
-                 SET report_content = ?, status = ?, completed_at = ? 
-                 WHERE report_id = ?''', 
-              (report, 'completed', datetime.now().isoformat(), report_id))
-    conn.commit()
-    conn.close()
+    # Update database with the completed report; failures are never reused
+    repositories.generated_reports.complete(report_id, report, model_version, reusable=report != GENERATION_ERROR)
     
     print(f"Report {report_id} generated and stored in database")
 
@@ -760,27 +432,32 @@ def generate_report():
             return jsonify({"error": "Invalid input data", "details": e.errors()}), 400
         
         patient_id = patient_request.patient_id
-        patient_info = extract_patient_context(patient_request.patient_data, patient_id)
-        if patient_info == "Patient not found.":
+        patient_info, queries = generation_inputs(patient_id, patient_request.patient_data)
+        if patient_info is None:
             return jsonify({"error": "Patient not found in the provided data"}), 404
         
+        # A report generated from exactly this context by the serving model (pre-generated or
+        # earlier on demand) is reused; with an unknown version nothing is
+        digest = context_digest(patient_info, queries)
+        cached = repositories.generated_reports.find_reusable(patient_id, digest)
+        version = current_llm_version() if cached else None
+        if cached and version is not None and cached['model_version'] == version:
+            return jsonify({
+                "message": "Report is up to date",
+                "report_id": cached['report_id'],
+                "status": "completed"
+            })
+        
         # Generate a unique report ID
         report_id = str(uuid.uuid4())
         
         # Store initial entry in database
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO GeneratedReports 
-                     (report_id, patient_id, status, created_at) 
-                     VALUES (?, ?, ?, ?)''',
-                  (report_id, patient_id, 'processing', datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        repositories.generated_reports.create_pending(report_id, patient_id, digest)
         
         # Start background task to generate the report
         thread = threading.Thread(
             target=generate_report_task, 
-            args=(report_id, patient_id, patient_info)
+            args=(report_id, patient_id, patient_info, queries)
         )
         thread.daemon = True
         thread.start()
@@ -795,30 +472,20 @@ def generate_report():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+CHECK_REPORT_FIELDS = ('report_id', 'patient_id', 'report_content', 'status', 'created_at', 'completed_at',
+                       'model_version')
+
 # Add a new endpoint to check report status and retrieve the report
 @app.route('/check_report/<report_id>', methods=['GET'])
 def check_report(report_id):
     try:
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute("SELECT report_id, patient_id, report_content, status, created_at, completed_at FROM GeneratedReports WHERE report_id = ?", 
-                  (report_id,))
-        report = c.fetchone()
-        conn.close()
+        report = repositories.generated_reports.get(report_id)
         
         if not report:
             return jsonify({"error": "Report not found"}), 404
         
-        report_data = {
-            "report_id": report[0],
-            "patient_id": report[1],
-            "report_content": report[2],
-            "status": report[3],
-            "created_at": report[4],
-            "completed_at": report[5]
-        }
-        
-        return jsonify(report_data), 200
+        # Explicit fields: internal columns such as input_digest stay server-side
+        return jsonify({field: report[field] for field in CHECK_REPORT_FIELDS}), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -826,4 +493,4 @@ def check_report(report_id):
 
 if __name__ == '__main__':
     init_db()
-    app.run(port=6001)
\ No newline at end of file
+    app.run(port=int(os.environ.get('PORT', 6001)))
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Password hashing off the request threads.
+
+check_password_hash/generate_password_hash are deliberately expensive (scrypt
+by default), and login spikes used to run them on every Flask request thread at
+once, next to model inference. They now run on a small dedicated pool. hashlib
+releases the GIL inside scrypt/pbkdf2, so these threads use real cores while
+request threads just wait. The pool is bounded: once AUTH_HASH_QUEUE jobs are
+running or waiting, new logins get HashPoolBusy (503) instead of piling up.
+
+Hashes record their parameters ("scrypt:32768:8:1$salt$hash"). When
+PASSWORD_HASH_METHOD changes, a successful login re-hashes the password with
+the new parameters in the background.
+
+Environment variables (all optional):
+  PASSWORD_HASH_METHOD   werkzeug method string (default scrypt:32768:8:1,
+                         e.g. pbkdf2:sha256:600000). scrypt uses ~32 MB per job.
+  PASSWORD_SALT_LENGTH   default 16
+  AUTH_HASH_WORKERS      hashing threads (default 2)
+  AUTH_HASH_QUEUE        max running + waiting jobs (default 64)
+  AUTH_HASH_TIMEOUT      seconds a request waits for its job (default 10)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', '2'))
+AUTH_HASH_QUEUE = int(os.environ.get('AUTH_HASH_QUEUE', '64'))
+AUTH_HASH_TIMEOUT = float(os.environ.get('AUTH_HASH_TIMEOUT', '10'))
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=AUTH_HASH_WORKERS, max_pending=AUTH_HASH_QUEUE, timeout=AUTH_HASH_TIMEOUT):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self.workers = max(workers, 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth-hash')
+        self._pending = threading.BoundedSemaphore(max(max_pending, 1))
+        self.rehashed = 0
+        self.rejected = 0
+
+    def _submit(self, fn, *args):
+        if not self._pending.acquire(blocking=False):
+            self.rejected += 1
+            raise HashPoolBusy("Password hashing queue is full")
+        try:
+            future = self._executor.submit(fn, *args)
+        except RuntimeError:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashPoolBusy(f"Password hashing took longer than {self.timeout}s")
+
+    def _hash(self, password):
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def hash(self, password):
+        return self._wait(self._submit(self._hash, password))
+
+    def verify(self, stored_hash, password):
+        return self._wait(self._submit(check_password_hash, stored_hash, password))
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def verify_and_upgrade(self, stored_hash, password, save_hash):
+        """
+        Check the password; on success with outdated parameters, hash it again
+        in the background and pass the new hash to save_hash(new_hash).
+        """
+        if not self.verify(stored_hash, password):
+            return False
+        if self.needs_rehash(stored_hash):
+            def rehash():
+                save_hash(self._hash(password))
+                self.rehashed += 1
+            try:
+                # Best effort: the old hash keeps working if the pool is busy
+                self._submit(rehash).add_done_callback(_log_rehash_error)
+            except HashPoolBusy:
+                pass
+        return True
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.workers, 'rehashed': self.rehashed,
+                'rejected': self.rejected}
+
+
+def _log_rehash_error(future):
+    if future.exception() is not None:
+        print(f"Password rehash failed: {future.exception()}")
+
+
+password_hasher = PasswordHasher()
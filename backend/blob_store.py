@@ -0,0 +1,199 @@
+"""
+Content-addressed, compressed storage for large report bodies.
+
+Generated report text used to sit inline in GeneratedReports.report_content and,
+for RAG reports, inside MedicalReports.analysis_results. Bodies larger than
+BLOB_INLINE_MAX bytes are now compressed (zstd, or zlib when the zstandard
+package is missing) into ReportBlobs, keyed by the SHA-256 of the text. The row
+keeps only a "blob:sha256:<digest>" reference. Identical bodies are stored once.
+The repositories resolve references on read, so callers still see plain text.
+Short text that itself starts with "blob:" is stored escaped ("blob:text:"
+prefix), so a client cannot pass off its own string as a reference.
+
+Existing databases can be compacted in place:
+
+    python blob_store.py --migrate
+"""
+import os
+import json
+import zlib
+import hashlib
+import argparse
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import select, update
+
+import database as db
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Short bodies (errors, placeholders) are cheaper inline than as a second lookup
+BLOB_INLINE_MAX = int(os.environ.get('BLOB_INLINE_MAX', '2048'))
+BLOB_ZSTD_LEVEL = int(os.environ.get('BLOB_ZSTD_LEVEL', '10'))
+REF_PREFIX = 'blob:sha256:'
+ESCAPE_PREFIX = 'blob:text:'
+IN_CHUNK_SIZE = 500
+
+
+def compress(data):
+    """Return (codec, payload) for raw bytes."""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec, payload):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == 'zlib':
+        return zlib.decompress(payload)
+    raise ValueError(f"Unknown blob codec {codec}")
+
+
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def is_escaped(value):
+    return isinstance(value, str) and value.startswith(ESCAPE_PREFIX)
+
+
+def _decoded(value, texts):
+    """Stored value -> text, given the resolved references; unknown references are left as stored."""
+    if is_escaped(value):
+        return value[len(ESCAPE_PREFIX):]
+    return texts.get(value, value)
+
+
+def put(conn, text):
+    """Store text (deduplicated) and return its reference."""
+    data = text.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    codec, payload = compress(data)
+    db.upsert(conn, db.report_blobs, {'digest': digest, 'codec': codec, 'size': len(data), 'data': payload,
+                                      'created_at': datetime.now().isoformat()}, ['digest'], update_columns=[])
+    return REF_PREFIX + digest
+
+
+def offload(conn, text, stored=False):
+    """
+    Reference for large text, the text itself otherwise (escaped if it looks like
+    one). stored=True is for values already in the database, which are kept as
+    they are when already encoded.
+    """
+    if text is None or (stored and (is_ref(text) or is_escaped(text))):
+        return text
+    if len(text.encode('utf-8')) > BLOB_INLINE_MAX:
+        return put(conn, text)
+    if is_ref(text) or is_escaped(text):
+        return ESCAPE_PREFIX + text
+    return text
+
+
+def resolve_many(conn, values):
+    """Map every reference in values to its text, in one query per IN_CHUNK_SIZE references."""
+    digests = sorted({value[len(REF_PREFIX):] for value in values if is_ref(value)})
+    texts = {}
+    for i in range(0, len(digests), IN_CHUNK_SIZE):
+        chunk = digests[i:i + IN_CHUNK_SIZE]
+        rows = conn.execute(
+            select(db.report_blobs.c.digest, db.report_blobs.c.codec, db.report_blobs.c.data)
+            .where(db.report_blobs.c.digest.in_(chunk)))
+        for digest, codec, payload in rows:
+            texts[REF_PREFIX + digest] = decompress(codec, payload).decode('utf-8')
+    return texts
+
+
+def resolve(conn, value):
+    if not is_ref(value):
+        return _decoded(value, {})
+    texts = resolve_many(conn, [value])
+    if value not in texts:
+        raise LookupError(f"Missing report blob {value}")
+    return texts[value]
+
+
+def offload_analysis(conn, analysis_results, stored=False):
+    """Offload report_content inside a MedicalReports.analysis_results JSON string."""
+    if not analysis_results or '"report_content"' not in analysis_results:
+        return analysis_results
+    analysis = json.loads(analysis_results)
+    if not isinstance(analysis, dict) or not isinstance(analysis.get('report_content'), str):
+        return analysis_results
+    ref = offload(conn, analysis['report_content'], stored)
+    if ref == analysis['report_content']:
+        return analysis_results
+    analysis['report_content'] = ref
+    return json.dumps(analysis)
+
+
+def inflate_analyses(conn, reports):
+    """Resolve report_content references (and escapes) in MedicalReports rows (dicts), in place."""
+    pending = []
+    for report in reports:
+        analysis_results = report.get('analysis_results')
+        # Cheap substring test first; only RAG rows carry references
+        if analysis_results and (REF_PREFIX in analysis_results or ESCAPE_PREFIX in analysis_results):
+            try:
+                analysis = json.loads(analysis_results)
+            except ValueError:
+                continue
+            # Anything but an object with a string report_content is left as stored
+            if isinstance(analysis, dict) and isinstance(analysis.get('report_content'), str):
+                pending.append((report, analysis))
+    if not pending:
+        return reports
+    texts = resolve_many(conn, [analysis['report_content'] for _, analysis in pending])
+    for report, analysis in pending:
+        analysis['report_content'] = _decoded(analysis['report_content'], texts)
+        report['analysis_results'] = json.dumps(analysis)
+    return reports
+
+
+def migrate(engine, batch_size=500):
+    """Move existing inline report bodies into ReportBlobs. Safe to re-run."""
+    db.metadata.create_all(engine, tables=[db.report_blobs])
+    moved = 0
+    for table, key, column, convert in (
+        (db.generated_reports, db.generated_reports.c.report_id, db.generated_reports.c.report_content,
+         partial(offload, stored=True)),
+        (db.medical_reports, db.medical_reports.c.report_id, db.medical_reports.c.analysis_results,
+         partial(offload_analysis, stored=True)),
+    ):
+        last_key = ''
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(key, column).where(key > last_key).order_by(key).limit(batch_size)).all()
+                for row_key, value in rows:
+                    new_value = convert(conn, value)
+                    if new_value != value:
+                        conn.execute(update(table).where(key == row_key).values({column.name: new_value}))
+                        moved += 1
+            if len(rows) < batch_size:
+                break
+            last_key = rows[-1][0]
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compressed report blob store')
+    parser.add_argument('--migrate', action='store_true', help='offload existing inline report bodies')
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.print_help()
+        return
+    moved = migrate(db.engine)
+    print(f"Offloaded {moved} report bodies ({'zstd' if zstandard is not None else 'zlib'})")
+    if db.engine.dialect.name == 'sqlite':
+        print("Run VACUUM on the database to return the freed pages to the filesystem")
+
+
+if __name__ == '__main__':
+    main()
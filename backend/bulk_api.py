@@ -0,0 +1,239 @@
+"""
+Bulk import/export of patients and medical reports for hospital onboarding.
+
+Admin-only (X-Admin-Token, see admin_auth.py):
+  POST /bulk/patients          NDJSON (application/x-ndjson) or CSV (text/csv) upload
+  POST /bulk/reports           same formats
+  GET  /bulk/patients/export   ?format=ndjson|csv
+  GET  /bulk/reports/export    ?format=ndjson|csv&patient_id=...
+
+Uploads are parsed as a stream, validated row by row and written with
+executemany in batches of BULK_BATCH_SIZE rows, one transaction per batch
+(see repositories.py).
+Invalid rows are reported back with their line number instead of failing the
+whole upload. Records use the database column names (snake_case). Patients are
+upserted and counted as inserted or updated; a patient_id repeated within an
+upload keeps its last row.
+"""
+import io
+import os
+import csv
+import json
+import uuid
+from datetime import datetime
+
+from flask import request, jsonify, Response, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
+
+from admin_auth import admin_required
+import repositories
+
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '5000'))
+MAX_REPORTED_ERRORS = 1000
+
+PATIENT_COLUMNS = (
+    'patient_id', 'first_name', 'last_name', 'gender', 'dob', 'contact_number', 'email', 'address',
+    'emergency_contact', 'emergency_number', 'height_cm', 'pre_pregnancy_weight', 'current_weight',
+    'lmp', 'due_date', 'gravida', 'para', 'blood_group', 'healthcare_provider', 'hospital',
+    'registration_date', 'last_updated',
+)
+REPORT_COLUMNS = (
+    'report_id', 'patient_id', 'type', 'category', 'date', 'file_url', 'notes', 'analysis_results', 'created_at',
+)
+INT_FIELDS = ('height_cm', 'gravida', 'para')
+FLOAT_FIELDS = ('pre_pregnancy_weight', 'current_weight')
+DATE_FIELDS = ('dob', 'lmp', 'due_date')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+
+def validate_patient(record):
+    patient = {column: (None if _blank(record.get(column)) else record.get(column)) for column in PATIENT_COLUMNS}
+    for field in ('patient_id', 'first_name', 'last_name', 'email', 'lmp'):
+        if patient[field] is None:
+            raise ValueError(f"missing required field {field}")
+    for field in INT_FIELDS:
+        if patient[field] is not None:
+            patient[field] = int(patient[field])
+    for field in FLOAT_FIELDS:
+        if patient[field] is not None:
+            patient[field] = float(patient[field])
+    for field in DATE_FIELDS:
+        if patient[field] is not None:
+            datetime.strptime(str(patient[field]), '%Y-%m-%d')
+    now = datetime.now().isoformat()
+    patient['registration_date'] = patient['registration_date'] or now
+    patient['last_updated'] = now
+    return patient
+
+
+def validate_report(record):
+    report = {column: (None if _blank(record.get(column)) else record.get(column)) for column in REPORT_COLUMNS}
+    for field in ('patient_id', 'type', 'category', 'date', 'file_url'):
+        if report[field] is None:
+            raise ValueError(f"missing required field {field}")
+    analysis = report['analysis_results']
+    if isinstance(analysis, str):
+        # CSV cells carry the analysis as a JSON string
+        analysis = json.loads(analysis)
+    if analysis is not None and not isinstance(analysis, dict):
+        # Downstream readers (blob_store, patient_summary) expect an object
+        raise ValueError("analysis_results must be a JSON object")
+    report['analysis_results'] = json.dumps(analysis or {})
+    report['report_id'] = report['report_id'] or str(uuid.uuid4())[:8]
+    report['created_at'] = report['created_at'] or datetime.now().isoformat()
+    return report
+
+
+def iter_records():
+    """Yield (line_number, record_or_exception) from the request body as it streams in."""
+    content_type = (request.content_type or '').split(';')[0].strip()
+    text = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+    if content_type == 'text/csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, e
+
+
+class ImportResult:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        return {'received': self.received, 'inserted': self.inserted, 'updated': self.updated, 'failed': self.failed,
+                'errors': self.errors, 'errors_truncated': self.failed > len(self.errors)}
+
+
+def _flush_patients(batch, result):
+    # One row per patient_id, the last one wins: ON CONFLICT cannot touch a row twice in one statement
+    latest = {patient['patient_id']: patient for _, patient in batch}
+    existing = repositories.patients.existing_ids(latest)
+    repositories.patients.upsert_many(list(latest.values()))
+    inserted = len(latest) - len(existing)
+    result.inserted += inserted
+    # Superseded duplicates count as updates of the row that replaced them
+    result.updated += len(batch) - inserted
+
+
+def _flush_reports(batch, result):
+    known_patients = repositories.patients.existing_ids({report['patient_id'] for _, report in batch})
+    existing_reports = repositories.medical_reports.existing_ids(report['report_id'] for _, report in batch)
+
+    rows = []
+    analyses = {}
+    seen = set()
+    for line_number, report in batch:
+        if report['patient_id'] not in known_patients:
+            result.error(line_number, f"unknown patient_id {report['patient_id']}")
+        elif report['report_id'] in existing_reports or report['report_id'] in seen:
+            result.error(line_number, f"duplicate report_id {report['report_id']}")
+        else:
+            seen.add(report['report_id'])
+            rows.append(report)
+            analyses.setdefault(report['patient_id'], []).append(report['analysis_results'])
+
+    if rows:
+        repositories.medical_reports.add_many(rows, analyses)
+    result.inserted += len(rows)
+
+
+def run_import(validate, flush):
+    result = ImportResult()
+    batch = []
+    try:
+        for line_number, record in iter_records():
+            result.received += 1
+            if isinstance(record, Exception):
+                result.error(line_number, f"invalid JSON: {record}")
+                continue
+            if not isinstance(record, dict):
+                result.error(line_number, "expected a JSON object")
+                continue
+            try:
+                batch.append((line_number, validate(record)))
+            except (ValueError, TypeError, json.JSONDecodeError) as e:
+                result.error(line_number, str(e))
+                continue
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush(batch, result)
+                batch = []
+        if batch:
+            flush(batch, result)
+    except (SQLAlchemyError, UnicodeDecodeError, csv.Error) as e:
+        payload = result.to_dict()
+        payload['message'] = f"Import aborted: {e}"
+        return jsonify(payload), 500
+    return jsonify(result.to_dict()), 200 if not result.failed else 207
+
+
+def stream_export(batches, columns, output_format, json_columns=()):
+    def generate():
+        if output_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(columns)
+            yield buffer.getvalue()
+        for rows in batches:
+            buffer = io.StringIO()
+            if output_format == 'csv':
+                csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+            else:
+                for record in rows:
+                    for column in json_columns:
+                        if record[column]:
+                            try:
+                                record[column] = json.loads(record[column])
+                            except json.JSONDecodeError:
+                                pass
+                    buffer.write(json.dumps(record) + '\n')
+            yield buffer.getvalue()
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def init_bulk_api(app):
+    @app.route('/bulk/patients', methods=['POST'])
+    @admin_required
+    def bulk_import_patients():
+        return run_import(validate_patient, _flush_patients)
+
+    @app.route('/bulk/reports', methods=['POST'])
+    @admin_required
+    def bulk_import_reports():
+        return run_import(validate_report, _flush_reports)
+
+    @app.route('/bulk/patients/export', methods=['GET'])
+    @admin_required
+    def bulk_export_patients():
+        output_format = request.args.get('format', 'ndjson')
+        if output_format not in ('ndjson', 'csv'):
+            return jsonify({'message': 'format must be ndjson or csv'}), 400
+        return stream_export(repositories.patients.stream_all(), PATIENT_COLUMNS, output_format)
+
+    @app.route('/bulk/reports/export', methods=['GET'])
+    @admin_required
+    def bulk_export_reports():
+        output_format = request.args.get('format', 'ndjson')
+        if output_format not in ('ndjson', 'csv'):
+            return jsonify({'message': 'format must be ndjson or csv'}), 400
+        batches = repositories.medical_reports.stream_all(patient_id=request.args.get('patient_id'))
+        return stream_export(batches, REPORT_COLUMNS, output_format, json_columns=('analysis_results',))
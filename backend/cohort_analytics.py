@@ -0,0 +1,189 @@
+"""
+Panel-wide analytics for clinicians.
+
+The patient panel (optionally one hospital or provider) is loaded once into
+columnar NumPy arrays. Gestational weeks, maternal age, BMI, weight gain against
+the IOM range and risk levels are then computed for every patient in one
+vectorized pass, instead of one /patient-data or report request per patient.
+Risk findings come from the materialized PatientSummaries rows (see
+patient_summary.py).
+
+    GET /clinician/dashboard?hospital=...&provider=...&flagged_limit=100
+
+Admin-only (X-Admin-Token, see admin_auth.py) until clinician roles exist.
+Results are cached for DASHBOARD_CACHE_TTL seconds per filter.
+"""
+import os
+import json
+from collections import Counter
+from datetime import date, datetime
+
+import numpy as np
+from flask import request, jsonify
+
+from admin_auth import admin_required
+import pregnancy_timeline as pt
+import repositories
+from ttl_cache import TTLCache
+
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '60'))
+RISK_LEVELS = ('none', 'borderline', 'high_risk')
+WEEK_BINS = np.array([0, 14, 28, 37, 42])
+WEEK_BIN_LABELS = ('<14', '14-27', '28-36', '37-41', '42+')
+TRIMESTER_LABELS = ('first', 'second', 'third')
+GAIN_STATUS = ('below', 'within', 'above')
+
+_cache = TTLCache(maxsize=256, ttl=DASHBOARD_CACHE_TTL)
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype='float64')
+
+
+def _risk_level(risk_factors, test_results):
+    """Highest risk level across one patient's summary findings (index into RISK_LEVELS)."""
+    level = 0
+    tests = []
+    for finding in json.loads(risk_factors or '[]') + json.loads(test_results or '[]'):
+        if not isinstance(finding, dict):
+            continue
+        risk = finding.get('risk_level')
+        if risk == 'high_risk':
+            level = 2
+        elif risk == 'borderline':
+            level = max(level, 1)
+        else:
+            continue
+        if finding.get('test_name'):
+            tests.append(finding['test_name'])
+    return level, tests
+
+
+def load_cohort(rows):
+    """Columnar arrays from PatientRepository.cohort rows."""
+    if rows:
+        (patient_id, dob, lmp, due_date, height, pre_weight, current_weight,
+         risk_factors, test_results) = zip(*rows)
+    else:
+        patient_id = dob = lmp = due_date = height = pre_weight = current_weight = risk_factors = test_results = ()
+    risk = [_risk_level(r, t) for r, t in zip(risk_factors, test_results)]
+    return {
+        'patient_id': np.array(patient_id, dtype=object),
+        'dob': pt.to_datetime64(dob),
+        'lmp': pt.to_datetime64(lmp),
+        'due_date': pt.to_datetime64(due_date),
+        'height_cm': _floats(height),
+        'pre_pregnancy_weight': _floats(pre_weight),
+        'current_weight': _floats(current_weight),
+        'risk_level': np.array([level for level, _ in risk], dtype='int64'),
+        'abnormal_tests': [tests for _, tests in risk],
+    }
+
+
+def _summary(values):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return {'count': 0, 'mean': None, 'median': None, 'p10': None, 'p90': None}
+    p10, median, p90 = np.percentile(values, [10, 50, 90])
+    return {'count': int(values.size), 'mean': round(float(values.mean()), 2), 'median': round(float(median), 2),
+            'p10': round(float(p10), 2), 'p90': round(float(p90), 2)}
+
+
+def _counts(codes, labels):
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    result = {label: int(count) for label, count in zip(labels, counts)}
+    result['unknown'] = int((codes < 0).sum())
+    return result
+
+
+def compute_dashboard(cohort, today=None, flagged_limit=100):
+    today = today or date.today()
+    n = len(cohort['patient_id'])
+
+    weeks = pt.gestational_week_v(cohort['lmp'], today)
+    known_week = ~np.isnan(weeks)
+    week_bin = np.where(known_week, np.searchsorted(WEEK_BINS, np.nan_to_num(weeks), side='right') - 1, -1)
+    week_bin[known_week & (weeks < 0)] = -1
+    trimester = np.where(weeks <= pt.FIRST_TRIMESTER_END, 0, np.where(weeks <= pt.SECOND_TRIMESTER_END, 1, 2))
+    trimester[~known_week | (weeks < 0)] = -1
+    days_past_due = (np.datetime64(today, 'D') - cohort['due_date']).astype('float64')
+    days_past_due[np.isnat(cohort['due_date'])] = np.nan
+    overdue = (weeks >= pt.POST_TERM_WEEKS) | (days_past_due > 0)
+
+    ages = pt.age_years_v(cohort['dob'], today)
+    bmi = pt.bmi_v(cohort['height_cm'], cohort['pre_pregnancy_weight'])
+    bmi_category = pt.bmi_category_v(bmi)
+    gain = cohort['current_weight'] - cohort['pre_pregnancy_weight']
+    low, high = pt.recommended_gain_v(np.nan_to_num(weeks), bmi_category)
+    gain_status = np.select([gain < low, gain > high], [0, 2], default=1)
+    gain_status[np.isnan(gain) | np.isnan(low) | ~known_week] = -1
+
+    risk = cohort['risk_level']
+    by_trimester = {}
+    for index, label in enumerate(TRIMESTER_LABELS):
+        mask = trimester == index
+        by_trimester[label] = {'patients': int(mask.sum()), 'weight_gain_kg': _summary(gain[mask]),
+                               'weight_gain_status': _counts(gain_status[mask], GAIN_STATUS),
+                               'risk_levels': _counts(risk[mask], RISK_LEVELS)}
+
+    test_counts = Counter(test for tests in cohort['abnormal_tests'] for test in set(tests))
+
+    # Patients needing attention first: high risk, then overdue, then off-range weight gain
+    flag = (risk == 2) | overdue | (gain_status == 0) | (gain_status == 2)
+    priority = risk * 4 + overdue * 2 + ((gain_status == 0) | (gain_status == 2))
+    order = np.argsort(-priority[flag], kind='stable')[:flagged_limit]
+    flagged = []
+    for i in np.flatnonzero(flag)[order]:
+        flagged.append({
+            'patient_id': cohort['patient_id'][i],
+            'gestational_week': None if np.isnan(weeks[i]) else int(weeks[i]),
+            'risk_level': RISK_LEVELS[risk[i]],
+            'overdue': bool(overdue[i]),
+            'weight_gain_kg': None if np.isnan(gain[i]) else round(float(gain[i]), 1),
+            'weight_gain_status': GAIN_STATUS[gain_status[i]] if gain_status[i] >= 0 else 'unknown',
+            'abnormal_tests': sorted(set(cohort['abnormal_tests'][i])),
+        })
+
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'as_of': today.isoformat(),
+        'patients': n,
+        'gestational_weeks': {
+            'summary': _summary(weeks[known_week & (weeks >= 0)]),
+            'bins': _counts(week_bin, WEEK_BIN_LABELS),
+            'trimesters': _counts(trimester, TRIMESTER_LABELS),
+            'overdue': int(overdue.sum()),
+        },
+        'maternal_age': {**_summary(ages), 'under_18': int((ages < 18).sum()), 'over_35': int((ages > 35).sum())},
+        'bmi': {**_summary(bmi), 'categories': _counts(bmi_category, pt.BMI_CATEGORIES)},
+        'weight_gain': {
+            'kg': _summary(gain),
+            'status': _counts(gain_status, GAIN_STATUS),
+            'by_trimester': by_trimester,
+        },
+        'risk': {
+            'levels': _counts(risk, RISK_LEVELS),
+            'top_abnormal_tests': [{'test_name': name, 'patients': count}
+                                   for name, count in test_counts.most_common(10)],
+        },
+        'flagged': flagged,
+        'flagged_total': int(flag.sum()),
+    }
+
+
+def dashboard(hospital=None, provider=None, flagged_limit=100):
+    key = (hospital, provider, flagged_limit, date.today())
+    return _cache.get_or_load(key, lambda: compute_dashboard(
+        load_cohort(repositories.patients.cohort(hospital, provider)), flagged_limit=flagged_limit))
+
+
+def init_cohort_api(app):
+    @app.route('/clinician/dashboard', methods=['GET'])
+    @admin_required
+    def clinician_dashboard():
+        try:
+            flagged_limit = min(max(int(request.args.get('flagged_limit', 100)), 0), 1000)
+        except ValueError:
+            return jsonify({'message': 'flagged_limit must be an integer'}), 400
+        result = dashboard(request.args.get('hospital'), request.args.get('provider'), flagged_limit)
+        return jsonify(result), 200
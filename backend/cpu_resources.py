@@ -0,0 +1,144 @@
+"""
+Serving-level CPU resource manager for torch workloads.
+
+Flask request threads running ResNet forwards and background report threads
+running model.generate all share one process. Each workload (vision, llm,
+embeddings) has a thread budget and a concurrency limit; workload(name) is a
+semaphore that bounds how many calls of that kind run at once.
+
+torch's intra-op pool is process-wide: torch.set_num_threads from one request
+thread changes it for every other thread, and core affinity set on one thread
+does not move the pool threads torch already created. So inside one process
+the budgets are admission limits only. configure_torch() sizes the shared pool
+once, to the largest threads_per_call, and nothing changes it per call.
+
+Real isolation needs one process per workload, which is what model_server.py
+does: each role calls isolate(name) at startup, before any torch work, to take
+that workload's full thread budget and, with CPU_PIN_CORES=1, its own cores.
+The ONNX embedding session has its own pool and uses threads_per_call directly.
+
+Environment variables (all optional):
+  CPU_BUDGET_VISION / CPU_BUDGET_LLM / CPU_BUDGET_EMBEDDINGS   threads per workload
+  CPU_CONCURRENCY_VISION / CPU_CONCURRENCY_LLM / CPU_CONCURRENCY_EMBEDDINGS
+  TORCH_INTEROP_THREADS     inter-op pool size (default 1)
+  CPU_PIN_CORES=1           pin each isolated workload process to its own cores (Linux only)
+  VISION_CHANNELS_LAST=0    disable channels-last execution for the classifiers
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+import torch
+
+WORKLOADS = ('vision', 'llm', 'embeddings')
+# Share of the available cores each workload gets when no budget is configured
+DEFAULT_SHARES = {'vision': 0.25, 'llm': 0.625, 'embeddings': 0.125}
+DEFAULT_CONCURRENCY = {'vision': 2, 'llm': 1, 'embeddings': 1}
+
+PIN_CORES = os.environ.get('CPU_PIN_CORES') == '1'
+VISION_CHANNELS_LAST = os.environ.get('VISION_CHANNELS_LAST', '1') == '1'
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class Workload:
+    def __init__(self, name, threads, concurrency, cores=None):
+        self.name = name
+        self.threads = max(threads, 1)
+        self.concurrency = max(min(concurrency, self.threads), 1)
+        self.threads_per_call = max(self.threads // self.concurrency, 1)
+        self.cores = cores
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+
+
+class CPUResourceManager:
+    def __init__(self):
+        cores = available_cores()
+        total = len(cores)
+        self.workloads = {}
+        offset = 0
+        for name in WORKLOADS:
+            budget = _env_int(f"CPU_BUDGET_{name.upper()}") or max(int(total * DEFAULT_SHARES[name]), 1)
+            concurrency = _env_int(f"CPU_CONCURRENCY_{name.upper()}") or DEFAULT_CONCURRENCY[name]
+            pinned = None
+            if PIN_CORES and hasattr(os, 'sched_setaffinity'):
+                # Disjoint slices while cores last, wrap around when budgets exceed the machine
+                pinned = {cores[(offset + i) % total] for i in range(min(budget, total))}
+                offset += budget
+            self.workloads[name] = Workload(name, budget, concurrency, pinned)
+        self.interop_threads = _env_int('TORCH_INTEROP_THREADS') or 1
+        self.intra_threads = torch.get_num_threads()
+        self.total_cores = total
+
+    def configure_torch(self):
+        # Must run before any parallel torch work, otherwise set_num_interop_threads raises
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set interop threads: {e}")
+        self.intra_threads = max(w.threads_per_call for w in self.workloads.values())
+        torch.set_num_threads(self.intra_threads)
+
+    def isolate(self, name):
+        """Dedicate this process to one workload; call before any torch work so new pool threads inherit it."""
+        w = self.workloads[name]
+        if w.cores:
+            os.sched_setaffinity(0, w.cores)
+        self.intra_threads = w.threads
+        torch.set_num_threads(w.threads)
+
+    @contextmanager
+    def workload(self, name):
+        w = self.workloads[name]
+        with w.slots:
+            yield w
+
+    @contextmanager
+    def background(self, threads):
+        """
+        Shrink the process-wide pool while a low-priority job runs. Only safe
+        for jobs that run while no interactive workload does and stop promptly
+        when one starts, so every interactive torch call in this process must
+        be wrapped in ReportScheduler.interactive() (see report_scheduler.py).
+        """
+        torch.set_num_threads(max(min(threads, self.intra_threads), 1))
+        try:
+            yield
+        finally:
+            torch.set_num_threads(self.intra_threads)
+
+    def report(self):
+        lines = [f"CPU resources: {self.total_cores} cores, interop threads {self.interop_threads}, "
+                 f"pinning {'on' if PIN_CORES else 'off'}, channels-last {'on' if VISION_CHANNELS_LAST else 'off'}"]
+        for w in self.workloads.values():
+            cores = ','.join(str(c) for c in sorted(w.cores)) if w.cores else 'any'
+            lines.append(f"  {w.name:<11} budget {w.threads:>3} threads, {w.concurrency} concurrent x "
+                         f"{w.threads_per_call} threads, cores {cores}")
+        return '\n'.join(lines)
+
+
+def prepare_classifier(classifier):
+    """Put a vision classifier in eval mode and channels-last layout."""
+    classifier.eval()
+    if VISION_CHANNELS_LAST:
+        classifier.to(memory_format=torch.channels_last)
+    return classifier
+
+
+def prepare_input(image):
+    if VISION_CHANNELS_LAST:
+        return image.contiguous(memory_format=torch.channels_last)
+    return image
+
+
+cpu_manager = CPUResourceManager()
+workload = cpu_manager.workload
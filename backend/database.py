@@ -0,0 +1,193 @@
+import os
+
+from sqlalchemy import (MetaData, Table, Column, Index, String, Text, Integer, Float, LargeBinary, ForeignKey,
+                        create_engine, event, inspect)
+from sqlalchemy.dialects import postgresql, sqlite
+
+# SQLite database file, overridable so load tests and local runs can use a scratch copy
+DB_PATH = os.environ.get('MATERNA_DB', 'hack.db')
+# Any SQLAlchemy URL, e.g. postgresql+psycopg2://materna:secret@db:5432/materna for multi-node deployments
+DATABASE_URL = os.environ.get('DATABASE_URL') or f"sqlite:///{DB_PATH}"
+
+# Connection pool per process (PostgreSQL); SQLite ignores these
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+
+metadata = MetaData()
+
+# Dates and timestamps are kept as the ISO strings the API has always written
+users = Table(
+    'users', metadata,
+    Column('user_id', String(50), primary_key=True),
+    Column('username', Text, unique=True, nullable=False),
+    Column('password', Text, nullable=False),
+    Column('patient_id', String(50), unique=True, nullable=False),
+)
+
+patients = Table(
+    'Patients', metadata,
+    Column('patient_id', String(50), primary_key=True),
+    Column('first_name', String(50)),
+    Column('last_name', String(50)),
+    Column('gender', String(10)),
+    Column('dob', String(10)),
+    Column('contact_number', String(20)),
+    Column('email', String(100)),
+    Column('address', Text),
+    Column('emergency_contact', String(50)),
+    Column('emergency_number', String(20)),
+    Column('height_cm', Integer),
+    Column('pre_pregnancy_weight', Float),
+    Column('current_weight', Float),
+    Column('lmp', String(10)),
+    Column('due_date', String(10)),
+    Column('gravida', Integer),
+    Column('para', Integer),
+    Column('blood_group', String(5)),
+    Column('healthcare_provider', String(100)),
+    Column('hospital', String(100)),
+    Column('registration_date', String(32)),
+    Column('last_updated', String(32)),
+)
+
+medical_reports = Table(
+    'MedicalReports', metadata,
+    Column('report_id', String(50), primary_key=True),
+    Column('patient_id', String(50), ForeignKey('Patients.patient_id'), nullable=False, index=True),
+    Column('type', Text, nullable=False),
+    Column('category', Text, nullable=False),
+    Column('date', Text, nullable=False),
+    Column('file_url', Text, nullable=False),
+    Column('notes', Text),
+    Column('analysis_results', Text),
+    Column('created_at', String(32)),
+)
+
+generated_reports = Table(
+    'GeneratedReports', metadata,
+    Column('report_id', Text, primary_key=True),
+    # No foreign key: /generate_report accepts patients that are only in the request body
+    Column('patient_id', String(50), nullable=False),
+    Column('report_content', Text),
+    Column('status', Text, nullable=False),
+    Column('created_at', String(32)),
+    Column('completed_at', String(32)),
+    # Registry version of the LLM that wrote the report (see model_registry.py)
+    Column('model_version', Text),
+    # Hash of the patient context it was generated from, for reuse (see report_scheduler.py)
+    Column('input_digest', String(64)),
+    Index('idx_generated_reports_patient_digest', 'patient_id', 'input_digest'),
+)
+
+# Materialized per-patient view used by report generation (see patient_summary.py)
+patient_summaries = Table(
+    'PatientSummaries', metadata,
+    Column('patient_id', String(50), ForeignKey('Patients.patient_id'), primary_key=True),
+    Column('personal_info', Text),
+    Column('questionnaire', Text),
+    Column('risk_factors', Text, nullable=False, server_default='[]'),
+    Column('test_results', Text, nullable=False, server_default='[]'),
+    Column('report_count', Integer, nullable=False, server_default='0'),
+    Column('latest_rag_report_id', String(80)),
+    Column('updated_at', String(32)),
+)
+
+# Compressed, content-addressed bodies of generated reports (see blob_store.py)
+report_blobs = Table(
+    'ReportBlobs', metadata,
+    Column('digest', String(64), primary_key=True),
+    Column('codec', String(8), nullable=False),
+    Column('size', Integer, nullable=False),
+    Column('data', LargeBinary, nullable=False),
+    Column('created_at', String(32)),
+)
+
+
+def sqlite_url(db_path):
+    return f"sqlite:///{db_path}"
+
+
+def create_db_engine(database_url=DATABASE_URL):
+    if database_url.startswith('sqlite'):
+        engine = create_engine(database_url)
+
+        @event.listens_for(engine, 'connect')
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            # Readers no longer block the writer, and commits skip the extra fsync
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+        return engine
+
+    return create_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        # Drop connections the server closed (failover, idle timeouts) instead of failing a request
+        pool_pre_ping=True,
+    )
+
+
+# Shared by every route in this process; create_engine does not connect until first use
+engine = create_db_engine()
+
+
+def upsert(conn, table, rows, key_columns, update_columns=None):
+    """
+    INSERT ... ON CONFLICT (key) DO UPDATE for SQLite and PostgreSQL. rows is a
+    dict or a list of dicts (executemany). update_columns defaults to every
+    non-key column present in the rows; pass [] to skip rows that already exist.
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows:
+        return
+    dialect_insert = postgresql.insert if conn.dialect.name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(table)
+    if update_columns is None:
+        update_columns = [name for name in rows[0] if name not in key_columns]
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: stmt.excluded[name] for name in update_columns},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=key_columns)
+    conn.execute(stmt, rows)
+
+
+# Database setup
+def init_db(bind=None):
+    """Create any missing tables. bind is an engine, or a SQLite path for scratch databases."""
+    if bind is None:
+        bind = engine
+    elif isinstance(bind, str):
+        bind = create_db_engine(sqlite_url(bind))
+    metadata.create_all(bind)
+    _upgrade_existing_tables(bind)
+
+
+def _upgrade_existing_tables(bind):
+    """
+    create_all never alters existing tables: add the nullable columns and the
+    indexes introduced after a table was created.
+    """
+    inspector = inspect(bind)
+    quote = bind.dialect.identifier_preparer.quote
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                                         f"{column.type.compile(dialect=bind.dialect)}")
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
@@ -0,0 +1,176 @@
+"""
+Train and evaluate the cascade student (see vision_cascade.py).
+
+The student is distilled from the two ResNet-34 classifiers: for every frame,
+both teachers' temperature-softened outputs are the targets for the matching
+student head (KL divergence scaled by T^2). No labels are needed, so any folder
+of ultrasound sweep frames can be added with --images.
+
+    python distill_student.py --epochs 20 --images /data/sweeps
+    python distill_student.py --evaluate
+
+Every fifth frame (by sorted path) is held out. --evaluate reports, on the
+held-out frames, the student's agreement with the teachers, the escalation rate
+and end-to-end agreement at several thresholds, and mean per-frame latency for
+the student, the full classifiers and the cascade.
+"""
+import glob
+import time
+import random
+import argparse
+
+import torch
+import torch.nn.functional as F
+from torchvision import transforms
+
+# The checkpoints were pickled from __main__, keep these names importable here
+from vision_models import (BasicBlock, ResNet, ImageClassifier, CascadeStudent, load_classifiers, load_student,
+                           preprocess_image, predict, predict_student, orientation_classes, plane_classes,
+                           student_model_path)
+
+SAMPLE_DIRS = ('Orientation_SampleDataset', 'Plane_SampleDataset')
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg')
+THRESHOLDS = (50, 70, 80, 90, 95, 99)
+
+
+def find_images(directories):
+    paths = set()
+    for directory in directories:
+        for pattern in IMAGE_PATTERNS:
+            paths.update(glob.glob(f"{directory}/**/{pattern}", recursive=True))
+    return sorted(paths)
+
+
+def split(paths):
+    holdout = paths[::5]
+    held = set(holdout)
+    return [p for p in paths if p not in held], holdout
+
+
+def load_frames(paths):
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames.append(preprocess_image(f.read()))
+    return frames
+
+
+augment = transforms.Compose([
+    transforms.RandomAffine(degrees=5, translate=(0.05, 0.05), scale=(0.95, 1.05)),
+    transforms.ColorJitter(brightness=0.2, contrast=0.2),
+])
+
+
+def distillation_loss(student_logits, teacher_logits, temperature):
+    return F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1),
+                    reduction='batchmean') * temperature ** 2
+
+
+def train(frames, orientation_classifier, plane_classifier, device, epochs, batch_size, lr, temperature):
+    student = CascadeStudent().to(device)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=max(epochs, 1))
+    orientation_classifier.eval()
+    plane_classifier.eval()
+
+    for epoch in range(epochs):
+        student.train()
+        random.shuffle(frames)
+        total = 0.0
+        for start in range(0, len(frames), batch_size):
+            batch = torch.cat([augment(frame) for frame in frames[start:start + batch_size]]).to(device)
+            with torch.no_grad():
+                orientation_targets = orientation_classifier(batch)
+                plane_targets = plane_classifier(batch)
+            orientation_logits, plane_logits = student(batch)
+            loss = (distillation_loss(orientation_logits, orientation_targets, temperature)
+                    + distillation_loss(plane_logits, plane_targets, temperature))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+        scheduler.step()
+        print(f"epoch {epoch + 1}/{epochs}  loss {total / len(frames):.4f}")
+
+    student.eval()
+    return student
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def evaluate(frames, student, orientation_classifier, plane_classifier, device):
+    rows = []
+    student_ms = full_ms = 0.0
+    for image in frames:
+        (orientation, plane), elapsed = _timed(lambda: predict_student(image, student, device))
+        student_ms += elapsed
+        (orientation_full, plane_full), elapsed = _timed(lambda: (
+            predict(image, orientation_classifier, device, orientation_classes),
+            predict(image, plane_classifier, device, plane_classes)))
+        full_ms += elapsed
+        rows.append({'orientation': (orientation, orientation_full), 'plane': (plane, plane_full)})
+
+    n = len(rows)
+    print(f"Held-out frames: {n}")
+    for task in ('orientation', 'plane'):
+        agreed = sum(row[task][0][0] == row[task][1][0] for row in rows)
+        print(f"  {task:<12} student/teacher agreement {agreed / n:.1%}")
+
+    mean_student, mean_full = student_ms / n, full_ms / n
+    print(f"\nMean latency per frame: student {mean_student:.1f} ms, full classifiers {mean_full:.1f} ms")
+    print("\nthreshold  escalated  orientation  plane  end-to-end agreement  est. cascade ms")
+    for threshold in THRESHOLDS:
+        escalated = agreed = 0
+        task_escalations = {'orientation': 0, 'plane': 0}
+        for row in rows:
+            frame_escalated = False
+            frame_agreed = True
+            for task, (student_answer, full_answer) in row.items():
+                if student_answer[1] < threshold:
+                    task_escalations[task] += 1
+                    frame_escalated = True
+                else:
+                    frame_agreed &= student_answer[0] == full_answer[0]
+            escalated += frame_escalated
+            agreed += frame_agreed
+        # Escalated tasks run one full classifier each, roughly half of the full-path cost
+        cascade_ms = mean_student + mean_full / 2 * sum(task_escalations.values()) / n
+        print(f"{threshold:>8}%  {escalated / n:>9.1%}  {task_escalations['orientation'] / n:>11.1%}"
+              f"  {task_escalations['plane'] / n:>5.1%}  {agreed / n:>20.1%}  {cascade_ms:>15.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill the cascade student from the ultrasound classifiers')
+    parser.add_argument('--images', nargs='*', default=[], help='extra directories of unlabeled frames')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--output', default=student_model_path)
+    parser.add_argument('--evaluate', action='store_true', help='evaluate the saved student instead of training')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    orientation_classifier, plane_classifier = load_classifiers(device)
+    train_paths, holdout_paths = split(find_images(list(SAMPLE_DIRS) + args.images))
+    print(f"{len(train_paths)} training frames, {len(holdout_paths)} held out")
+
+    if args.evaluate:
+        student = load_student(device, args.output)
+        if student is None:
+            return
+    else:
+        student = train(load_frames(train_paths), orientation_classifier, plane_classifier, device,
+                        args.epochs, args.batch_size, args.lr, args.temperature)
+        torch.save(student.state_dict(), args.output)
+        print(f"Saved student to {args.output}")
+    evaluate(load_frames(holdout_paths), student, orientation_classifier, plane_classifier, device)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Embedding engine for the guideline index: MiniLM on ONNX Runtime with dynamic batching.
+
+HuggingFaceEmbeddings runs the full transformers/torch stack, one call at a
+time, on whichever thread asks. OnnxEmbeddings exports all-MiniLM-L6-v2 once
+to ONNX (dynamically quantized to int8 by default), caches it under
+EMBEDDING_ONNX_DIR and runs it with full graph optimizations. All calls go
+through one batcher thread. It coalesces concurrent queries (report threads,
+multi-query retrieval) and ingestion chunks into batches of up to
+EMBEDDING_MAX_BATCH texts, waiting at most EMBEDDING_BATCH_WAIT_MS for
+stragglers. Texts are sorted by length before padding.
+
+The output matches sentence-transformers (mean pooling, L2-normalized), and the
+class implements LangChain's Embeddings interface (embed_documents,
+embed_query). FAISS.from_documents and MmapFAISSStore use it directly. int8
+vectors stay close to the fp32 ones; `python -m loadtest.embedding_bench`
+reports the agreement and the speed-up.
+
+Environment variables (all optional):
+  EMBEDDING_BACKEND         onnx (default), hf, or hashing (default under MATERNA_OFFLINE=1);
+                            onnx falls back to hf when onnxruntime is missing
+  EMBEDDING_ONNX_DIR        export cache (default embedding_onnx)
+  EMBEDDING_QUANTIZE=0      serve the fp32 graph instead of int8
+  EMBEDDING_MAX_BATCH       texts per forward (default 64)
+  EMBEDDING_BATCH_WAIT_MS   how long a batch waits to fill (default 5)
+"""
+import os
+import time
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from cpu_resources import cpu_manager, workload
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND',
+                                   'hashing' if os.environ.get('MATERNA_OFFLINE') == '1' else 'onnx')
+EMBEDDING_ONNX_DIR = os.environ.get('EMBEDDING_ONNX_DIR', 'embedding_onnx')
+EMBEDDING_QUANTIZE = os.environ.get('EMBEDDING_QUANTIZE', '1') == '1'
+EMBEDDING_MAX_BATCH = int(os.environ.get('EMBEDDING_MAX_BATCH', '64'))
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get('EMBEDDING_BATCH_WAIT_MS', '5'))
+# all-MiniLM-L6-v2 was trained with 256-token inputs
+EMBEDDING_MAX_LENGTH = 256
+FP32_FILE = 'model.onnx'
+INT8_FILE = 'model.int8.onnx'
+
+
+def export_dir(model_name, root=EMBEDDING_ONNX_DIR):
+    return os.path.join(root, model_name.replace('/', '__'))
+
+
+def export_onnx(model_name=EMBEDDING_MODEL, root=EMBEDDING_ONNX_DIR):
+    """Export the transformer (and its tokenizer) to ONNX plus a dynamically quantized int8 copy, once."""
+    target = export_dir(model_name, root)
+    if os.path.exists(os.path.join(target, INT8_FILE)):
+        return target
+
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    tmp_dir = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    print(f"Exporting {model_name} to ONNX in {target}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["export"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), os.path.join(tmp_dir, FP32_FILE),
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes={name: {0: 'batch', 1: 'sequence'}
+                                        for name in input_names + ['last_hidden_state']},
+                          opset_version=14)
+    quantize_dynamic(os.path.join(tmp_dir, FP32_FILE), os.path.join(tmp_dir, INT8_FILE),
+                     weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(tmp_dir)
+    try:
+        # Atomic, so concurrently starting workers never load a half-written export
+        os.replace(tmp_dir, target)
+    except OSError:
+        # Another worker finished first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return target
+
+
+class DynamicBatcher:
+    """Coalesces concurrent encode requests into batches on one worker thread."""
+
+    def __init__(self, encode, max_batch=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_BATCH_WAIT_MS):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _collect(self):
+        items = [self._queue.get()]
+        count = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            count += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in items:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self):
+        return {'batches': self.batches, 'texts': self.texts,
+                'mean_batch_size': self.texts / self.batches if self.batches else 0.0}
+
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_name=EMBEDDING_MODEL, quantize=EMBEDDING_QUANTIZE, max_batch=EMBEDDING_MAX_BATCH,
+                 max_wait_ms=EMBEDDING_BATCH_WAIT_MS):
+        from transformers import AutoTokenizer
+
+        model_dir = export_onnx(model_name)
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # The batcher is the only caller, give it the embeddings thread budget (see cpu_resources.py)
+        options.intra_op_num_threads = cpu_manager.workloads['embeddings'].threads_per_call
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, INT8_FILE if quantize else FP32_FILE),
+                                                    options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.batcher = DynamicBatcher(self._encode, max_batch, max_wait_ms)
+
+    def _encode(self, texts):
+        vectors = None
+        # Similar lengths per forward keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.max_batch):
+            index = order[start:start + self.max_batch]
+            encoded = self.tokenizer([texts[i] for i in index], padding=True, truncation=True,
+                                     max_length=EMBEDDING_MAX_LENGTH, return_tensors='np')
+            hidden = self.session.run(None, {name: encoded[name].astype(np.int64) for name in self.input_names})[0]
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            if vectors is None:
+                vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[index] = pooled
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        # Submit every slice up front so ingestion keeps the batcher busy back to back
+        futures = [self.batcher.submit(texts[start:start + self.max_batch])
+                   for start in range(0, len(texts), self.max_batch)]
+        return [vector.tolist() for future in futures for vector in future.result()]
+
+    def embed_query(self, text):
+        return self.batcher.submit([text]).result()[0].tolist()
+
+
+class BoundedHuggingFaceEmbeddings(Embeddings):
+    """HuggingFaceEmbeddings inside the embeddings CPU budget (torch runs on the calling thread)."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL):
+        from langchain_huggingface import HuggingFaceEmbeddings
+        self.model_name = model_name
+        self.inner = HuggingFaceEmbeddings(model_name=model_name)
+
+    def embed_documents(self, texts):
+        with workload('embeddings'):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with workload('embeddings'):
+            return self.inner.embed_query(text)
+
+
+def load_embeddings(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    if backend == 'hashing':
+        # Offline stand-in, same width as MiniLM (see loadtest/stubs.py)
+        from loadtest.stubs import HashingEmbeddings
+        return HashingEmbeddings()
+    if backend == 'onnx':
+        if onnxruntime is None:
+            print("onnxruntime is not installed, using HuggingFaceEmbeddings")
+        else:
+            try:
+                return OnnxEmbeddings(model_name)
+            except Exception as e:
+                print(f"ONNX embeddings unavailable ({e}), using HuggingFaceEmbeddings")
+    return BoundedHuggingFaceEmbeddings(model_name)
@@ -0,0 +1 @@
+"""Offline load-testing suite for the Materna backend (see loadtest/__main__.py)."""
@@ -0,0 +1,105 @@
+"""
+Reproducible load test for the backend.
+
+Run from backend/:
+    python -m loadtest --start-server --seed-patients 500 --users 200 --concurrency 16 \
+        --json loadtest_result.json --max-p99-ms 2000 --max-error-rate 0.01
+
+--start-server launches app.py against a scratch database with MATERNA_LLM_STUB=1,
+so generation uses the deterministic stub LLM and hashing embeddings and the
+whole run works offline. The exit code is non-zero when a gate is exceeded.
+"""
+import os
+import sys
+import argparse
+
+from loadtest.seed import seed_database
+from loadtest.runner import (run_load, print_summary, check_gates, start_server, scratch_db_path,
+                             wait_for_port, write_json)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materna backend load test')
+    parser.add_argument('--base-url', default=None, help='target an already running backend')
+    parser.add_argument('--start-server', action='store_true', help='launch app.py with stub models')
+    parser.add_argument('--no-stub', action='store_true', help='with --start-server, load the real LLM')
+    parser.add_argument('--offline', action='store_true',
+                        help='with --start-server, random classifiers and tiny LM, no checkpoints needed')
+    parser.add_argument('--port', type=int, default=6101)
+    parser.add_argument('--db', default=None,
+                        help='SQLite file to seed; with --start-server it must not exist yet (default: a temp file)')
+    parser.add_argument('--database-url', default=None,
+                        help='run against this SQLAlchemy URL (e.g. a scratch PostgreSQL) instead of --db')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--seed-patients', type=int, default=0, help='pre-populate the database')
+    parser.add_argument('--seed-reports', type=int, default=5, help='reports per seeded patient')
+    parser.add_argument('--returning-users', type=int, default=None,
+                        help='seeded patients that log in and read history (default: all seeded)')
+    parser.add_argument('--users', type=int, default=50, help='new patients walking the full flow')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--reports-per-user', type=int, default=3)
+    parser.add_argument('--predict-per-user', type=int, default=2)
+    parser.add_argument('--skip-predict', action='store_true')
+    parser.add_argument('--skip-generate', action='store_true')
+    parser.add_argument('--report-timeout', type=float, default=120.0)
+    parser.add_argument('--json', help='write the summary to this file')
+    parser.add_argument('--max-p99-ms', type=float, default=None)
+    parser.add_argument('--max-error-rate', type=float, default=None)
+    args = parser.parse_args()
+
+    if not args.start_server and not args.base_url:
+        parser.error('pass --base-url or --start-server')
+
+    db_path = args.db or 'loadtest.db'
+    if args.start_server and not args.database_url:
+        try:
+            db_path = scratch_db_path(args.db)
+        except ValueError as e:
+            parser.error(str(e))
+    returning = []
+    if args.seed_patients:
+        returning = seed_database(db_path, args.seed_patients, args.seed_reports, args.seed,
+                                  database_url=args.database_url)
+        if args.returning_users is not None:
+            returning = returning[:args.returning_users]
+
+    server = None
+    base_url = args.base_url
+    if args.start_server:
+        print(f"Starting backend on port {args.port} (stub models: {not args.no_stub})...")
+        server = start_server(os.path.abspath(db_path), args.port, stub=not args.no_stub,
+                              database_url=args.database_url, offline=args.offline)
+        base_url = f"http://127.0.0.1:{args.port}"
+    elif not wait_for_port(base_url):
+        print(f"Backend at {base_url} is not reachable")
+        return 2
+
+    try:
+        summary = run_load(
+            base_url,
+            concurrency=args.concurrency,
+            users=args.users,
+            seed=args.seed,
+            returning=returning,
+            reports_per_user=args.reports_per_user,
+            predict_per_user=0 if args.skip_predict else args.predict_per_user,
+            generate=not args.skip_generate,
+            report_timeout=args.report_timeout,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_summary(summary)
+    if args.json:
+        write_json(summary, args.json)
+
+    failures = check_gates(summary, args.max_p99_ms, args.max_error_rate)
+    for failure in failures:
+        print(f"GATE FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
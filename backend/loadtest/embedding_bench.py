@@ -0,0 +1,146 @@
+"""
+Embedding throughput benchmark: HuggingFaceEmbeddings vs the ONNX engine.
+
+For each backend (hf, onnx-fp32, onnx-int8) it measures:
+  * index build: embed_documents over the corpus, chunks per second
+  * single-query latency: sequential embed_query, p50/p95
+  * concurrent retrieval: N threads calling embed_query, queries per second
+    (the ONNX engine batches these dynamically)
+  * agreement with hf: mean cosine of the vectors and recall@10 of each query's
+    nearest chunks
+
+The corpus is the chunk table of the guideline index when it has been
+converted (see vector_index.py), otherwise the load-test guideline snippets.
+
+    python -m loadtest.embedding_bench --concurrency 1 8 32 --json embedding_bench.json
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+from embedding_engine import EMBEDDING_MODEL, OnnxEmbeddings, BoundedHuggingFaceEmbeddings
+from loadtest.runner import percentile, write_json
+from loadtest.stubs import GUIDELINES
+
+DEFAULT_DOCSTORE = os.path.join('maternal_care_faiss_index', 'docstore.sqlite')
+
+
+def load_corpus(docstore, size):
+    if os.path.exists(docstore):
+        conn = sqlite3.connect(f"file:{docstore}?mode=ro", uri=True)
+        texts = [row[0] for row in conn.execute("SELECT page_content FROM chunks ORDER BY position LIMIT ?", (size,))]
+        conn.close()
+        if texts:
+            return texts
+    # Offline fallback: vary the snippets so lengths and tokens differ
+    return [f"{GUIDELINES[i % len(GUIDELINES)]} (section {i // len(GUIDELINES) + 1})" for i in range(size)]
+
+
+def make_queries(corpus, count):
+    # Short retrieval-style queries: the opening words of chunks
+    return [' '.join(corpus[(i * 7) % len(corpus)].split()[:8]) for i in range(count)]
+
+
+def build_backend(name, model_name):
+    if name == 'hf':
+        return BoundedHuggingFaceEmbeddings(model_name)
+    return OnnxEmbeddings(model_name, quantize=name == 'onnx-int8')
+
+
+def bench_concurrent(embeddings, queries, concurrency):
+    per_thread = [queries[i::concurrency] for i in range(concurrency)]
+    threads = [threading.Thread(target=lambda batch: [embeddings.embed_query(q) for q in batch], args=(batch,))
+               for batch in per_thread]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(queries) / (time.perf_counter() - start)
+
+
+def recall_at_k(reference_docs, reference_queries, docs, queries, k=10):
+    expected = np.argsort(-reference_queries @ reference_docs.T, axis=1)[:, :k]
+    found = np.argsort(-queries @ docs.T, axis=1)[:, :k]
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+
+def bench_backend(name, model_name, corpus, queries, concurrency_options):
+    start = time.perf_counter()
+    embeddings = build_backend(name, model_name)
+    load_s = time.perf_counter() - start
+    embeddings.embed_documents(corpus[:8])  # warm-up
+
+    start = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(corpus), dtype=np.float32)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    result = {
+        'backend': name,
+        'load_s': round(load_s, 2),
+        'index_build_chunks_per_s': round(len(corpus) / build_s, 1),
+        'query_p50_ms': round(percentile(latencies, 50), 2),
+        'query_p95_ms': round(percentile(latencies, 95), 2),
+        'concurrent_queries_per_s': {c: round(bench_concurrent(embeddings, queries, c), 1)
+                                     for c in concurrency_options},
+    }
+    if hasattr(embeddings, 'batcher'):
+        result['batcher'] = embeddings.batcher.stats()
+    print(f"{name:<10} load {result['load_s']:>6}s  build {result['index_build_chunks_per_s']:>8} chunks/s  "
+          f"query p50 {result['query_p50_ms']:>7} ms  concurrent "
+          + '  '.join(f"{c}:{qps}/s" for c, qps in result['concurrent_queries_per_s'].items()))
+    return result, doc_vectors, np.asarray(query_vectors, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embedding throughput benchmark')
+    parser.add_argument('--backends', nargs='+', default=['hf', 'onnx-fp32', 'onnx-int8'],
+                        choices=['hf', 'onnx-fp32', 'onnx-int8'])
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    parser.add_argument('--docstore', default=DEFAULT_DOCSTORE)
+    parser.add_argument('--corpus-size', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.docstore, args.corpus_size)
+    queries = make_queries(corpus, args.queries)
+    print(f"{len(corpus)} chunks, {len(queries)} queries")
+
+    results = []
+    reference = None
+    for name in args.backends:
+        result, doc_vectors, query_vectors = bench_backend(name, args.model, corpus, queries, args.concurrency)
+        if reference is None:
+            reference = (name, doc_vectors, query_vectors)
+        else:
+            ref_name, ref_docs, ref_queries = reference
+            result['agreement'] = {
+                'reference': ref_name,
+                'mean_cosine': round(float(np.mean(np.sum(ref_docs * doc_vectors, axis=1))), 4),
+                'recall_at_10': round(recall_at_k(ref_docs, ref_queries, doc_vectors, query_vectors), 4),
+            }
+            print(f"{'':<10} vs {ref_name}: mean cosine {result['agreement']['mean_cosine']}, "
+                  f"recall@10 {result['agreement']['recall_at_10']}")
+        results.append(result)
+
+    if args.json:
+        write_json({'corpus': len(corpus), 'queries': len(queries), 'results': results}, args.json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
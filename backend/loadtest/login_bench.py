@@ -0,0 +1,123 @@
+"""
+Login throughput benchmark.
+
+Hash-only mode measures verifications per second for hash parameters and pool
+sizes, without a server:
+
+    python -m loadtest.login_bench --hash-only --methods scrypt:32768:8:1 pbkdf2:sha256:600000 --workers 1 2 4
+
+HTTP mode seeds users, starts the backend with stub models and hammers /login
+(a morning login spike). Seeding with an older --seed-hash-method also
+exercises rehash-on-login:
+
+    python -m loadtest.login_bench --start-server --seed-patients 200 --concurrency 32 --duration 30
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import PasswordHasher, PASSWORD_HASH_METHOD
+from loadtest.runner import Stats, Client, print_summary, start_server, scratch_db_path, wait_for_port, write_json
+from loadtest.seed import seed_database
+
+
+def bench_hashing(methods, workers_options, logins, concurrency):
+    results = []
+    for method in methods:
+        for workers in workers_options:
+            hasher = PasswordHasher(method=method, workers=workers, max_pending=max(logins, 1))
+            stored = hasher.hash('loadtest-password')
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                verified = list(pool.map(lambda _: hasher.verify(stored, 'loadtest-password'), range(logins)))
+            elapsed = time.perf_counter() - start
+            assert all(verified)
+            results.append({'method': method, 'workers': workers, 'logins': logins,
+                            'logins_per_second': logins / elapsed})
+            print(f"{method:<28}{workers:>4} workers {logins / elapsed:>9.1f} logins/s")
+    return results
+
+
+def bench_http(base_url, credentials, concurrency, duration, timeout):
+    stats = Stats()
+    deadline = time.time() + duration
+
+    def virtual_user(index):
+        rng = random.Random(index)
+        client = Client(base_url, stats, timeout)
+        while time.time() < deadline:
+            client.call('POST', '/login', json=rng.choice(credentials), expect=(200,))
+
+    threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.finished = time.perf_counter()
+    return stats.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput benchmark')
+    parser.add_argument('--hash-only', action='store_true', help='benchmark hashing in-process, no server')
+    parser.add_argument('--methods', nargs='+', default=[PASSWORD_HASH_METHOD])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--base-url', default=None)
+    parser.add_argument('--credentials', help='with --base-url, JSON from loadtest.seed --credentials-out')
+    parser.add_argument('--start-server', action='store_true')
+    parser.add_argument('--port', type=int, default=6102)
+    parser.add_argument('--db', default=None, help='SQLite file to seed, must not exist yet (default: a temp file)')
+    parser.add_argument('--seed-patients', type=int, default=100)
+    parser.add_argument('--seed-hash-method', default=PASSWORD_HASH_METHOD)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    if args.hash_only:
+        results = bench_hashing(args.methods, args.workers, args.logins, args.concurrency)
+        if args.json:
+            write_json({'hashing': results}, args.json)
+        return 0
+
+    if args.start_server:
+        try:
+            db_path = scratch_db_path(args.db)
+        except ValueError as e:
+            parser.error(str(e))
+        credentials = seed_database(db_path, args.seed_patients, 0, hash_method=args.seed_hash_method)
+    elif args.base_url and args.credentials:
+        with open(args.credentials) as f:
+            credentials = json.load(f)
+    else:
+        parser.error('pass --hash-only, --start-server, or --base-url with --credentials')
+
+    server = None
+    base_url = args.base_url
+    if args.start_server:
+        server = start_server(os.path.abspath(db_path), args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+    elif not wait_for_port(base_url):
+        print(f"Backend at {base_url} is not reachable")
+        return 2
+    try:
+        summary = bench_http(base_url, credentials, args.concurrency, args.duration, args.timeout)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_summary(summary)
+    if args.json:
+        write_json(summary, args.json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
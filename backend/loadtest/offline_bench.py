@@ -0,0 +1,193 @@
+"""
+Offline regression benchmark for the whole backend (MATERNA_OFFLINE=1, see loadtest/stubs.py).
+
+The app is imported in-process with random classifiers, the tiny LM, hashing
+embeddings, a fixture index and a scratch SQLite database, then driven through
+Flask's test client. No checkpoints, PDF, GPU or network are needed. It times:
+  * predict          POST /predict with a synthetic ultrasound-sized frame
+  * retrieve         hybrid retrieval of one query, and retrieve_many of a planned query set
+  * prompt           build_report_prompt for a patient with lab results
+  * DB routes        /register-patient, /store-report, /patient-data, /medical-reports
+  * generate         generate_maternal_report end to end (only with --generate)
+
+Each benchmark runs --warmup untimed calls, then --iterations timed ones, and
+reports p50/p95 and calls per second. With --baseline, any benchmark whose p50
+is more than --max-regression slower than in the baseline file fails the run
+(exit code 1), so it can gate CI:
+
+    python -m loadtest.offline_bench --json offline_baseline.json
+    python -m loadtest.offline_bench --baseline offline_baseline.json --max-regression 0.25
+
+Absolute numbers depend on the machine; compare against a baseline recorded on
+the same kind of box. The same paths are covered by the pytest-benchmark suite
+in tests/test_benchmarks.py; this script needs no test dependencies.
+"""
+import io
+import os
+import json
+import sys
+import time
+import argparse
+import tempfile
+
+from loadtest.runner import percentile, write_json
+from loadtest.synthetic import make_patient, make_report, rag_patient_data, new_rng
+
+FRAME_SIZE = 224
+
+
+def offline_environment(db_path, index_dir):
+    """Must run before app is imported: the profile is read at import time."""
+    os.environ['MATERNA_OFFLINE'] = '1'
+    os.environ['MATERNA_DB'] = db_path
+    os.environ['MATERNA_OFFLINE_INDEX'] = index_dir
+    os.environ['MODEL_REGISTRY_FILE'] = os.path.join(os.path.dirname(db_path), 'model_registry.json')
+    for name in ('DATABASE_URL', 'MODEL_SERVER_ADDRESS', 'RAG_API_URL', 'PREGEN_ENABLED'):
+        os.environ.pop(name, None)
+
+
+def synthetic_frame(seed=0):
+    """PNG bytes of a seeded noise frame, so /predict needs no sample dataset."""
+    import numpy as np
+    from PIL import Image
+    pixels = np.random.default_rng(seed).integers(0, 256, (FRAME_SIZE, FRAME_SIZE), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode='L').convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def timed(name, fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    result = {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'ops_per_s': round(iterations / (sum(latencies) / 1000), 1) if sum(latencies) else 0.0,
+    }
+    print(f"{name:<18}p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+          f"{result['ops_per_s']:>9.1f}/s")
+    return result
+
+
+def expect(response, *statuses):
+    if response.status_code not in statuses:
+        raise RuntimeError(f"{response.request.path}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def login(client, patient):
+    credentials = {'username': patient['username'], 'password': patient['password']}
+    expect(client.post('/signup', json=credentials), 201)
+    body = expect(client.post('/login', json=credentials), 200).get_json()
+    return {'Authorization': f"Bearer {body['access_token']}"}, body['patient_id']
+
+
+def run(args):
+    import app
+    from database import init_db
+    from retrieval import get_retriever
+    from report_generation import extract_patient_context, build_report_prompt, generate_maternal_report
+    from query_planner import plan_queries
+
+    init_db()
+    client = app.app.test_client()
+    rng = new_rng(args.seed)
+    patient = make_patient(rng, 0)
+    headers, patient_id = login(client, patient)
+    reports = [make_report(rng) for _ in range(3)]
+    for report in reports:
+        expect(client.post('/store-report', json=report, headers=headers), 201)
+    payload = rag_patient_data(patient_id, patient['profile'], reports)
+    patient_info = extract_patient_context(payload['patient_data'], patient_id)
+    queries = plan_queries(payload['patient_data'][patient_id])
+
+    llm = app.model_registry.current('llm')
+    tokenizer = llm['tokenizer']
+    retriever = get_retriever(app.vector_store)
+    medical_context = "\n".join(retriever.retrieve_many(queries, tokenizer=tokenizer))
+    frame = synthetic_frame(args.seed)
+
+    def predict():
+        expect(client.post('/predict', data={'image': (io.BytesIO(frame), 'frame.png', 'image/png')},
+                           content_type='multipart/form-data'), 200)
+
+    benchmarks = {
+        'predict': predict,
+        'retrieve': lambda: retriever.retrieve(patient_info, k=3, tokenizer=tokenizer),
+        'retrieve_many': lambda: retriever.retrieve_many(queries, tokenizer=tokenizer),
+        'prompt': lambda: build_report_prompt(patient_info, medical_context, tokenizer),
+        'register_patient': lambda: expect(client.post('/register-patient', json=patient['profile'],
+                                                       headers=headers), 201),
+        'store_report': lambda: expect(client.post('/store-report', json=make_report(rng), headers=headers), 201),
+        'patient_data': lambda: expect(client.get('/patient-data', headers=headers), 200),
+        'medical_reports': lambda: expect(client.get('/medical-reports', headers=headers), 200),
+    }
+    if args.generate:
+        benchmarks['generate'] = lambda: generate_maternal_report(patient_info, app.vector_store, llm['model'],
+                                                                  tokenizer, queries=queries)
+
+    results = {}
+    for name, fn in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        iterations = args.generate_iterations if name == 'generate' else args.iterations
+        results[name] = timed(name, fn, iterations, min(args.warmup, iterations))
+    return results
+
+
+def regressions(results, baseline, max_regression):
+    failed = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference or not reference.get('p50_ms'):
+            continue
+        ratio = result['p50_ms'] / reference['p50_ms']
+        if ratio > 1 + max_regression:
+            failed.append(name)
+            print(f"REGRESSION {name}: p50 {result['p50_ms']} ms vs {reference['p50_ms']} ms ({ratio - 1:+.0%})")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline backend regression benchmark')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--generate', action='store_true', help='also time end-to-end report generation')
+    parser.add_argument('--generate-iterations', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='scratch directory for the database and fixture index (default: temp)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results JSON from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed p50 slowdown against the baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='materna-offline-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'offline.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['MATERNA_OFFLINE_SEED'] = str(args.seed)
+    offline_environment(db_path, os.path.join(workdir, 'fixture_index'))
+
+    results = run(args)
+    if args.json:
+        write_json(results, args.json)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(results, json.load(f), args.max_regression)
+        if failed:
+            return 1
+        print(f"No benchmark regressed by more than {args.max_regression:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
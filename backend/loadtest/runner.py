@@ -0,0 +1,257 @@
+"""
+Concurrent end-to-end traffic driver and latency/throughput report.
+
+Each virtual user walks the patient flow:
+  /signup -> /login -> /register-patient -> /store-report (xN) -> /generate_report -> /check_report
+and optionally posts ultrasound frames to /predict. Returning users seeded by
+loadtest.seed log in and read their profile and report history.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from loadtest.synthetic import make_patient, make_report, rag_patient_data, new_rng
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FRAME_GLOBS = ['Orientation_SampleDataset/*/*.png', 'Plane_SampleDataset/*/*.png']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, endpoint, elapsed_ms, ok):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self):
+        wall = (self.finished or time.perf_counter()) - self.started
+        result = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            result[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'error_rate': self.errors[endpoint] / len(values) if values else 0.0,
+                'throughput_rps': len(values) / wall if wall else 0.0,
+                'p50_ms': percentile(values, 50),
+                'p95_ms': percentile(values, 95),
+                'p99_ms': percentile(values, 99),
+                'max_ms': max(values) if values else 0.0,
+            }
+        return {'wall_seconds': wall, 'endpoints': result}
+
+
+class Client:
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.token = None
+
+    def call(self, method, path, endpoint=None, expect=(200, 201), **kwargs):
+        headers = kwargs.pop('headers', {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, headers=headers,
+                                            timeout=self.timeout, **kwargs)
+            ok = response.status_code in expect
+        except requests.RequestException:
+            response = None
+            ok = False
+        self.stats.record(endpoint or path, (time.perf_counter() - start) * 1000, ok)
+        return response if ok else None
+
+
+def new_patient_flow(client, rng, index, options):
+    patient = make_patient(rng, index)
+    credentials = {'username': patient['username'], 'password': patient['password']}
+    if client.call('POST', '/signup', json=credentials) is None:
+        return
+    response = client.call('POST', '/login', json=credentials)
+    if response is None:
+        return
+    body = response.json()
+    client.token = body['access_token']
+    patient_id = body['patient_id']
+
+    if client.call('POST', '/register-patient', json=patient['profile']) is None:
+        return
+    reports = []
+    for _ in range(options['reports_per_user']):
+        report = make_report(rng)
+        if client.call('POST', '/store-report', json=report) is not None:
+            reports.append(report)
+
+    for _ in range(options['predict_per_user']):
+        predict_flow(client, rng, options)
+
+    if options['generate']:
+        payload = rag_patient_data(patient_id, patient['profile'], reports)
+        response = client.call('POST', '/generate_report', json=payload)
+        if response is None:
+            return
+        report_id = response.json()['report_id']
+        deadline = time.perf_counter() + options['report_timeout']
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            response = client.call('GET', f"/check_report/{report_id}", endpoint='/check_report')
+            if response is not None and response.json().get('status') == 'completed':
+                client.stats.record('report_completion', (time.perf_counter() - start) * 1000, True)
+                return
+            time.sleep(options['poll_interval'])
+        client.stats.record('report_completion', (time.perf_counter() - start) * 1000, False)
+
+
+def returning_patient_flow(client, credentials):
+    response = client.call('POST', '/login', json={'username': credentials['username'],
+                                                   'password': credentials['password']})
+    if response is None:
+        return
+    client.token = response.json()['access_token']
+    client.call('GET', '/patient-data')
+    client.call('GET', '/medical-reports')
+
+
+def predict_flow(client, rng, options):
+    frames = options['frames']
+    if not frames:
+        return
+    path = rng.choice(frames)
+    with open(path, 'rb') as f:
+        client.call('POST', '/predict', files={'image': (os.path.basename(path), f, 'image/png')})
+
+
+def run_load(base_url, concurrency=8, users=50, seed=42, returning=None, reports_per_user=3,
+             predict_per_user=2, generate=True, report_timeout=120.0, poll_interval=0.5, timeout=60.0):
+    frames = []
+    for pattern in SAMPLE_FRAME_GLOBS:
+        frames.extend(sorted(glob.glob(os.path.join(BACKEND_DIR, pattern))))
+    options = {
+        'reports_per_user': reports_per_user,
+        'predict_per_user': predict_per_user,
+        'generate': generate,
+        'report_timeout': report_timeout,
+        'poll_interval': poll_interval,
+        'frames': frames,
+    }
+    returning = returning or []
+    stats = Stats()
+
+    def virtual_user(index):
+        rng = new_rng(seed * 100003 + index)
+        client = Client(base_url, stats, timeout)
+        try:
+            if index < len(returning):
+                returning_patient_flow(client, returning[index])
+            else:
+                new_patient_flow(client, rng, index, options)
+        except Exception as e:
+            print(f"Virtual user {index} failed: {e}")
+            stats.record('scenario', 0.0, False)
+
+    total = users + len(returning)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(virtual_user, range(total)))
+    stats.finished = time.perf_counter()
+    return stats.summary()
+
+
+def print_summary(summary):
+    print(f"\nWall time: {summary['wall_seconds']:.1f}s")
+    header = f"{'endpoint':<22}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, s in summary['endpoints'].items():
+        print(f"{endpoint:<22}{s['requests']:>7}{s['error_rate'] * 100:>6.1f}%{s['throughput_rps']:>8.2f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+
+
+def check_gates(summary, max_p99_ms=None, max_error_rate=None):
+    failures = []
+    for endpoint, s in summary['endpoints'].items():
+        # Completion latency is generation time, not a request; reports that never complete still count as errors
+        if max_p99_ms is not None and endpoint != 'report_completion' and s['p99_ms'] > max_p99_ms:
+            failures.append(f"{endpoint}: p99 {s['p99_ms']:.1f}ms > {max_p99_ms}ms")
+        if max_error_rate is not None and s['error_rate'] > max_error_rate:
+            failures.append(f"{endpoint}: error rate {s['error_rate']:.3f} > {max_error_rate}")
+    return failures
+
+
+def scratch_db_path(path=None):
+    """A SQLite path the load test may seed: a fresh temp file, or a path that does not exist yet."""
+    if path is None:
+        return os.path.join(tempfile.mkdtemp(prefix='materna-loadtest-'), 'loadtest.db')
+    if os.path.exists(path):
+        # Never delete a database the tool did not create (e.g. --db hack.db)
+        raise ValueError(f"{path} already exists; pass a new path or omit --db for a temporary database")
+    return path
+
+
+def start_server(db_path, port, stub=True, startup_timeout=300, database_url=None, offline=False):
+    # Set DATABASE_URL explicitly so an inherited production URL is never load tested by accident
+    env = dict(os.environ, MATERNA_DB=db_path, PORT=str(port), DATABASE_URL=database_url or f"sqlite:///{db_path}")
+    if stub:
+        env['MATERNA_LLM_STUB'] = '1'
+    if offline:
+        env['MATERNA_OFFLINE'] = '1'
+    log = open(os.path.join(BACKEND_DIR, 'loadtest_server.log'), 'w')
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=BACKEND_DIR, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Backend exited during startup, see loadtest_server.log')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(1)
+    process.terminate()
+    raise RuntimeError(f"Backend did not start listening on port {port}")
+
+
+def wait_for_port(base_url, timeout=30):
+    parsed = urlparse(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def write_json(summary, path):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
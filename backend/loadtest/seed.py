@@ -0,0 +1,91 @@
+"""
+Seed a database with synthetic users, patients and medical report history.
+
+    python -m loadtest.seed --patients 1000 --reports-per-patient 20 --db loadtest.db
+    python -m loadtest.seed --database-url postgresql+psycopg2://materna@localhost/materna_loadtest
+"""
+import json
+import argparse
+import uuid
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import database
+from auth import PASSWORD_HASH_METHOD
+from database import DB_PATH, init_db, create_db_engine, sqlite_url, upsert
+from loadtest.synthetic import make_patient, make_report, new_rng
+
+
+def seed_database(db_path=DB_PATH, patients=100, reports_per_patient=5, seed=42, database_url=None,
+                  hash_method=PASSWORD_HASH_METHOD):
+    engine = create_db_engine(database_url or sqlite_url(db_path))
+    init_db(engine)
+    rng = new_rng(seed)
+    # Hash once: every synthetic user shares the same password
+    password_hash = generate_password_hash('loadtest-password', method=hash_method)
+    now = datetime.now().isoformat()
+
+    users_rows = []
+    patient_rows = []
+    report_rows = []
+    credentials = []
+    for index in range(patients):
+        patient = make_patient(rng, index)
+        profile = patient['profile']
+        patient_id = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+        user_id = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+        users_rows.append({'user_id': user_id, 'username': patient['username'], 'password': password_hash,
+                           'patient_id': patient_id})
+        credentials.append({'username': patient['username'], 'password': patient['password'],
+                            'patient_id': patient_id})
+        patient_rows.append({
+            'patient_id': patient_id, 'first_name': profile['firstName'], 'last_name': profile['lastName'],
+            'gender': profile['gender'], 'dob': profile['dob'], 'contact_number': profile['phoneNumber'],
+            'email': profile['email'], 'address': profile['address'],
+            'emergency_contact': profile['emergencyContact'], 'emergency_number': profile['emergencyPhone'],
+            'height_cm': profile['height'], 'pre_pregnancy_weight': profile['preWeight'],
+            'current_weight': profile['currentWeight'], 'lmp': profile['lmp'], 'due_date': profile['dueDate'],
+            'gravida': profile['gravida'], 'para': profile['para'], 'blood_group': profile['bloodGroup'],
+            'healthcare_provider': profile['primaryProvider'], 'hospital': profile['preferredHospital'],
+            'registration_date': now, 'last_updated': now,
+        })
+        for _ in range(reports_per_patient):
+            report = make_report(rng)
+            report_rows.append({
+                'report_id': uuid.UUID(int=rng.getrandbits(128)).hex[:8], 'patient_id': patient_id,
+                'type': report['type'], 'category': report['category'], 'date': report['date'],
+                'file_url': report['fileUrl'], 'notes': report['notes'],
+                'analysis_results': json.dumps(report['analysisResults']), 'created_at': now,
+            })
+
+    with engine.begin() as conn:
+        upsert(conn, database.users, users_rows, ['user_id'])
+        upsert(conn, database.patients, patient_rows, ['patient_id'])
+        upsert(conn, database.medical_reports, report_rows, ['report_id'])
+    engine.dispose()
+    print(f"Seeded {len(patient_rows)} patients and {len(report_rows)} reports into {engine.url.render_as_string(hide_password=True)}")
+    return credentials
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a database with synthetic patients and reports')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--database-url', help='seed this SQLAlchemy URL instead of the SQLite file at --db')
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--reports-per-patient', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--hash-method', default=PASSWORD_HASH_METHOD,
+                        help='password hash parameters, e.g. an older method to exercise rehash-on-login')
+    parser.add_argument('--credentials-out', help='write seeded usernames/passwords to this JSON file')
+    args = parser.parse_args()
+
+    credentials = seed_database(args.db, args.patients, args.reports_per_patient, args.seed,
+                                database_url=args.database_url, hash_method=args.hash_method)
+    if args.credentials_out:
+        with open(args.credentials_out, 'w') as f:
+            json.dump(credentials, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
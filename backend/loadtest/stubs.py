@@ -0,0 +1,220 @@
+"""
+Deterministic, dependency-light stand-ins for the LLM, tokenizer and embeddings.
+
+They expose just enough of the transformers / LangChain surface used by
+generate_maternal_report so the backend can run offline under load tests.
+
+MATERNA_LLM_STUB=1 swaps in the canned StubCausalLM only. MATERNA_OFFLINE=1
+is the whole-backend profile. It uses seeded random ResNet-34 classifiers
+(and cascade student) of the production shapes, a tiny randomly initialized
+GPT-2 running the real transformers generate(), hashing embeddings, and a
+small on-disk FAISS index in the production layout (memory-mapped index.faiss
++ docstore.sqlite + BM25). No checkpoints, PDF or downloads are needed, and
+every run is identical for a given seed.
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+
+import torch
+from transformers import BatchEncoding
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+# Simulated cost of one generated token, so load tests still exercise the background path
+STUB_TOKEN_MS = float(os.environ.get('LOADTEST_STUB_TOKEN_MS', '2'))
+EMBEDDING_DIM = 384  # same width as all-MiniLM-L6-v2
+
+REPORT_TEXT = """# Maternal Health Assessment
+
+## Patient Overview
+The patient is pregnant and attending routine prenatal care with the profile summarised above.
+
+## Health Status Analysis
+Vital measurements and weight gain are within the expected range for the current gestational week.
+
+## Potential Risk Indicators
+Review any abnormal laboratory values listed in the profile against the reference ranges.
+
+## Recommendations
+- Continue prenatal vitamins with folic acid and iron
+- Maintain regular antenatal checkups
+- Monitor blood pressure and glucose as advised
+
+## Next Steps
+Schedule the next prenatal appointment within 4 weeks.
+"""
+
+GUIDELINES = [
+    "Routine antenatal visits should occur every four weeks until 28 weeks of gestation, then every two weeks until 36 weeks and weekly thereafter.",
+    "Gestational diabetes screening with a 75 g oral glucose tolerance test is recommended between 24 and 28 weeks of gestation.",
+    "Haemoglobin below 11 g/dL in pregnancy indicates anaemia; oral iron supplementation and dietary counselling are first-line management.",
+    "Blood pressure of 140/90 mmHg or higher after 20 weeks warrants evaluation for gestational hypertension and pre-eclampsia.",
+    "Recommended total weight gain depends on pre-pregnancy BMI: 11.5 to 16 kg for normal BMI and 7 to 11.5 kg for overweight women.",
+    "Thyroid stimulating hormone above the trimester-specific reference range should be followed by free T4 measurement and treatment review.",
+    "Rh-negative mothers should receive anti-D prophylaxis at 28 weeks and after any sensitising event.",
+    "Folic acid 400 micrograms daily is advised before conception and throughout the first trimester to reduce neural tube defects.",
+    "Moderate exercise for 150 minutes per week is safe for most pregnancies without obstetric complications.",
+    "Screening for depression and anxiety should be offered at booking and in the postpartum period.",
+]
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashed bag-of-words embeddings, L2-normalised."""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in _WORD_RE.findall(text.lower()):
+            h = _stable_hash(token)
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class StubTokenizer:
+    """Word-level tokenizer: report words map to fixed ids, everything else is hashed."""
+
+    pad_token = '<pad>'
+    eos_token = '</s>'
+    pad_token_id = 0
+    eos_token_id = 1
+    hashed_vocab_size = 32000
+
+    def __init__(self):
+        words = _WORD_RE.findall(REPORT_TEXT) + ['\n']
+        self.vocab = ['<pad>', '</s>'] + sorted(set(words))
+        self.word_to_id = {word: idx for idx, word in enumerate(self.vocab)}
+        self.report_ids = [self.word_to_id[w] for w in self._split_keep_newlines(REPORT_TEXT)]
+
+    @staticmethod
+    def _split_keep_newlines(text):
+        tokens = []
+        for line in text.split('\n'):
+            tokens.extend(_WORD_RE.findall(line))
+            tokens.append('\n')
+        return tokens
+
+    def encode(self, text):
+        ids = []
+        for token in self._split_keep_newlines(text):
+            if token in self.word_to_id:
+                ids.append(self.word_to_id[token])
+            else:
+                ids.append(len(self.vocab) + _stable_hash(token) % self.hashed_vocab_size)
+        return ids
+
+    def __call__(self, text, return_tensors='pt', padding=False, truncation=False, max_length=None, **kwargs):
+        ids = self.encode(text)
+        if truncation and max_length:
+            ids = ids[:max_length]
+        input_ids = torch.tensor([ids], dtype=torch.long)
+        return BatchEncoding({'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)})
+
+    def decode(self, ids, skip_special_tokens=True):
+        words = []
+        for idx in (ids.tolist() if hasattr(ids, 'tolist') else ids):
+            if idx < len(self.vocab):
+                if skip_special_tokens and idx in (self.pad_token_id, self.eos_token_id):
+                    continue
+                words.append(self.vocab[idx])
+            else:
+                words.append('<unk>')
+        text = ' '.join(words)
+        text = re.sub(r' ?\n ?', '\n', text)
+        return re.sub(r' ([^\w\s#])', r'\1', text)
+
+
+class StubCausalLM:
+    """Emits the canned report token by token, sleeping STUB_TOKEN_MS per token."""
+
+    device = torch.device('cpu')
+
+    def __init__(self, tokenizer, token_ms=STUB_TOKEN_MS):
+        self.tokenizer = tokenizer
+        self.token_ms = token_ms
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=800, eos_token_id=None, **kwargs):
+        new_ids = self.tokenizer.report_ids[:max_new_tokens]
+        if len(new_ids) < max_new_tokens:
+            new_ids = new_ids + [self.tokenizer.eos_token_id]
+        if self.token_ms:
+            time.sleep(len(new_ids) * self.token_ms / 1000.0)
+        generated = torch.tensor([new_ids], dtype=torch.long)
+        return torch.cat([input_ids.cpu(), generated], dim=1)
+
+
+def build_stub_vector_store(embeddings=None):
+    embeddings = embeddings or HashingEmbeddings()
+    documents = [Document(page_content=text, metadata={'source': 'stub', 'chunk': idx})
+                 for idx, text in enumerate(GUIDELINES)]
+    return FAISS.from_documents(documents, embeddings)
+
+
+def build_stub_system():
+    tokenizer = StubTokenizer()
+    model = StubCausalLM(tokenizer)
+    vector_store = build_stub_vector_store()
+    return tokenizer, model, vector_store
+
+
+OFFLINE_SEED = int(os.environ.get('MATERNA_OFFLINE_SEED', '0'))
+FIXTURE_CHUNKS = 200
+
+
+def build_random_classifiers(device, seed=OFFLINE_SEED, student=False):
+    """(orientation, plane, student or None) with the production architectures and random weights."""
+    from vision_models import ImageClassifier, CascadeStudent, get_model
+    from cpu_resources import prepare_classifier
+    torch.manual_seed(seed)
+    orientation = prepare_classifier(ImageClassifier(get_model()).to(device))
+    plane = prepare_classifier(ImageClassifier(get_model()).to(device))
+    cascade_student = prepare_classifier(CascadeStudent().to(device)) if student else None
+    return orientation, plane, cascade_student
+
+
+def build_tiny_causal_lm(tokenizer, seed=OFFLINE_SEED):
+    """2-layer GPT-2 over the stub vocabulary: the real generate() loop at a tiny cost per token."""
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(tokenizer.vocab) + tokenizer.hashed_vocab_size, n_positions=4096,
+                        n_embd=64, n_layer=2, n_head=2, bos_token_id=tokenizer.eos_token_id,
+                        eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id)
+    return GPT2LMHeadModel(config).eval()
+
+
+def build_fixture_index(index_dir=None, chunks=FIXTURE_CHUNKS, embeddings=None):
+    """FAISS fixture written like the production index and opened through MmapFAISSStore (reused if present)."""
+    from vector_index import has_compact_store, export_docstore, MmapFAISSStore
+    embeddings = embeddings or HashingEmbeddings()
+    index_dir = index_dir or tempfile.mkdtemp(prefix='materna-fixture-')
+    if not has_compact_store(index_dir):
+        documents = [Document(page_content=f"{GUIDELINES[i % len(GUIDELINES)]} (section {i // len(GUIDELINES) + 1})",
+                              metadata={'source': 'fixture', 'chunk': i})
+                     for i in range(chunks)]
+        vector_store = FAISS.from_documents(documents, embeddings)
+        vector_store.save_local(index_dir)
+        export_docstore(vector_store, index_dir)
+    return MmapFAISSStore(index_dir, embeddings)
+
+
+def build_offline_system(index_dir=None):
+    tokenizer = StubTokenizer()
+    return tokenizer, build_tiny_causal_lm(tokenizer), build_fixture_index(index_dir)
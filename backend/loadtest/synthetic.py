@@ -0,0 +1,134 @@
+"""
+Synthetic patients and medical reports with realistic value distributions.
+
+Everything is driven by a seeded random.Random so runs are reproducible.
+"""
+import random
+from datetime import datetime, timedelta
+
+FIRST_NAMES = ['Aanya', 'Priya', 'Meera', 'Sara', 'Lena', 'Maria', 'Fatima', 'Chloe', 'Ishita', 'Nora']
+LAST_NAMES = ['Sharma', 'Das', 'Khan', 'Roy', 'Patel', 'Garcia', 'Smith', 'Sen', 'Iyer', 'Bose']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-']
+HOSPITALS = ['City Maternity Hospital', 'General Hospital', 'St. Mary Clinic']
+
+# (test_name, unit, ref_low, ref_high, mean, spread)
+LAB_TESTS = [
+    ('Hemoglobin', 'g/dL', 11.0, 14.0, 11.8, 1.4),
+    ('Fasting Plasma Glucose', 'mg/dL', 70, 95, 88, 14),
+    ('TSH', 'mIU/L', 0.1, 2.5, 1.9, 1.1),
+    ('Platelet Count', 'x10^3/uL', 150, 400, 240, 60),
+    ('Systolic Blood Pressure', 'mmHg', 90, 130, 118, 14),
+]
+
+
+def _risk_level(value, low, high):
+    span = high - low
+    if low <= value <= high:
+        return 'normal'
+    if low - 0.1 * span <= value <= high + 0.1 * span:
+        return 'borderline'
+    return 'high_risk'
+
+
+def make_patient(rng, index):
+    now = datetime.now()
+    lmp = now - timedelta(days=rng.randint(28, 280))
+    dob = now - timedelta(days=365 * rng.randint(19, 42) + rng.randint(0, 364))
+    pre_weight = round(rng.uniform(45, 90), 1)
+    gravida = rng.randint(1, 4)
+    return {
+        'username': f"loadtest_user_{index}_{rng.randint(0, 10**9)}",
+        'password': 'loadtest-password',
+        'profile': {
+            'firstName': rng.choice(FIRST_NAMES),
+            'lastName': rng.choice(LAST_NAMES),
+            'email': f"patient{index}@example.com",
+            'phoneNumber': str(rng.randint(7000000000, 9999999999)),
+            'dob': dob.strftime('%Y-%m-%d'),
+            'gender': 'Female',
+            'address': f"{rng.randint(1, 999)} Test Street",
+            'emergencyContact': rng.choice(FIRST_NAMES),
+            'emergencyPhone': str(rng.randint(7000000000, 9999999999)),
+            'height': rng.randint(148, 180),
+            'preWeight': pre_weight,
+            'currentWeight': round(pre_weight + rng.uniform(0, 14), 1),
+            'bloodGroup': rng.choice(BLOOD_GROUPS),
+            'lmp': lmp.strftime('%Y-%m-%d'),
+            'dueDate': (lmp + timedelta(days=280)).strftime('%Y-%m-%d'),
+            'primaryProvider': 'Dr. Load Test',
+            'preferredHospital': rng.choice(HOSPITALS),
+            'gravida': gravida,
+            'para': rng.randint(0, gravida - 1),
+        },
+    }
+
+
+def make_report(rng):
+    test_results = []
+    risk_factors = []
+    for name, unit, low, high, mean, spread in LAB_TESTS:
+        value = round(rng.gauss(mean, spread), 1)
+        level = _risk_level(value, low, high)
+        test_results.append({
+            'test_name': name,
+            'result_value': value,
+            'result_unit': unit,
+            'ref_range_low': low,
+            'ref_range_high': high,
+            'risk_level': level,
+        })
+        if level == 'high_risk':
+            risk_factors.append({
+                'test_name': name,
+                'result_value': value,
+                'result_unit': unit,
+                'reference_range': f"{low} - {high}",
+                'risk_level': level,
+            })
+    return {
+        'type': 'Blood Test',
+        'category': 'Laboratory',
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'fileUrl': f"https://example.com/reports/{rng.randint(0, 10**9)}.pdf",
+        'notes': 'Synthetic load-test report',
+        'analysisResults': {'risk_factors': risk_factors, 'test_results': test_results},
+    }
+
+
+def rag_patient_data(patient_id, profile, reports):
+    """Build the /generate_report payload the same way rag_api.py does."""
+    risk_factors = []
+    test_results = []
+    for report in reports:
+        risk_factors.extend(report['analysisResults']['risk_factors'])
+        test_results.extend(report['analysisResults']['test_results'])
+    patient = {
+        'personal_info': {
+            'first_name': profile['firstName'],
+            'last_name': profile['lastName'],
+            'gender': profile['gender'],
+            'dob': profile['dob'],
+            'blood_group': profile['bloodGroup'],
+            'height_cm': profile['height'],
+            'current_weight': profile['currentWeight'],
+            'pre_pregnancy_weight': profile['preWeight'],
+            'lmp': profile['lmp'],
+            'due_date': profile['dueDate'],
+            'preexisting_conditions': '',
+        },
+        'questionnaire': {
+            'is_first_pregnancy': 'Yes' if profile['gravida'] == 1 else 'No',
+            'exercise_frequency': 'Unknown',
+            'emotional_wellbeing': 'Unknown',
+            'prenatal_vitamins': 'Unknown',
+        },
+    }
+    if risk_factors:
+        patient['risk_factors'] = risk_factors
+    if test_results:
+        patient['test_results'] = test_results
+    return {'patient_id': patient_id, 'patient_data': {patient_id: patient}}
+
+
+def new_rng(seed):
+    return random.Random(seed)
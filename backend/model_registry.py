@@ -0,0 +1,308 @@
+"""
+Versioned models with zero-downtime hot-swap.
+
+Each slot ('vision': the classifiers plus the optional cascade student, 'llm':
+tokenizer and model) serves one loaded ModelVersion at a time. A swap loads
+the new version on a background thread, warms it (a few sample frames, a
+one-token generation), then replaces the slot's reference under a lock.
+Requests take registry.current(slot) once and use that object to the end, so
+in-flight requests finish on the old weights while new ones get the new
+version. The replaced version stays loaded for instant rollback
+(MODEL_REGISTRY_KEEP versions per slot). While a swap runs, both versions are
+in memory, which for the LLM means two copies of the weights.
+
+Versions are recorded in MODEL_REGISTRY_FILE:
+
+    {"vision": {"active": "2025-03", "versions": {"2025-03": {"orientation": "ckpt/orient_2025-03.pth",
+                                                               "plane": "ckpt/plane_2025-03.pth",
+                                                               "student": "ckpt/student_2025-03.pth"}}},
+     "llm": {"active": "builtin", "versions": {}}}
+
+A registered version is immutable. Swapping records the new active version, so
+a restart comes back on it. 'builtin' is the original Orientation_RES34.pth /
+PLANE_34.pth / LLM_MODEL_NAME setup.
+
+Admin-only (X-Admin-Token):
+    GET  /admin/models                   active, previous and registered versions, last load
+    POST /admin/models/<slot>/load       {"version": "...", ...paths or model_name}, 202
+    POST /admin/models/<slot>/rollback   back to the previously active version
+
+Only in-process models are swapped. Behind model_server.py, change the active
+version in the manifest and restart the model server instead (ModelClient
+reconnects).
+"""
+import os
+import json
+import glob
+import threading
+from collections import deque
+from datetime import datetime
+
+import torch
+from flask import request, jsonify
+
+from admin_auth import admin_required
+from cpu_resources import workload
+from vision_models import (load_classifiers, load_student, classify_image, preprocess_image, predict,
+                           predict_student, orientation_classes, plane_classes, orientation_model_path,
+                           plane_model_path, student_model_path)
+from vision_cascade import CASCADE_MODE, classify_image_cascade
+from report_generation import LLM_MODEL_NAME, initialize_model_and_tokenizer
+
+MODEL_REGISTRY_FILE = os.environ.get('MODEL_REGISTRY_FILE', 'model_registry.json')
+MODEL_REGISTRY_KEEP = int(os.environ.get('MODEL_REGISTRY_KEEP', '1'))
+MODEL_WARMUP_FRAMES = int(os.environ.get('MODEL_WARMUP_FRAMES', '4'))
+WARMUP_DIRS = ('Orientation_SampleDataset', 'Plane_SampleDataset')
+BUILTIN_VERSION = 'builtin'
+SLOTS = ('vision', 'llm')
+REQUIRED_KEYS = {'vision': ('orientation', 'plane'), 'llm': ('model_name',)}
+# Random/tiny stand-ins instead of checkpoints and downloads (see loadtest/stubs.py)
+OFFLINE = os.environ.get('MATERNA_OFFLINE') == '1'
+
+
+class RegistryError(Exception):
+    """The registry cannot do this right now (a load is running, nothing to roll back to)."""
+
+
+def builtin_spec(slot):
+    if slot == 'vision':
+        return {'orientation': orientation_model_path, 'plane': plane_model_path, 'student': student_model_path}
+    return {'model_name': LLM_MODEL_NAME}
+
+
+def load_vision(spec, device):
+    if OFFLINE:
+        from loadtest.stubs import build_random_classifiers
+        orientation, plane, student = build_random_classifiers(device, student=CASCADE_MODE != 'off')
+        return {'orientation': orientation, 'plane': plane, 'student': student}
+    orientation, plane = load_classifiers(device, spec['orientation'], spec['plane'])
+    student = None
+    if CASCADE_MODE != 'off' and spec.get('student'):
+        student = load_student(device, spec['student'])
+    return {'orientation': orientation, 'plane': plane, 'student': student}
+
+
+def warm_vision(models, device):
+    paths = sorted(glob.glob(f"{WARMUP_DIRS[0]}/*/*.png") + glob.glob(f"{WARMUP_DIRS[1]}/*/*.png"))
+    images = []
+    for path in paths[:MODEL_WARMUP_FRAMES]:
+        with open(path, 'rb') as f:
+            images.append(preprocess_image(f.read()))
+    with workload('vision'):
+        for image in images or [torch.zeros(1, 3, 224, 224)]:
+            predict(image, models['orientation'], device, orientation_classes)
+            predict(image, models['plane'], device, plane_classes)
+            if models['student'] is not None:
+                predict_student(image, models['student'], device)
+
+
+def load_llm(spec, device):
+    if OFFLINE:
+        from loadtest.stubs import StubTokenizer, build_tiny_causal_lm
+        tokenizer = StubTokenizer()
+        return {'tokenizer': tokenizer, 'model': build_tiny_causal_lm(tokenizer)}
+    if os.environ.get('MATERNA_LLM_STUB') == '1':
+        from loadtest.stubs import StubTokenizer, StubCausalLM
+        tokenizer = StubTokenizer()
+        return {'tokenizer': tokenizer, 'model': StubCausalLM(tokenizer)}
+    tokenizer, model = initialize_model_and_tokenizer(spec['model_name'])
+    return {'tokenizer': tokenizer, 'model': model}
+
+
+def warm_llm(models, device):
+    inputs = models['tokenizer']("Patient Profile:", return_tensors='pt').to(models['model'].device)
+    with workload('llm'), torch.inference_mode():
+        models['model'].generate(**inputs, max_new_tokens=1)
+
+
+LOADERS = {'vision': (load_vision, warm_vision), 'llm': (load_llm, warm_llm)}
+
+
+class ModelVersion:
+    """One loaded version of a slot. Never mutated, so holding a reference pins the weights."""
+
+    def __init__(self, slot, version, spec, models):
+        self.slot = slot
+        self.version = version
+        self.spec = spec
+        self.models = models
+        self.loaded_at = datetime.now().isoformat()
+
+    def __getitem__(self, name):
+        return self.models[name]
+
+    def describe(self):
+        return {'version': self.version, 'spec': self.spec, 'loaded_at': self.loaded_at}
+
+
+class ModelRegistry:
+    def __init__(self, device=None, path=MODEL_REGISTRY_FILE, keep=MODEL_REGISTRY_KEEP):
+        self.device = device or torch.device('cpu')
+        self.path = path
+        self.manifest = self._read_manifest()
+        self._active = {}
+        self._previous = {slot: deque(maxlen=keep) for slot in SLOTS}
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def _read_manifest(self):
+        manifest = {slot: {'active': BUILTIN_VERSION, 'versions': {}} for slot in SLOTS}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for slot, entry in json.load(f).items():
+                    if slot in manifest:
+                        manifest[slot] = {'active': entry.get('active', BUILTIN_VERSION),
+                                          'versions': entry.get('versions', {})}
+        return manifest
+
+    def _record_active(self, slot, version, spec):
+        entry = self.manifest[slot]
+        if entry['active'] == version and (version == BUILTIN_VERSION or version in entry['versions']):
+            return
+        if version != BUILTIN_VERSION:
+            entry['versions'][version] = spec
+        entry['active'] = version
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def resolve(self, slot, version=None, spec=None):
+        """(version, spec) to load; raises ValueError for unknown slots/versions or a conflicting spec."""
+        if slot not in SLOTS:
+            raise ValueError(f"Unknown model slot {slot}, expected one of {', '.join(SLOTS)}")
+        version = version or self.manifest[slot]['active']
+        registered = builtin_spec(slot) if version == BUILTIN_VERSION else self.manifest[slot]['versions'].get(version)
+        if spec and registered and spec != registered:
+            raise ValueError(f"{slot} version {version} is already registered with a different spec, "
+                             f"register it under a new version name")
+        spec = registered or spec
+        if not spec:
+            raise ValueError(f"Unknown {slot} version {version}")
+        missing = [key for key in REQUIRED_KEYS[slot] if not spec.get(key)]
+        if missing:
+            raise ValueError(f"{slot} version {version} needs {', '.join(missing)}")
+        if slot == 'vision' and not OFFLINE:
+            absent = [spec[key] for key in ('orientation', 'plane') if not os.path.exists(spec[key])]
+            if absent:
+                raise ValueError(f"Checkpoint not found: {', '.join(absent)}")
+        return version, spec
+
+    def current(self, slot):
+        return self._active.get(slot)
+
+    def install(self, slot, models, version=None, spec=None):
+        """Make already loaded models the active version; the replaced one is kept for rollback."""
+        version, spec = self.resolve(slot, version, spec) if spec is None else (version, spec)
+        new = ModelVersion(slot, version, spec, models)
+        with self._lock:
+            old = self._active.get(slot)
+            self._active[slot] = new
+            if old is not None:
+                self._previous[slot].append(old)
+            self._record_active(slot, version, spec)
+        print(f"Model {slot} version {version} is active" + (f" (was {old.version})" if old else ""))
+        return new
+
+    def load(self, slot, version=None, spec=None, warm=True):
+        """Load, warm and activate synchronously (startup)."""
+        version, spec = self.resolve(slot, version, spec)
+        load, warmup = LOADERS[slot]
+        models = load(spec, self.device)
+        if warm:
+            warmup(models, self.device)
+        return self.install(slot, models, version, spec)
+
+    def load_async(self, slot, version, spec=None):
+        """Start a background load + warm-up + swap; returns its status dict."""
+        version, spec = self.resolve(slot, version, spec)
+        with self._lock:
+            running = self._loads.get(slot)
+            if running and running['state'] in ('loading', 'warming'):
+                raise RegistryError(f"{slot} version {running['version']} is still loading")
+            status = {'slot': slot, 'version': version, 'state': 'loading',
+                      'started_at': datetime.now().isoformat(), 'finished_at': None, 'error': None}
+            self._loads[slot] = status
+        threading.Thread(target=self._swap, args=(slot, version, spec, status),
+                         name=f'model-swap-{slot}', daemon=True).start()
+        return dict(status)
+
+    def _swap(self, slot, version, spec, status):
+        load, warmup = LOADERS[slot]
+        try:
+            models = load(spec, self.device)
+            status['state'] = 'warming'
+            warmup(models, self.device)
+            self.install(slot, models, version, spec)
+            status['state'] = 'active'
+        except Exception as e:
+            # The old version keeps serving
+            status.update(state='failed', error=f"{type(e).__name__}: {e}")
+            print(f"Loading {slot} version {version} failed: {e}")
+        status['finished_at'] = datetime.now().isoformat()
+
+    def rollback(self, slot):
+        if slot not in SLOTS:
+            raise ValueError(f"Unknown model slot {slot}, expected one of {', '.join(SLOTS)}")
+        with self._lock:
+            if not self._previous[slot]:
+                raise RegistryError(f"No previous {slot} version is loaded")
+            previous = self._previous[slot].pop()
+            replaced = self._active[slot]
+            self._active[slot] = previous
+            self._record_active(slot, previous.version, previous.spec)
+        print(f"Model {slot} rolled back from {replaced.version} to {previous.version}")
+        return previous
+
+    def describe(self):
+        with self._lock:
+            return {slot: {
+                'active': self._active[slot].describe() if slot in self._active else None,
+                'previous': [v.describe() for v in reversed(self._previous[slot])],
+                'registered': [BUILTIN_VERSION] + sorted(self.manifest[slot]['versions']),
+                'last_load': dict(self._loads[slot]) if slot in self._loads else None,
+            } for slot in SLOTS}
+
+
+def classify(vision, image_data, device):
+    """/predict on one pinned vision version, tagged with that version."""
+    if vision['student'] is not None:
+        result = classify_image_cascade(image_data, vision['student'], vision['orientation'], vision['plane'],
+                                        device)
+    else:
+        result = classify_image(image_data, vision['orientation'], vision['plane'], device)
+    result['model_version'] = vision.version
+    return result
+
+
+def init_model_registry_api(app, registry):
+    @app.route('/admin/models', methods=['GET'])
+    @admin_required
+    def list_models():
+        return jsonify(registry.describe()), 200
+
+    @app.route('/admin/models/<slot>/load', methods=['POST'])
+    @admin_required
+    def load_model(slot):
+        body = request.get_json(silent=True) or {}
+        version = body.pop('version', None)
+        if not version:
+            return jsonify({'message': 'version is required'}), 400
+        try:
+            status = registry.load_async(slot, version, body or None)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        except RegistryError as e:
+            return jsonify({'message': str(e)}), 409
+        return jsonify(status), 202
+
+    @app.route('/admin/models/<slot>/rollback', methods=['POST'])
+    @admin_required
+    def rollback_model(slot):
+        try:
+            version = registry.rollback(slot)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        except RegistryError as e:
+            return jsonify({'message': str(e)}), 409
+        return jsonify({'slot': slot, 'active': version.describe()}), 200
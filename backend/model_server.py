@@ -0,0 +1,276 @@
+"""
+Standalone model server. Loads the ultrasound classifiers, the LLM and the FAISS
+index once and serves them to any number of lightweight API workers over local
+Unix sockets, so each app.py process no longer carries its own copy of the weights.
+
+    python model_server.py --vision-workers 4 --address /run/materna/models
+    MODEL_SERVER_ADDRESS=/run/materna/models python app.py   # as many API workers as needed
+
+Layout:
+  * one LLM process (fresh interpreter) holding the tokenizer, LLM and vector store,
+    listening on <address>.llm.sock
+  * a pool of vision processes forked after the classifiers are loaded; on CPU the
+    weights are mmap-loaded and moved to shared memory, so every worker maps the same
+    pages. They all accept on <address>.vision.sock.
+Each role is a separate process with its own torch thread pool (cpu_manager.isolate):
+the LLM process takes CPU_BUDGET_LLM, every vision worker CPU_BUDGET_VISION, so size
+the latter as cores / vision workers. With CPU_PIN_CORES=1 the vision workers share
+the vision cores and the LLM process gets its own.
+Both roles load the active versions from MODEL_REGISTRY_FILE (see model_registry.py).
+
+Requests are pickled, so only processes holding the auth key may connect. The
+sockets live in a directory only the server's user can enter (created 0700;
+an existing one must already be private). The key is MODEL_SERVER_AUTHKEY,
+or else a random one the server writes to <address>.key (0600) on first start
+and reuses afterwards; ModelClient reads the same file.
+"""
+import os
+import sys
+import time
+import signal
+import secrets
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+import torch
+
+# The checkpoints were pickled from __main__, keep these names importable here
+from vision_models import BasicBlock, ResNet, ImageClassifier
+from vision_cascade import cascade_stats
+from model_registry import ModelRegistry, classify
+from cpu_resources import cpu_manager
+from report_generation import load_report_system, generate_maternal_report
+
+MODEL_SERVER_ADDRESS = os.environ.get('MODEL_SERVER_ADDRESS')
+MODEL_SERVER_AUTHKEY = os.environ.get('MODEL_SERVER_AUTHKEY')
+MODEL_SERVER_TIMEOUT = float(os.environ.get('MODEL_SERVER_TIMEOUT', '600'))
+DEFAULT_ADDRESS = f"/tmp/materna-{os.getuid()}/models"
+
+
+def socket_path(address, role):
+    return f"{address}.{role}.sock"
+
+
+def key_path(address):
+    return f"{address}.key"
+
+
+def ensure_private_dir(address):
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"Model server directory {directory} must belong to this user with mode 0700")
+
+
+def read_authkey(address):
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode()
+    try:
+        with open(key_path(address), 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(f"No MODEL_SERVER_AUTHKEY and no key file at {key_path(address)}; "
+                           f"is the model server running?") from None
+
+
+def server_authkey(address):
+    """MODEL_SERVER_AUTHKEY, or the key file, created with a random key on first start."""
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode()
+    path = key_path(address)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Reused so connected API workers keep working across server restarts
+        return read_authkey(address)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secrets.token_hex(32))
+    return read_authkey(address)
+
+
+class ModelClient:
+    """Thread-safe client; keeps one persistent connection per calling thread and role."""
+
+    def __init__(self, address, authkey=None, timeout=MODEL_SERVER_TIMEOUT):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, role):
+        connections = self._local.__dict__.setdefault('connections', {})
+        if role not in connections:
+            # Read per connection: the key file appears when the server first starts
+            authkey = self.authkey or read_authkey(self.address)
+            connections[role] = Client(socket_path(self.address, role), family='AF_UNIX', authkey=authkey)
+        return connections[role]
+
+    def _drop(self, role):
+        connection = self._local.__dict__.get('connections', {}).pop(role, None)
+        if connection is not None:
+            connection.close()
+
+    def call(self, role, op, payload=None):
+        for attempt in range(2):
+            try:
+                connection = self._connection(role)
+                connection.send((op, payload))
+                if not connection.poll(self.timeout):
+                    self._drop(role)
+                    raise TimeoutError(f"Model server did not answer {op} within {self.timeout}s")
+                status, result = connection.recv()
+                break
+            except (EOFError, ConnectionError, BrokenPipeError, FileNotFoundError):
+                # Server restarted or worker died, reconnect once
+                self._drop(role)
+                if attempt == 1:
+                    raise
+        if status != 'ok':
+            raise RuntimeError(f"Model server {op} failed: {result}")
+        return result
+
+    def predict(self, image_data):
+        return self.call('vision', 'predict', image_data)
+
+    def generate_report(self, patient_info, queries=None):
+        """{'report': text, 'model_version': the LLM version that wrote it}"""
+        return self.call('llm', 'generate_report', {'patient_info': patient_info, 'queries': queries})
+
+    def cascade_stats(self):
+        return self.call('vision', 'cascade_stats')
+
+    def llm_version(self):
+        """The LLM version the server generates with; fixed until the server restarts."""
+        return self.call('llm', 'ping').get('model_version')
+
+    def ping(self):
+        return {role: self.call(role, 'ping') for role in ('vision', 'llm')}
+
+
+def _serve_connection(connection, handlers):
+    with connection:
+        while True:
+            try:
+                op, payload = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                connection.send(('ok', handlers[op](payload)))
+            except Exception as e:
+                connection.send(('error', f"{type(e).__name__}: {e}"))
+
+
+def _serve_forever(listener, handlers):
+    while True:
+        try:
+            connection = listener.accept()
+        except Exception as e:
+            # Failed authentication or a client that went away mid-handshake
+            print(f"[{os.getpid()}] Rejected connection: {e}")
+            continue
+        threading.Thread(target=_serve_connection, args=(connection, handlers), daemon=True).start()
+
+
+def _open_listener(address, role):
+    path = socket_path(address, role)
+    if os.path.exists(path):
+        os.remove(path)
+    listener = Listener(path, family='AF_UNIX', authkey=server_authkey(address))
+    os.chmod(path, 0o600)
+    return listener
+
+
+def run_llm_server(address):
+    cpu_manager.isolate('llm')
+    # Active versions come from MODEL_REGISTRY_FILE; restart the server to change them
+    registry = ModelRegistry()
+    version, spec = registry.resolve('llm')
+    tokenizer, model, vector_store = load_report_system(model_name=spec['model_name'])
+    if model is None:
+        print("LLM failed to load, generation requests will fail")
+    llm = registry.install('llm', {'tokenizer': tokenizer, 'model': model}, version, spec)
+    listener = _open_listener(address, 'llm')
+    handlers = {
+        'generate_report': lambda request: {
+            'report': generate_maternal_report(request['patient_info'], vector_store, model, tokenizer,
+                                               queries=request.get('queries')),
+            'model_version': llm.version},
+        'ping': lambda _: {'pid': os.getpid(), 'ready': model is not None, 'model_version': llm.version},
+    }
+    print(f"[{os.getpid()}] LLM server listening on {socket_path(address, 'llm')}")
+    _serve_forever(listener, handlers)
+
+
+def run_vision_pool(address, workers, device):
+    # Before loading, so the forked workers inherit the vision pool size and cores
+    cpu_manager.isolate('vision')
+    vision = ModelRegistry(device).load('vision')
+    forked = device.type == 'cpu' and workers > 1
+    if forked:
+        for model in vision.models.values():
+            if model is not None:
+                model.share_memory()
+
+    listener = _open_listener(address, 'vision')
+    handlers = {
+        'predict': lambda data: classify(vision, data, device),
+        'cascade_stats': lambda _: cascade_stats.snapshot(),
+        'ping': lambda _: {'pid': os.getpid(), 'ready': True},
+    }
+    print(f"Vision pool listening on {socket_path(address, 'vision')} with {workers if forked else 1} worker(s)")
+    if not forked:
+        # CUDA contexts do not survive fork, serve from a single process instead
+        return [threading.Thread(target=_serve_forever, args=(listener, handlers), daemon=True)]
+
+    context = multiprocessing.get_context('fork')
+    return [context.Process(target=_serve_forever, args=(listener, handlers), daemon=True)
+            for _ in range(workers)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materna shared model server')
+    parser.add_argument('--address', default=MODEL_SERVER_ADDRESS or DEFAULT_ADDRESS,
+                        help='socket path prefix, also set MODEL_SERVER_ADDRESS for app.py')
+    parser.add_argument('--vision-workers', type=int, default=2)
+    parser.add_argument('--no-llm', action='store_true', help='serve only the classifiers')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"Running on {device}")
+    ensure_private_dir(args.address)
+    # Create the key once here, before the LLM process and the vision pool race for it
+    server_authkey(args.address)
+
+    children = []
+    if not args.no_llm:
+        # A fresh interpreter so the LLM process never inherits forked torch state
+        llm_process = multiprocessing.get_context('spawn').Process(
+            target=run_llm_server, args=(args.address,), daemon=True)
+        llm_process.start()
+        children.append(llm_process)
+
+    vision_workers = run_vision_pool(args.address, args.vision_workers, device)
+    for worker in vision_workers:
+        worker.start()
+    children.extend(w for w in vision_workers if isinstance(w, multiprocessing.process.BaseProcess))
+
+    def shutdown(signum, frame):
+        for child in children:
+            child.terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    while True:
+        for child in children:
+            if not child.is_alive():
+                print(f"Model server child {child.pid} exited with {child.exitcode}, shutting down")
+                shutdown(None, None)
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Materialized per-patient summary used by report generation.
+
+PatientSummaries holds the RAG-ready view of a patient (personal info,
+questionnaire, accumulated risk factors and abnormal test results). It is
+updated incrementally on the write paths (register_patient, store_report and
+RAG report insertion), so generation reads one row instead of re-reading and
+re-parsing every MedicalReports row.
+
+Only abnormal (borderline/high_risk) test results are kept: they are the only
+ones extract_patient_context and query_planner use. Findings are deduplicated
+to the latest one per test and capped at MAX_SUMMARY_FINDINGS, so the lists,
+and the cost of rewriting them on each write, do not grow with the history.
+
+All functions take a SQLAlchemy connection so the summary update commits in the
+same transaction as the write that caused it.
+"""
+import os
+import json
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+
+from database import patients, medical_reports, patient_summaries, upsert
+
+ABNORMAL_LEVELS = ('borderline', 'high_risk')
+MAX_SUMMARY_FINDINGS = int(os.environ.get('MAX_SUMMARY_FINDINGS', '50'))
+
+
+def profile_from_patient(patient):
+    """Build personal_info/questionnaire from a Patients row given as a column dict."""
+    personal_info = {
+        "first_name": patient['first_name'],
+        "last_name": patient['last_name'],
+        "gender": patient['gender'],
+        "dob": patient['dob'],
+        "blood_group": patient['blood_group'],
+        "height_cm": patient['height_cm'],
+        "current_weight": patient['current_weight'],
+        "pre_pregnancy_weight": patient['pre_pregnancy_weight'],
+        "lmp": patient['lmp'],
+        "due_date": patient['due_date'],
+        "preexisting_conditions": ""
+    }
+    questionnaire = {
+        "is_first_pregnancy": "Yes" if patient['gravida'] == 1 else "No",
+        "exercise_frequency": "Unknown",
+        "emotional_wellbeing": "Unknown",
+        "prenatal_vitamins": "Unknown"
+    }
+    return personal_info, questionnaire
+
+
+def extract_findings(analysis):
+    """Pull risk factors and abnormal test results out of one analysis_results object."""
+    if isinstance(analysis, str):
+        try:
+            analysis = json.loads(analysis)
+        except json.JSONDecodeError:
+            return [], []
+    if not isinstance(analysis, dict):
+        return [], []
+    risk_factors = analysis.get('risk_factors') if isinstance(analysis.get('risk_factors'), list) else []
+    test_results = analysis.get('test_results') if isinstance(analysis.get('test_results'), list) else []
+    abnormal = [r for r in test_results if isinstance(r, dict) and r.get('risk_level') in ABNORMAL_LEVELS]
+    return risk_factors, abnormal
+
+
+def _finding_key(finding):
+    if isinstance(finding, dict) and finding.get('test_name'):
+        return str(finding['test_name']).strip().lower()
+    return json.dumps(finding, sort_keys=True, default=str)
+
+
+def merge_findings(existing, new):
+    """The latest finding per test, oldest first, keeping at most MAX_SUMMARY_FINDINGS."""
+    merged = {}
+    for finding in existing + new:
+        key = _finding_key(finding)
+        # Re-insert so a newer result moves to the end
+        merged.pop(key, None)
+        merged[key] = finding
+    return list(merged.values())[-MAX_SUMMARY_FINDINGS:]
+
+
+def upsert_profile(conn, patient):
+    upsert_profiles(conn, [patient])
+
+
+def append_report(conn, patient_id, analysis):
+    append_reports(conn, {patient_id: [analysis]})
+
+
+def upsert_profiles(conn, patient_rows):
+    """Bulk variant of upsert_profile for imports."""
+    now = datetime.now().isoformat()
+    rows = []
+    for patient in patient_rows:
+        personal_info, questionnaire = profile_from_patient(patient)
+        rows.append({'patient_id': patient['patient_id'], 'personal_info': json.dumps(personal_info),
+                     'questionnaire': json.dumps(questionnaire), 'updated_at': now})
+    upsert(conn, patient_summaries, rows, ['patient_id'])
+
+
+def append_reports(conn, analyses_by_patient):
+    """Bulk variant of append_report: one read-modify-write per patient for a whole batch."""
+    for patient_id, analyses in analyses_by_patient.items():
+        risk_factors, abnormal = [], []
+        for analysis in analyses:
+            risks, tests = extract_findings(analysis)
+            risk_factors.extend(risks)
+            abnormal.extend(tests)
+        # Row lock on PostgreSQL so concurrent writers on other nodes do not lose findings
+        row = conn.execute(
+            select(patient_summaries.c.risk_factors, patient_summaries.c.test_results)
+            .where(patient_summaries.c.patient_id == patient_id)
+            .with_for_update()
+        ).first()
+        if row is None:
+            conn.execute(patient_summaries.insert().values(
+                patient_id=patient_id, risk_factors=json.dumps(merge_findings([], risk_factors)),
+                test_results=json.dumps(merge_findings([], abnormal)),
+                report_count=len(analyses), updated_at=datetime.now().isoformat()))
+            continue
+        conn.execute(
+            update(patient_summaries)
+            .where(patient_summaries.c.patient_id == patient_id)
+            .values(risk_factors=json.dumps(merge_findings(json.loads(row.risk_factors), risk_factors)),
+                    test_results=json.dumps(merge_findings(json.loads(row.test_results), abnormal)),
+                    report_count=patient_summaries.c.report_count + len(analyses),
+                    updated_at=datetime.now().isoformat()))
+
+
+def record_rag_report(conn, patient_id, report_id):
+    conn.execute(
+        update(patient_summaries)
+        .where(patient_summaries.c.patient_id == patient_id)
+        .values(latest_rag_report_id=report_id, report_count=patient_summaries.c.report_count + 1,
+                updated_at=datetime.now().isoformat()))
+
+
+def rebuild_summary(conn, patient_id):
+    """Backfill the summary for a patient from Patients and MedicalReports."""
+    patient = conn.execute(select(patients).where(patients.c.patient_id == patient_id)).mappings().first()
+    if not patient:
+        return False
+    conn.execute(delete(patient_summaries).where(patient_summaries.c.patient_id == patient_id))
+    upsert_profile(conn, patient)
+
+    analyses = conn.execute(
+        select(medical_reports.c.analysis_results)
+        .where(medical_reports.c.patient_id == patient_id)
+        .order_by(medical_reports.c.created_at)
+    ).scalars().all()
+    risk_factors, test_results = [], []
+    for analysis in analyses:
+        risks, abnormal = extract_findings(analysis) if analysis else ([], [])
+        risk_factors.extend(risks)
+        test_results.extend(abnormal)
+    conn.execute(
+        update(patient_summaries)
+        .where(patient_summaries.c.patient_id == patient_id)
+        .values(risk_factors=json.dumps(merge_findings([], risk_factors)),
+                test_results=json.dumps(merge_findings([], test_results)), report_count=len(analyses)))
+    return True
+
+
+def load_patient_data(conn, patient_id):
+    """
+    Return the RAG payload entry for a patient ({personal_info, questionnaire,
+    risk_factors?, test_results?}) or None when the patient is unknown.
+    """
+    row = conn.execute(
+        select(patient_summaries.c.personal_info, patient_summaries.c.questionnaire,
+               patient_summaries.c.risk_factors, patient_summaries.c.test_results)
+        .where(patient_summaries.c.patient_id == patient_id)
+    ).first()
+    if row is None or row.personal_info is None:
+        # Patients registered before the summary table existed
+        if not rebuild_summary(conn, patient_id):
+            return None
+        return load_patient_data(conn, patient_id)
+
+    patient = {
+        "personal_info": json.loads(row.personal_info),
+        "questionnaire": json.loads(row.questionnaire),
+    }
+    risk_factors = json.loads(row.risk_factors)
+    test_results = json.loads(row.test_results)
+    if risk_factors:
+        patient['risk_factors'] = risk_factors
+    if test_results:
+        patient['test_results'] = test_results
+    return patient
@@ -0,0 +1,117 @@
+"""
+Gestational age, maternal age and weight-gain helpers, scalar and vectorized.
+
+The scalar functions serve per-request code (report context, query planning)
+and cache their date parsing. The *_v functions take NumPy datetime64[D] /
+float arrays, so cohort_analytics can evaluate a whole panel in one pass.
+Both paths use the same rules.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+FIRST_TRIMESTER_END = 13
+SECOND_TRIMESTER_END = 27
+TERM_WEEKS = 40
+POST_TERM_WEEKS = 42
+
+BMI_CATEGORIES = ('underweight', 'normal', 'overweight', 'obese')
+BMI_BOUNDS = np.array([18.5, 25.0, 30.0])
+# IOM 2009 gestational weight gain: first-trimester total (kg) and weekly rate afterwards (kg/week),
+# low and high, indexed by BMI_CATEGORIES
+FIRST_TRIMESTER_GAIN = (0.5, 2.0)
+WEEKLY_GAIN_LOW = np.array([0.44, 0.35, 0.23, 0.17])
+WEEKLY_GAIN_HIGH = np.array([0.58, 0.50, 0.33, 0.27])
+
+
+@lru_cache(maxsize=16384)
+def parse_date(value):
+    """datetime.date for 'YYYY-MM-DD' strings, None when missing or malformed."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def gestational_week(lmp, today=None):
+    lmp_date = parse_date(lmp)
+    if lmp_date is None:
+        return None
+    return ((today or date.today()) - lmp_date).days // 7
+
+
+def age_years(dob, today=None):
+    dob_date = parse_date(dob)
+    if dob_date is None:
+        return None
+    today = today or date.today()
+    return today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
+
+
+def trimester(week):
+    if week is None:
+        return None
+    if week <= FIRST_TRIMESTER_END:
+        return 'first'
+    if week <= SECOND_TRIMESTER_END:
+        return 'second'
+    return 'third'
+
+
+def to_datetime64(values):
+    """ISO date strings (or None) to datetime64[D]; malformed entries become NaT."""
+    try:
+        return np.array([v[:10] if v else 'NaT' for v in values], dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        parsed = [parse_date(v) for v in values]
+        return np.array([np.datetime64(d) if d else np.datetime64('NaT') for d in parsed], dtype='datetime64[D]')
+
+
+def gestational_week_v(lmp, today):
+    """Completed weeks since LMP as float (NaN where unknown)."""
+    days = (np.datetime64(today, 'D') - lmp).astype('float64')
+    days[np.isnat(lmp)] = np.nan
+    return np.floor(days / 7)
+
+
+def age_years_v(dob, today):
+    today = np.datetime64(today, 'D')
+    years = dob.astype('datetime64[Y]')
+    year = years.astype('int64') + 1970
+    # month * 100 + day, compared to find birthdays not reached yet this year
+    month_day = ((dob.astype('datetime64[M]') - years.astype('datetime64[M]')).astype('int64') + 1) * 100 \
+        + (dob - dob.astype('datetime64[M]')).astype('int64') + 1
+    today_item = today.item()
+    ages = (today_item.year - year - (month_day > today_item.month * 100 + today_item.day)).astype('float64')
+    ages[np.isnat(dob)] = np.nan
+    return ages
+
+
+def bmi_v(height_cm, weight_kg):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = weight_kg / (height_cm / 100.0) ** 2
+    bmi[~np.isfinite(bmi) | (height_cm <= 0)] = np.nan
+    return bmi
+
+
+def bmi_category_v(bmi):
+    """Index into BMI_CATEGORIES, -1 where BMI is unknown."""
+    category = np.searchsorted(BMI_BOUNDS, bmi, side='right')
+    category[np.isnan(bmi)] = -1
+    return category
+
+
+def recommended_gain_v(week, category):
+    """(low, high) recommended cumulative gain in kg at each gestational week for each BMI category."""
+    known = category >= 0
+    index = np.where(known, category, 0)
+    early = np.clip(week, 0, FIRST_TRIMESTER_END) / FIRST_TRIMESTER_END
+    later = np.clip(week - FIRST_TRIMESTER_END, 0, None)
+    low = FIRST_TRIMESTER_GAIN[0] * early + WEEKLY_GAIN_LOW[index] * later
+    high = FIRST_TRIMESTER_GAIN[1] * early + WEEKLY_GAIN_HIGH[index] * later
+    low[~known] = np.nan
+    high[~known] = np.nan
+    return low, high
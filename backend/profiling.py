@@ -0,0 +1,315 @@
+"""
+Built-in profiling hooks for the Flask backend.
+
+Admin-only surface (requires the X-Admin-Token header, see admin_auth.py):
+  POST /admin/profile                 sample every thread for a window of live traffic
+  GET  /admin/profile/sections        cumulative timings of instrumented sections
+  GET  /admin/profiles/<profile_id>   download a stored per-request profile
+
+Per-request opt-in: send `X-Profile: stack` (stack sampling of the request thread,
+returned as a flame graph) or `X-Profile: torch` (torch.profiler, returned as a
+Chrome trace) together with the admin token. The response carries X-Profile-Id.
+torch.profiler is process-wide, so a torch request made while another one is
+being profiled gets 409.
+"""
+import os
+import sys
+import time
+import uuid
+import html
+import math
+import zlib
+import threading
+from collections import Counter
+from functools import wraps
+
+import torch
+from flask import request, jsonify, Response, g, send_file
+
+from admin_auth import is_admin_request, admin_required
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL_MS = 5
+
+# Cumulative wall-clock timings per instrumented section
+_section_stats = {}
+_section_lock = threading.Lock()
+
+# Only one window sampling session at a time
+_window_lock = threading.Lock()
+# Only one torch.profiler session at a time: it cannot be nested
+_torch_profile_lock = threading.Lock()
+
+
+def profiled(section):
+    """Decorator that labels a function in torch traces and records its timing."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with torch.profiler.record_function(section):
+                    return func(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with _section_lock:
+                    stats = _section_stats.setdefault(
+                        section, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                    stats['calls'] += 1
+                    stats['total_ms'] += elapsed_ms
+                    stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        return wrapper
+    return decorator
+
+
+def section_stats():
+    with _section_lock:
+        result = {}
+        for section, stats in _section_stats.items():
+            result[section] = dict(stats)
+            result[section]['mean_ms'] = stats['total_ms'] / stats['calls'] if stats['calls'] else 0.0
+        return result
+
+
+class StackSampler:
+    """Periodically samples Python stacks via sys._current_frames (py-spy style, in-process)."""
+
+    def __init__(self, interval_ms=DEFAULT_INTERVAL_MS, thread_ids=None):
+        self.interval = interval_ms / 1000.0
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+            self._stop.wait(self.interval)
+
+    def folded(self):
+        # Collapsed stack format understood by flamegraph.pl and speedscope
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def flame_graph_svg(self, title='Flame Graph'):
+        return render_flame_graph(self.samples, title)
+
+
+def render_flame_graph(samples, title='Flame Graph', width=1200, frame_height=16):
+    # Build a call tree from folded stacks
+    root = {'name': 'all', 'count': 0, 'children': {}}
+    for stack, count in samples.items():
+        root['count'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'count': 0, 'children': {}})
+            node['count'] += count
+
+    rects = []
+    max_depth = 0
+
+    def layout(node, x, depth):
+        nonlocal max_depth
+        max_depth = max(max_depth, depth)
+        rects.append((node, x, depth))
+        child_x = x
+        for child in sorted(node['children'].values(), key=lambda n: n['name']):
+            layout(child, child_x, depth + 1)
+            child_x += child['count']
+
+    layout(root, 0, 0)
+    total = root['count'] or 1
+    height = (max_depth + 1) * frame_height + 40
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="14">{html.escape(title)}</text>',
+    ]
+    for node, x, depth in rects:
+        w = node['count'] / total * width
+        if w < 0.5:
+            continue
+        y = height - (depth + 1) * frame_height
+        px = x / total * width
+        # Deterministic warm colour per frame name
+        hue = 20 + (zlib.crc32(node['name'].encode()) % 40)
+        label = html.escape(node['name'])
+        pct = node['count'] / total * 100
+        parts.append(
+            f'<g><title>{label} ({node["count"]} samples, {pct:.2f}%)</title>'
+            f'<rect x="{px:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" '
+            f'fill="hsl({hue},90%,60%)"/>'
+        )
+        max_chars = int(w / 7)
+        if max_chars >= 4:
+            text = node['name'] if len(node['name']) <= max_chars else node['name'][:max_chars - 2] + '..'
+            parts.append(f'<text x="{px + 2:.1f}" y="{y + frame_height - 4}">{html.escape(text)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _profile_path(profile_id, extension):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _start_request_profile(mode):
+    """Returns False when a torch profile is requested while another one is running."""
+    if mode == 'stack':
+        g.profile_sampler = StackSampler(thread_ids=[threading.get_ident()]).start()
+    elif mode == 'torch':
+        if not _torch_profile_lock.acquire(blocking=False):
+            return False
+        try:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_profile = torch.profiler.profile(activities=activities, record_shapes=True)
+            torch_profile.__enter__()
+        except Exception:
+            _torch_profile_lock.release()
+            raise
+        g.profile_torch = torch_profile
+    return True
+
+
+def _stop_request_profile():
+    """Stop whatever this request started; returns (sampler, torch_profile), either may be None."""
+    sampler = g.pop('profile_sampler', None)
+    torch_profile = g.pop('profile_torch', None)
+    if sampler is not None:
+        sampler.stop()
+    if torch_profile is not None:
+        try:
+            torch_profile.__exit__(None, None, None)
+        finally:
+            _torch_profile_lock.release()
+    return sampler, torch_profile
+
+
+def _finish_request_profile(response):
+    profile_id = None
+    sampler, torch_profile = _stop_request_profile()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if sampler is not None:
+        profile_id = uuid.uuid4().hex[:12]
+        with open(_profile_path(profile_id, 'svg'), 'w') as f:
+            f.write(sampler.flame_graph_svg(title=f"{request.method} {request.path}"))
+    elif torch_profile is not None:
+        profile_id = uuid.uuid4().hex[:12]
+        torch_profile.export_chrome_trace(_profile_path(profile_id, 'json'))
+
+    if profile_id:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def init_profiling(app):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    @app.before_request
+    def _maybe_profile_request():
+        mode = request.headers.get('X-Profile')
+        if mode in ('stack', 'torch') and is_admin_request() and not _start_request_profile(mode):
+            return jsonify({'message': 'A torch profile is already running'}), 409
+
+    @app.after_request
+    def _attach_request_profile(response):
+        if 'profile_sampler' in g or 'profile_torch' in g:
+            try:
+                response = _finish_request_profile(response)
+            except Exception as e:
+                print(f"Error finishing request profile: {e}")
+        return response
+
+    @app.teardown_request
+    def _stop_abandoned_profile(exc):
+        # after_request is skipped when an exception propagates (PROPAGATE_EXCEPTIONS)
+        if 'profile_sampler' in g or 'profile_torch' in g:
+            try:
+                _stop_request_profile()
+            except Exception as e:
+                print(f"Error stopping request profile: {e}")
+
+    @app.route('/admin/profile', methods=['POST'])
+    @admin_required
+    def profile_window():
+        try:
+            seconds = float(request.args.get('seconds', 10))
+            interval_ms = float(request.args.get('interval_ms', DEFAULT_INTERVAL_MS))
+        except ValueError:
+            return jsonify({'message': 'seconds and interval_ms must be numbers'}), 400
+        if not (math.isfinite(seconds) and math.isfinite(interval_ms)) or seconds <= 0:
+            return jsonify({'message': 'seconds must be positive, and both values finite'}), 400
+        seconds = min(seconds, MAX_PROFILE_SECONDS)
+        interval_ms = max(interval_ms, 1.0)
+        output_format = request.args.get('format', 'svg')
+        if output_format not in ('svg', 'folded', 'json'):
+            return jsonify({'message': 'format must be one of svg, folded, json'}), 400
+
+        if not _window_lock.acquire(blocking=False):
+            return jsonify({'message': 'A profiling session is already running'}), 409
+        try:
+            sampler = StackSampler(interval_ms=interval_ms).start()
+            time.sleep(seconds)
+            sampler.stop()
+        finally:
+            _window_lock.release()
+
+        if output_format == 'folded':
+            return Response(sampler.folded(), mimetype='text/plain')
+        if output_format == 'json':
+            return jsonify({
+                'seconds': seconds,
+                'interval_ms': interval_ms,
+                'ticks': sampler.sample_count,
+                'stacks': dict(sampler.samples.most_common()),
+            }), 200
+        svg = sampler.flame_graph_svg(title=f"Live traffic, {seconds:.0f}s @ {interval_ms:.0f}ms")
+        return Response(svg, mimetype='image/svg+xml')
+
+    @app.route('/admin/profile/sections', methods=['GET'])
+    @admin_required
+    def profile_sections():
+        return jsonify(section_stats()), 200
+
+    @app.route('/admin/profiles/<profile_id>', methods=['GET'])
+    @admin_required
+    def get_profile(profile_id):
+        if not profile_id.isalnum():
+            return jsonify({'message': 'Invalid profile id'}), 400
+        for extension, mimetype in (('svg', 'image/svg+xml'), ('json', 'application/json')):
+            path = _profile_path(profile_id, extension)
+            if os.path.exists(path):
+                return send_file(os.path.abspath(path), mimetype=mimetype)
+        return jsonify({'message': 'Profile not found'}), 404
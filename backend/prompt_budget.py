@@ -0,0 +1,82 @@
+"""
+Token-aware prompt assembly.
+
+Every section of the report prompt is measured with the LLM tokenizer. When the
+total is over budget, the lowest-priority trimmable sections are shortened first
+(guidelines, then the demographic profile, then risk factors and abnormal
+results). The instructions are never cut. Before, the whole prompt was
+tokenized with truncation=True, which silently dropped the end of the prompt,
+i.e. the instruction outline.
+"""
+from retrieval import count_tokens, trim_to_tokens
+
+
+class PromptSection:
+    def __init__(self, name, text, priority=0, min_tokens=0, trimmable=True, separator='\n'):
+        self.name = name
+        self.text = text
+        # Lower number = more important, trimmed last
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.trimmable = trimmable
+        # Unit dropped whole before cutting inside one (passages, profile lines)
+        self.separator = separator
+
+
+def _trim_section(section, max_tokens, tokenizer):
+    if max_tokens <= 0:
+        return ''
+    parts = [p for p in section.text.split(section.separator) if p.strip()]
+    # Drop trailing parts whole, then cut inside the last one if still over
+    while len(parts) > 1 and count_tokens(section.separator.join(parts), tokenizer) > max_tokens:
+        parts = parts[:-1]
+    text = section.separator.join(parts)
+    if count_tokens(text, tokenizer) > max_tokens:
+        text = trim_to_tokens(text, max_tokens, tokenizer)
+    return text
+
+
+def assemble_prompt(sections, tokenizer, max_tokens):
+    """
+    Join sections in order within max_tokens. Returns (prompt, stats) where stats
+    holds the final token count and per-section counts before and after trimming.
+    """
+    counts = {s.name: count_tokens(s.text, tokenizer) for s in sections}
+    stats = {'budget': max_tokens, 'sections': {}, 'trimmed': []}
+    for s in sections:
+        stats['sections'][s.name] = {'tokens': counts[s.name], 'original_tokens': counts[s.name]}
+
+    prompt = ''.join(s.text for s in sections)
+    total = count_tokens(prompt, tokenizer)
+    # Section counts do not add up exactly once joined, so re-measure and repeat if needed
+    for _ in range(3):
+        if total <= max_tokens:
+            break
+        overflow = total - max_tokens
+        for section in sorted((s for s in sections if s.trimmable), key=lambda s: -s.priority):
+            if overflow <= 0:
+                break
+            current = count_tokens(section.text, tokenizer)
+            target = max(current - overflow, section.min_tokens)
+            if target >= current:
+                continue
+            section.text = _trim_section(section, target, tokenizer)
+            new_count = count_tokens(section.text, tokenizer)
+            overflow -= current - new_count
+            stats['sections'][section.name]['tokens'] = new_count
+            if section.name not in stats['trimmed']:
+                stats['trimmed'].append(section.name)
+        prompt = ''.join(s.text for s in sections)
+        total = count_tokens(prompt, tokenizer)
+
+    stats['total_tokens'] = total
+    return prompt, stats
+
+
+def context_budget(tokenizer, max_prompt_tokens, max_new_tokens):
+    """Prompt budget bounded by the model window (minus room for generation)."""
+    window = getattr(tokenizer, 'model_max_length', None)
+    # HF uses a huge sentinel when the window is unknown
+    if isinstance(window, int) and 0 < window < 1_000_000:
+        return max(min(max_prompt_tokens, window - max_new_tokens), 1)
+    return max_prompt_tokens
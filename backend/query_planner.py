@@ -0,0 +1,101 @@
+"""
+Derive short, targeted guideline queries from a structured patient record.
+
+Instead of embedding the whole patient summary as one query, each abnormal test
+result or risk factor becomes its own query, plus one for the pregnancy stage and
+one for weight gain. The queries are embedded in a single batch and searched
+together (see HybridRetriever.retrieve_many).
+"""
+from pregnancy_timeline import gestational_week, trimester
+
+MAX_QUERIES = 6
+ABNORMAL_LEVELS = ('borderline', 'high_risk')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _direction(value, low, high):
+    value, low, high = _to_float(value), _to_float(low), _to_float(high)
+    if value is None:
+        return 'abnormal'
+    if high is not None and value > high:
+        return 'high'
+    if low is not None and value < low:
+        return 'low'
+    return 'abnormal'
+
+
+def _parse_range(reference_range):
+    # risk_factors carry "low - high" strings, test_results carry separate bounds
+    if not reference_range or '-' not in str(reference_range):
+        return None, None
+    low, _, high = str(reference_range).partition('-')
+    return low.strip(), high.strip()
+
+
+def _stage_query(lmp):
+    weeks = gestational_week(lmp)
+    if weeks is None:
+        return "routine antenatal care recommendations"
+    return f"antenatal care at {weeks} weeks of pregnancy {trimester(weeks)} trimester"
+
+
+def _weight_query(personal_info):
+    height = _to_float(personal_info.get('height_cm'))
+    pre_weight = _to_float(personal_info.get('pre_pregnancy_weight'))
+    current_weight = _to_float(personal_info.get('current_weight'))
+    if not height or not pre_weight:
+        return None
+    bmi = pre_weight / (height / 100) ** 2
+    if bmi < 18.5:
+        category = 'underweight'
+    elif bmi < 25:
+        category = 'normal BMI'
+    elif bmi < 30:
+        category = 'overweight'
+    else:
+        category = 'obese'
+    if current_weight is not None:
+        return f"recommended gestational weight gain for {category} women, gained {current_weight - pre_weight:.0f} kg"
+    return f"recommended gestational weight gain for {category} women"
+
+
+def plan_queries(patient, max_queries=MAX_QUERIES):
+    """Return a short, de-duplicated list of retrieval queries, most specific first."""
+    personal_info = patient.get('personal_info', {})
+    queries = []
+    seen_tests = set()
+
+    for risk in patient.get('risk_factors', []):
+        name = risk.get('test_name')
+        if not name or name.lower() in seen_tests:
+            continue
+        low, high = _parse_range(risk.get('reference_range'))
+        direction = _direction(risk.get('result_value'), low, high)
+        queries.append(f"{direction} {name} in pregnancy management")
+        seen_tests.add(name.lower())
+
+    for result in patient.get('test_results', []):
+        name = result.get('test_name')
+        if result.get('risk_level') not in ABNORMAL_LEVELS or not name or name.lower() in seen_tests:
+            continue
+        direction = _direction(result.get('result_value'), result.get('ref_range_low'), result.get('ref_range_high'))
+        queries.append(f"{direction} {name} in pregnancy management")
+        seen_tests.add(name.lower())
+
+    conditions = personal_info.get('preexisting_conditions')
+    if conditions:
+        queries.append(f"pregnancy with {conditions}")
+
+    # Always keep room for the general stage query
+    queries = queries[:max_queries - 2]
+    queries.append(_stage_query(personal_info.get('lmp')))
+    weight_query = _weight_query(personal_info)
+    if weight_query:
+        queries.append(weight_query)
+    return queries[:max_queries]
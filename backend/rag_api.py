@@ -1,148 +1,174 @@
-import requests
+"""
+Patient-facing maternal report generation proxied to the RAG service.
+
+    POST /generate-maternal-report          queue a report, returns 202 with job_id
+    GET  /generate-maternal-report/<job_id> processing | completed (with report) | failed
+
+The RAG service generates asynchronously (/generate_report returns a job id,
+/check_report/<id> its status), so this API never waits for generation. A
+background poller stores finished reports into MedicalReports. A status request
+for a job the poller has not picked up (or that another node submitted) checks
+the RAG service directly, so any node can answer.
+
+Registered by app.py when RAG_API_URL is set (see rag_client.py).
+"""
 import json
+import time
+import threading
 
-# Note: These imports are probably already in your Flask app
-# If you get errors about duplicate imports, you can remove these
-from flask import Flask, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import sqlite3
-import datetime
-
-# Configuration for the RAG API
-RAG_API_URL = "http://localhost:8000" 
-
-# Add this new route to your existing Flask application (paste-2.txt)
-@app.route('/generate-maternal-report', methods=['POST', 'OPTIONS'])
-@jwt_required()
-def generate_maternal_report():
-    """
-    Endpoint to generate a maternal health report by sending patient data to the RAG API.
-    This should be added to your existing Flask application.
-    """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'OK'}), 200
-    
-    # Get patient_id from the authenticated user
-    patient_id = get_jwt_identity()
-    
+from sqlalchemy.exc import IntegrityError
+
+import repositories
+from rag_client import RAGClient, RAGServiceError, CircuitOpen
+from ttl_cache import TTLCache
+
+RAG_POLL_INTERVAL = 2.0
+RAG_JOB_TIMEOUT = 15 * 60
+# Unexpected errors (bad JSON, database) for one job before it is given up
+RAG_MAX_JOB_ERRORS = 5
+
+
+def rag_report_id(job_id):
+    return f"rag_{job_id}"
+
+
+class RAGJobPoller:
+    """Polls pending jobs with backoff and stores completed reports; one daemon thread per process."""
+
+    def __init__(self, client, poll_interval=RAG_POLL_INTERVAL, job_timeout=RAG_JOB_TIMEOUT):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.pending = {}
+        self.failed = TTLCache(maxsize=10000, ttl=3600)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, job_id, patient_id):
+        now = time.monotonic()
+        with self._lock:
+            self.pending[job_id] = {'patient_id': patient_id, 'started': now, 'next_poll': now + self.poll_interval,
+                                    'delay': self.poll_interval}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rag-job-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            now = time.monotonic()
+            with self._lock:
+                due = [(job_id, job) for job_id, job in self.pending.items() if job['next_poll'] <= now]
+            for job_id, job in due:
+                try:
+                    self.poll(job_id, job)
+                except CircuitOpen:
+                    # Service is down, wait for the breaker instead of hammering it
+                    break
+                except RAGServiceError as e:
+                    print(f"RAG job {job_id} poll failed: {e}")
+                    self._backoff(job)
+                except Exception as e:
+                    # Never let one job kill the only poller thread
+                    print(f"RAG job {job_id} could not be processed: {type(e).__name__}: {e}")
+                    job['errors'] = job.get('errors', 0) + 1
+                    if job['errors'] >= RAG_MAX_JOB_ERRORS:
+                        self._finish(job_id, 'Report could not be stored')
+                    else:
+                        self._backoff(job)
+
+    def _backoff(self, job):
+        job['delay'] = min(job['delay'] * 2, 60)
+        job['next_poll'] = time.monotonic() + job['delay']
+
+    def _finish(self, job_id, error=None):
+        with self._lock:
+            self.pending.pop(job_id, None)
+        if error:
+            self.failed.set(job_id, error)
+
+    def poll(self, job_id, job):
+        status = self.client.check_report(job_id)
+        if status is None:
+            self._finish(job_id, 'Report job is unknown to the RAG service')
+        elif status.get('status') == 'completed':
+            store_report(job_id, job['patient_id'], status.get('report_content'))
+            self._finish(job_id)
+        elif time.monotonic() - job['started'] > self.job_timeout:
+            self._finish(job_id, 'Report generation timed out')
+        else:
+            self._backoff(job)
+
+
+def store_report(job_id, patient_id, report_content):
+    """Idempotent: the poller and a status request may both see the job complete."""
     try:
-        # Fetch patient data from your SQLite database
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        
-        # Get basic patient information
-        c.execute("SELECT * FROM Patients WHERE patient_id = ?", (patient_id,))
-        patient = c.fetchone()
-        
+        repositories.medical_reports.add_rag_report(rag_report_id(job_id), patient_id, report_content)
+    except IntegrityError:
+        pass
+
+
+def init_rag_api(app, client=None):
+    client = client or RAGClient()
+    poller = RAGJobPoller(client)
+
+    @app.route('/generate-maternal-report', methods=['POST', 'OPTIONS'])
+    @jwt_required()
+    def generate_maternal_report():
+        if request.method == 'OPTIONS':
+            return jsonify({'status': 'OK'}), 200
+
+        # Get patient_id from the authenticated user
+        patient_id = get_jwt_identity()
+
+        # One row from the materialized summary instead of re-reading every report
+        patient = repositories.patients.load_patient_data(patient_id)
         if not patient:
             return jsonify({'message': 'Patient not found'}), 404
-        
-        # Format patient data for the RAG API
-        # This dictionary structure matches what the RAG system expects
-        patient_data = {
-            patient_id: {
-                "personal_info": {
-                    "first_name": patient[1],        # first_name
-                    "last_name": patient[2],         # last_name
-                    "gender": patient[3],            # gender
-                    "dob": patient[4],               # dob
-                    "blood_group": patient[17],      # blood_group
-                    "height_cm": patient[10],        # height_cm
-                    "current_weight": patient[12],   # current_weight
-                    "pre_pregnancy_weight": patient[11], # pre_pregnancy_weight
-                    "lmp": patient[13],              # lmp (last menstrual period)
-                    "due_date": patient[14],         # due_date
-                    "preexisting_conditions": ""     # Add if you have this data
-                },
-                "questionnaire": {
-                    "is_first_pregnancy": "Yes" if patient[15] == 1 else "No",  # based on gravida
-                    "exercise_frequency": "Unknown",  # Add if you have this data
-                    "emotional_wellbeing": "Unknown", # Add if you have this data
-                    "prenatal_vitamins": "Unknown"    # Add if you have this data
-                }
-            }
-        }
-        
-        # Get medical reports for risk factors and test results
-        c.execute("SELECT * FROM MedicalReports WHERE patient_id = ?", (patient_id,))
-        reports = c.fetchall()
-        conn.close()
-        
-        # Process any existing medical reports for risk data
-        risk_factors = []
-        test_results = []
-        
-        for report in reports:
-            # The analysis_results is stored as a JSON string, parse it
-            if report[7]:  # analysis_results column
-                try:
-                    analysis = json.loads(report[7])
-                    
-                    # Extract risk factors if present
-                    if 'risk_factors' in analysis and isinstance(analysis['risk_factors'], list):
-                        risk_factors.extend(analysis['risk_factors'])
-                    
-                    # Extract test results if present
-                    if 'test_results' in analysis and isinstance(analysis['test_results'], list):
-                        test_results.extend(analysis['test_results'])
-                except json.JSONDecodeError:
-                    pass  # Skip if JSON is invalid
-        
-        # Add risk factors and test results if available
-        if risk_factors:
-            patient_data[patient_id]['risk_factors'] = risk_factors
-        
-        if test_results:
-            patient_data[patient_id]['test_results'] = test_results
-        
-        # Prepare the data for the RAG API request
-        rag_request_data = {
-            "patient_id": patient_id,
-            "patient_data": patient_data
-        }
-        
-        # Send request to the RAG API
-        response = requests.post(
-            f"{RAG_API_URL}/generate_report", 
-            json=rag_request_data,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        # Check if the request was successful
-        if response.status_code != 200:
-            return jsonify({
-                'message': 'Error from RAG system', 
-                'error': response.json().get('detail', 'Unknown error')
-            }), 500
-        
-        # Get the report from the RAG API response
-        report_data = response.json()
-        
-        # Generate a unique report ID
-        report_id = f"rag_{patient_id}_{int(datetime.datetime.now().timestamp())}"
-        
-        # Store the generated report in the database
-        conn = sqlite3.connect('hack.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO MedicalReports 
-                     (report_id, patient_id, type, category, date, file_url, notes, analysis_results, created_at) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                 (report_id, patient_id, "RAG", "Maternal Health Assessment", 
-                  datetime.datetime.now().isoformat(), "", 
-                  "Automatically generated maternal health report", 
-                  json.dumps({"report_content": report_data["report"]}),
-                  datetime.datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-        
-        # Return the generated report and its ID
+
+        try:
+            job_id = client.start_report(patient_id, {patient_id: patient})
+        except RAGServiceError as e:
+            status = 503 if isinstance(e, CircuitOpen) or e.status_code in (None, 503) else 502
+            return jsonify({'message': 'Report service unavailable, please try again later',
+                            'error': str(e)}), status
+
+        poller.submit(job_id, patient_id)
+        return jsonify({'message': 'Report generation started', 'job_id': job_id,
+                        'report_id': rag_report_id(job_id), 'status': 'processing'}), 202
+
+    @app.route('/generate-maternal-report/<job_id>', methods=['GET'])
+    @jwt_required()
+    def maternal_report_status(job_id):
+        patient_id = get_jwt_identity()
+        report_id = rag_report_id(job_id)
+
+        report = repositories.medical_reports.get(report_id)
+        if report is None and poller.failed.get(job_id) is None:
+            try:
+                status = client.check_report(job_id)
+            except RAGServiceError:
+                status = {'status': 'processing', 'patient_id': patient_id} if job_id in poller.pending else None
+                if status is None:
+                    return jsonify({'message': 'Report service unavailable, please try again later'}), 503
+            if status is None or status.get('patient_id') != patient_id:
+                return jsonify({'message': 'Report not found'}), 404
+            if status.get('status') != 'completed':
+                return jsonify({'job_id': job_id, 'status': 'processing'}), 200
+            store_report(job_id, patient_id, status.get('report_content'))
+            report = repositories.medical_reports.get(report_id)
+
+        if report is None:
+            return jsonify({'job_id': job_id, 'status': 'failed', 'message': poller.failed.get(job_id)}), 200
+        if report['patient_id'] != patient_id:
+            return jsonify({'message': 'Report not found'}), 404
         return jsonify({
-            'message': 'Report generated successfully',
+            'job_id': job_id,
+            'status': 'completed',
             'report_id': report_id,
-            'report': report_data['report']
-        }), 201
-        
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        return jsonify({'message': f'Error generating report: {str(e)}'}), 500
\ No newline at end of file
+            'report': json.loads(report['analysis_results'] or '{}').get('report_content'),
+        }), 200
+
+    return poller
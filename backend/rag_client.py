@@ -0,0 +1,152 @@
+"""
+HTTP client for the RAG report service (/generate_report + /check_report).
+
+One keep-alive session with a bounded connection pool is shared by all request
+threads. Every call has connect/read timeouts. Transient failures are retried
+with full-jitter exponential backoff, and a circuit breaker fails fast while the
+service is down. A slow or dead RAG service then costs callers a quick 503
+instead of tying up Flask workers.
+
+Environment variables (all optional):
+  RAG_API_URL                 base URL of the RAG service
+  RAG_CONNECT_TIMEOUT / RAG_READ_TIMEOUT     seconds (default 2 / 10)
+  RAG_POOL_SIZE               keep-alive connections (default 20)
+  RAG_MAX_RETRIES             retries after the first attempt (default 2)
+  RAG_BREAKER_FAILURES        consecutive failures that open the breaker (default 5)
+  RAG_BREAKER_RESET           seconds before a trial call is let through (default 30)
+"""
+import os
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RAG_API_URL = os.environ.get('RAG_API_URL')
+RAG_CONNECT_TIMEOUT = float(os.environ.get('RAG_CONNECT_TIMEOUT', '2'))
+RAG_READ_TIMEOUT = float(os.environ.get('RAG_READ_TIMEOUT', '10'))
+RAG_POOL_SIZE = int(os.environ.get('RAG_POOL_SIZE', '20'))
+RAG_MAX_RETRIES = int(os.environ.get('RAG_MAX_RETRIES', '2'))
+RAG_BREAKER_FAILURES = int(os.environ.get('RAG_BREAKER_FAILURES', '5'))
+RAG_BREAKER_RESET = float(os.environ.get('RAG_BREAKER_RESET', '30'))
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+
+
+class RAGServiceError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpen(RAGServiceError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open (one trial call) after reset_timeout."""
+
+    def __init__(self, failure_threshold=RAG_BREAKER_FAILURES, reset_timeout=RAG_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half_open' and self._trial_in_flight):
+                raise CircuitOpen("RAG service circuit is open", status_code=503)
+            if state == 'half_open':
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class RAGClient:
+    def __init__(self, base_url=RAG_API_URL, connect_timeout=RAG_CONNECT_TIMEOUT, read_timeout=RAG_READ_TIMEOUT,
+                 pool_size=RAG_POOL_SIZE, max_retries=RAG_MAX_RETRIES, breaker=None):
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        # Retries are done here, with jitter and breaker accounting, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method, path, idempotent, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            retryable = False
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.ConnectTimeout as e:
+                # Nothing reached the service, safe to retry any request
+                error, retryable = RAGServiceError(f"RAG service connect timeout: {e}", 503), True
+            except requests.RequestException as e:
+                # The request may have been processed, only repeat idempotent calls
+                error, retryable = RAGServiceError(f"RAG service unreachable: {e}", 503), idempotent
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    self.breaker.record_success()
+                    return response
+                error = RAGServiceError(f"RAG service returned {response.status_code}", 503)
+                retryable = idempotent or response.status_code in (429, 503)
+            self.breaker.record_failure()
+            if not retryable or attempt == self.max_retries:
+                raise error
+            # Full jitter keeps retries from many workers from arriving in lockstep
+            time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+
+    @staticmethod
+    def _detail(response):
+        try:
+            body = response.json()
+        except ValueError:
+            return response.text[:200]
+        if not isinstance(body, dict):
+            # Lists, strings and numbers are valid JSON bodies too
+            return str(body)[:200]
+        return body.get('detail') or body.get('error') or body
+
+    def start_report(self, patient_id, patient_data):
+        """Queue generation; returns the job id to poll with check_report."""
+        response = self._request('POST', '/generate_report', idempotent=False,
+                                 json={'patient_id': patient_id, 'patient_data': patient_data})
+        if response.status_code != 200:
+            raise RAGServiceError(f"RAG service rejected the request: {self._detail(response)}",
+                                  response.status_code)
+        return response.json()['report_id']
+
+    def check_report(self, job_id):
+        """{'status': 'processing'|'completed', 'patient_id', 'report_content', ...}, or None if unknown."""
+        response = self._request('GET', f'/check_report/{job_id}', idempotent=True)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RAGServiceError(f"RAG service check failed: {self._detail(response)}", response.status_code)
+        return response.json()
@@ -0,0 +1,296 @@
+"""
+Maternal report generation: guideline PDF indexing, LLM loading, patient
+context extraction and the generate_maternal_report pipeline. Shared by
+app.py and model_server.py.
+"""
+import os
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from profiling import profiled
+from pregnancy_timeline import gestational_week, age_years
+from cpu_resources import workload
+from embedding_engine import EMBEDDING_MODEL, load_embeddings
+from vector_index import MmapFAISSStore, has_compact_store, export_docstore, convert_langchain_index
+from retrieval import get_retriever
+from prompt_budget import PromptSection, assemble_prompt, context_budget
+
+INDEX_DIR = "maternal_care_faiss_index"
+# Re-parse the guideline PDF even when a saved index exists
+REBUILD_VECTOR_STORE = os.environ.get('REBUILD_VECTOR_STORE') == '1'
+FAISS_MMAP = os.environ.get('FAISS_MMAP', '1') == '1'
+# Tokens of guideline text included in the prompt
+GUIDELINE_TOKEN_BUDGET = int(os.environ.get('GUIDELINE_TOKEN_BUDGET', '256'))
+# Upper bound for the assembled prompt, further capped by the model window
+PROMPT_MAX_TOKENS = int(os.environ.get('PROMPT_MAX_TOKENS', '3000'))
+MAX_NEW_TOKENS = 800
+# Default LLM; other versions are loaded through model_registry.py
+LLM_MODEL_NAME = os.environ.get('LLM_MODEL_NAME', "ritvik77/Medical_Doctor_AI_LoRA-Mistral-7B-Instruct_FullModel")
+GENERATION_ERROR = "Error generating report. Please try again with simpler parameters."
+
+def load_and_split_pdf(pdf_path):
+    loader = PyPDFLoader(pdf_path)
+    documents = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len
+    )
+    chunks = text_splitter.split_documents(documents)
+    print(f"Your PDF has been split into {len(chunks)} chunks")
+    return chunks
+
+def create_vector_store(chunks, model_name=EMBEDDING_MODEL, save_path="faiss_index", embeddings=None):
+    embeddings = embeddings or load_embeddings(model_name)
+    vector_store = FAISS.from_documents(chunks, embeddings)
+    vector_store.save_local(save_path)
+    return vector_store
+
+def initialize_model_and_tokenizer(model_name=LLM_MODEL_NAME):
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch.float16,
+        device_map="auto",
+        load_in_4bit=True
+    )
+    return tokenizer, model
+
+def load_vector_store(pdf_path, index_dir=INDEX_DIR):
+    # ONNX MiniLM behind a dynamic batcher (see embedding_engine.py)
+    embeddings = load_embeddings(EMBEDDING_MODEL)
+    if REBUILD_VECTOR_STORE or not os.path.exists(os.path.join(index_dir, 'index.faiss')):
+        print("Loading and splitting PDF...")
+        chunks = load_and_split_pdf(pdf_path)
+
+        print("Creating vector store...")
+        vector_store = create_vector_store(chunks, save_path=index_dir, embeddings=embeddings)
+        export_docstore(vector_store, index_dir)
+    elif not has_compact_store(index_dir):
+        print("Converting pickled docstore to SQLite...")
+        convert_langchain_index(index_dir, embeddings)
+
+    print("Opening memory-mapped vector store...")
+    return MmapFAISSStore(index_dir, embeddings, mmap=FAISS_MMAP)
+
+def calculate_pregnancy_week(lmp_date):
+    # Parsed dates are cached, see pregnancy_timeline.py
+    return gestational_week(lmp_date)
+
+@profiled('extract_patient_context')
+def extract_patient_context(patient_data, patient_id):
+    if patient_id not in patient_data:
+        return "Patient not found."
+    
+    patient = patient_data[patient_id]
+    personal_info = patient['personal_info']
+    questionnaire = patient['questionnaire']
+    risk_factors = patient.get('risk_factors', [])
+    test_results = patient.get('test_results', [])
+    
+    context = f"""
+Patient Summary:
+Name: {personal_info['first_name']} {personal_info['last_name']}
+Age: {age_years(personal_info['dob'])} years
+Gender: {personal_info['gender']}
+Due Date: {personal_info['due_date']}
+Last Menstrual Period: {personal_info['lmp']}
+Current Week: {calculate_pregnancy_week(personal_info['lmp'])}
+Blood Group: {personal_info['blood_group']}
+Pre-existing Conditions: {personal_info['preexisting_conditions']}
+Height: {personal_info['height_cm']} cm
+Current Weight: {personal_info['current_weight']} kg
+Pre-pregnancy Weight: {personal_info['pre_pregnancy_weight']} kg
+
+Questionnaire Information:
+First Pregnancy: {questionnaire['is_first_pregnancy']}
+Exercise Frequency: {questionnaire['exercise_frequency']}
+Emotional Wellbeing: {questionnaire['emotional_wellbeing']}
+Prenatal Vitamins: {questionnaire['prenatal_vitamins']}
+"""
+    
+    if risk_factors:
+        context += "Risk Factors: ,"
+        for risk in risk_factors:
+            context += f"- {risk['test_name']}: {risk['result_value']} {risk['result_unit']} (Reference Range: {risk['reference_range']}), Risk Level: {risk['risk_level']},"
+    
+    abnormal_results = [result for result in test_results if result['risk_level'] in ['borderline', 'high_risk']]
+    if abnormal_results:
+        context += "Abnormal Test Results: ,"
+        for result in abnormal_results:
+            context += f"- {result['test_name']}: {result['result_value']} {result['result_unit']} (Reference Range: {result['ref_range_low']} - {result['ref_range_high']}), Risk Level: {result['risk_level']},"
+    
+    return context
+
+FINDINGS_MARKERS = ("Risk Factors: ,", "Abnormal Test Results: ,")
+
+def split_findings(patient_info):
+    """(demographics and questionnaire, risk factors and abnormal results) of extract_patient_context output."""
+    starts = [patient_info.find(marker) for marker in FINDINGS_MARKERS if marker in patient_info]
+    if not starts:
+        return patient_info.strip(), ''
+    return patient_info[:min(starts)].strip(), '\n' + patient_info[min(starts):].strip()
+
+def build_report_prompt(patient_info, medical_context, tokenizer):
+    """(prompt, stats, budget) for one report, fitted to the model window."""
+    # Measure every section and trim guidelines, then demographics, then findings, to fit
+    # the window; the instruction outline is never cut
+    profile, findings = split_findings(patient_info)
+    sections = [
+        PromptSection('preamble', "You are an expert obstetrician. Analyze this maternal patient profile "
+                                  "and provide a health assessment:\n\nPatient Profile:\n", trimmable=False),
+        PromptSection('profile', profile, priority=1, min_tokens=128),
+        # Entries are ',- ' separated on one line; later (abnormal results) entries go first
+        PromptSection('findings', findings, priority=0, separator=',- '),
+        PromptSection('guidelines_header', "\n\nGuidelines:\n", trimmable=False),
+        PromptSection('guidelines', medical_context, priority=2),
+        PromptSection('instructions', """
+
+Provide a profile analysis with:
+1. Patient Overview
+2. Health Status Analysis
+3. Potential Risk Indicators
+4. Recommendations
+5. Next Steps
+""", trimmable=False),
+    ]
+    # Leave room for special tokens the tokenizer adds
+    budget = context_budget(tokenizer, PROMPT_MAX_TOKENS, MAX_NEW_TOKENS) - 8
+    prompt, prompt_stats = assemble_prompt(sections, tokenizer, budget)
+    return prompt, prompt_stats, budget
+
+class _Cancelled(StoppingCriteria):
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancelled()
+
+
+@profiled('generate_maternal_report')
+def generate_maternal_report(patient_info, vector_store, model, tokenizer, queries=None, cancelled=None):
+    """
+    cancelled is an optional callable polled after every token; generation stops
+    when it returns True, and None is returned instead of a report.
+    """
+    if not tokenizer:
+        raise ValueError("Tokenizer failed to initialize. Ensure 'sentencepiece' is installed.")
+    # Embedding and reranking take the embeddings CPU budget themselves, so concurrent
+    # reports reach the embedding batcher together instead of queueing here
+    retriever = get_retriever(vector_store)
+    if queries:
+        # Targeted per-risk-factor queries from query_planner.plan_queries
+        passages = retriever.retrieve_many(
+            queries, token_budget=GUIDELINE_TOKEN_BUDGET, tokenizer=tokenizer)
+    else:
+        passages = retriever.retrieve(
+            patient_info, k=3, token_budget=GUIDELINE_TOKEN_BUDGET, tokenizer=tokenizer)
+    medical_context = "\n".join(passages)
+
+    prompt, prompt_stats, budget = build_report_prompt(patient_info, medical_context, tokenizer)
+    print(f"Prompt: {prompt_stats['total_tokens']} tokens (budget {budget}), "
+          f"trimmed: {', '.join(prompt_stats['trimmed']) or 'none'}")
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    
+    inputs = tokenizer(
+        prompt, 
+        return_tensors="pt", 
+        padding=True,
+        truncation=True,
+        max_length=budget + 8
+    )
+    inputs = inputs.to(model.device)
+    
+    print("Starting generation...")
+    
+    try:
+        with workload('llm'):
+            outputs = model.generate(
+                inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_new_tokens=MAX_NEW_TOKENS,
+                temperature=0.3,
+                top_p=0.9,
+                do_sample=False,
+                num_beams=1,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([_Cancelled(cancelled)]) if cancelled else None,
+            )
+        if cancelled is not None and cancelled():
+            return None
+        
+        report = tokenizer.decode(outputs[0][inputs.input_ids.size(1):], skip_special_tokens=True)
+        
+        print(f"Generation complete, produced {len(outputs[0]) - inputs.input_ids.size(1)} tokens")
+        
+        if not report or len(report) < 50:
+            print("Generated report too short, returning fallback")
+            return """
+# Maternal Health Assessment
+
+## Patient Overview
+The patient is currently pregnant and receiving prenatal care.
+
+## Health Status Analysis
+Based on the available information, the patient appears to be in stable condition.
+
+## Potential Risk Indicators
+A comprehensive risk assessment requires in-person evaluation.
+
+## Recommendations
+- Continue prenatal vitamins
+- Maintain regular checkups
+- Monitor for warning signs
+- Stay hydrated and maintain a balanced diet
+
+## Next Steps
+Schedule next prenatal appointment within 4 weeks.
+"""
+        
+        return report
+    
+    except Exception as e:
+        print(f"Error during generation: {str(e)}")
+        import traceback
+        print(traceback.format_exc())
+        return GENERATION_ERROR
+
+# Startup initialization
+def load_report_system(pdf_path="maternacare.pdf", model_name=LLM_MODEL_NAME):
+    tokenizer = model = vector_store = None
+
+    if os.environ.get('MATERNA_OFFLINE') == '1':
+        # Tiny LM, hashing embeddings and a small on-disk index (see loadtest/stubs.py)
+        from loadtest.stubs import build_offline_system
+        tokenizer, model, vector_store = build_offline_system(os.environ.get('MATERNA_OFFLINE_INDEX'))
+        get_retriever(vector_store)
+        print("System initialized with the offline profile.")
+        return tokenizer, model, vector_store
+
+    if os.environ.get('MATERNA_LLM_STUB') == '1':
+        # Deterministic offline stand-ins used by the load-test suite (see loadtest/stubs.py)
+        from loadtest.stubs import build_stub_system
+        tokenizer, model, vector_store = build_stub_system()
+        print("System initialized with stub LLM and embeddings.")
+        return tokenizer, model, vector_store
+    
+    try:
+        vector_store = load_vector_store(pdf_path)
+        # Builds the BM25 index if needed and loads the reranker up front
+        get_retriever(vector_store)
+        
+        print("Initializing model and tokenizer...")
+        tokenizer, model = initialize_model_and_tokenizer(model_name)
+        print("System initialized successfully.")
+    except Exception as e:
+        print(f"Error during initialization: {str(e)}")
+        import traceback
+        print(traceback.format_exc())
+    return tokenizer, model, vector_store
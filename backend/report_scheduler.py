@@ -0,0 +1,231 @@
+"""
+Opt-in background pre-generation of maternal reports (PREGEN_ENABLED=1).
+
+register_patient and store_report call notify() when a change can alter the
+report: a (re-)registration, or a stored report with risk factors or abnormal
+test results. Changes are debounced per patient. Each change pushes the
+patient's due time PREGEN_DEBOUNCE_S into the future, so a burst of lab
+uploads costs one generation.
+
+Due patients are regenerated one at a time, and only when all of these hold:
+  * the time is inside an off-peak window (PREGEN_WINDOWS, '*' for any time)
+  * no interactive torch work (on-demand generation, or /predict without a model
+    server) is running, and none finished in the last PREGEN_IDLE_S
+While a job runs, the process-wide torch pool is shrunk to PREGEN_THREADS
+(cpu_manager.background). A job stops at the next token when interactive work
+starts, and is requeued, so interactive traffic never waits behind a
+background report and shares the shrunken pool for one token at most. The
+exception is model_server.py, which cannot interrupt a generation it has
+started; its vision pool runs in other processes and is never shrunk.
+
+Each result is a new GeneratedReports row tagged with the digest of the
+patient context it was generated from. /generate_report builds its context
+from the same stored summary, and returns the newest completed row with that
+digest and the serving model version instead of generating again. The scheduler also skips patients whose current
+context already has a report, or a generation in flight; a 'processing' row
+older than PREGEN_STALE_S counts as abandoned.
+
+Notifications are per process. In multi-node deployments, enable the scheduler
+on the node(s) that should do background work; their reports serve every node
+through the shared database.
+
+    GET /admin/pregen    queue and counters (admin-only)
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import jsonify
+
+from admin_auth import admin_required
+from cpu_resources import cpu_manager
+import repositories
+from patient_summary import extract_findings
+from report_generation import extract_patient_context, GENERATION_ERROR
+from query_planner import plan_queries
+
+PREGEN_ENABLED = os.environ.get('PREGEN_ENABLED') == '1'
+PREGEN_DEBOUNCE_S = float(os.environ.get('PREGEN_DEBOUNCE_S', '300'))
+PREGEN_WINDOWS = os.environ.get('PREGEN_WINDOWS', '22:00-06:00')
+PREGEN_IDLE_S = float(os.environ.get('PREGEN_IDLE_S', '60'))
+PREGEN_THREADS = int(os.environ.get('PREGEN_THREADS', '2'))
+# A 'processing' row older than this is a generation that died with its process
+PREGEN_STALE_S = float(os.environ.get('PREGEN_STALE_S', '1800'))
+PREGEN_POLL_S = 10.0
+
+
+def context_digest(patient_info, queries=None):
+    """Identifies the generation input: same digest, same prompt."""
+    payload = json.dumps([patient_info, queries or []], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def parse_windows(spec):
+    """'22:00-06:00,13:00-14:00' -> [(start_minute, end_minute), ...]; '*' -> None (any time)."""
+    if spec.strip() in ('', '*'):
+        return None
+    windows = []
+    for window in spec.split(','):
+        start, end = window.strip().split('-')
+        windows.append(tuple(int(h) * 60 + int(m) for h, m in (start.split(':'), end.split(':'))))
+    return windows
+
+
+def in_window(windows, now=None):
+    if windows is None:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        # Windows may wrap past midnight
+        if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+            return True
+    return False
+
+
+def is_material(analysis):
+    """A stored report matters for generation only if it adds risk factors or abnormal results."""
+    risk_factors, abnormal = extract_findings(analysis)
+    return bool(risk_factors or abnormal)
+
+
+class ReportScheduler:
+    def __init__(self, generate, current_version=None, debounce=PREGEN_DEBOUNCE_S, windows=PREGEN_WINDOWS,
+                 idle=PREGEN_IDLE_S, threads=PREGEN_THREADS, poll_interval=PREGEN_POLL_S):
+        """
+        generate(patient_info, queries, cancelled) -> (report or None if cancelled, model_version).
+        current_version() -> the serving LLM version, or None when unknown; reports from other
+        versions are regenerated, as /generate_report would not serve them.
+        """
+        self.generate = generate
+        self.current_version = current_version
+        self.debounce = debounce
+        self.windows = parse_windows(windows)
+        self.idle = idle
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.due = {}
+        self.interactive_in_flight = 0
+        self.last_interactive = 0.0
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def notify(self, patient_id, reason):
+        with self._lock:
+            self.due[patient_id] = time.monotonic() + self.debounce
+            self.counters[f'changes_{reason}'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='report-pregen', daemon=True)
+                self._thread.start()
+
+    @contextmanager
+    def interactive(self):
+        """Wraps interactive torch work: background jobs yield to it and wait PREGEN_IDLE_S after it."""
+        with self._lock:
+            self.interactive_in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.interactive_in_flight -= 1
+                self.last_interactive = time.monotonic()
+
+    def _interrupted(self):
+        return self.interactive_in_flight > 0
+
+    def may_run(self):
+        return (in_window(self.windows) and self.interactive_in_flight == 0
+                and time.monotonic() - self.last_interactive >= self.idle)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.may_run():
+                continue
+            now = time.monotonic()
+            with self._lock:
+                ready = sorted((due, patient_id) for patient_id, due in self.due.items() if due <= now)
+            for _, patient_id in ready:
+                if not self.may_run():
+                    break
+                with self._lock:
+                    # Changed again since we looked: wait for the new debounce
+                    if self.due.get(patient_id, float('inf')) > time.monotonic():
+                        continue
+                    del self.due[patient_id]
+                try:
+                    outcome = self.regenerate(patient_id)
+                except Exception as e:
+                    print(f"Pre-generation for {patient_id} failed: {e}")
+                    outcome = 'failed'
+                with self._lock:
+                    self.counters[outcome] += 1
+                    if outcome == 'cancelled':
+                        self.due.setdefault(patient_id, time.monotonic())
+
+    def regenerate(self, patient_id):
+        patient = repositories.patients.load_patient_data(patient_id)
+        if patient is None:
+            return 'skipped'
+        patient_info = extract_patient_context({patient_id: patient}, patient_id)
+        queries = plan_queries(patient)
+        digest = context_digest(patient_info, queries)
+        # Already current, or an on-demand generation for the same context is running
+        in_flight_since = (datetime.now() - timedelta(seconds=PREGEN_STALE_S)).isoformat()
+        existing = repositories.generated_reports.find_reusable(patient_id, digest, ('completed', 'processing'),
+                                                                processing_since=in_flight_since)
+        version = self.current_version() if self.current_version else None
+        if existing and (existing['status'] == 'processing' or version is None
+                         or existing['model_version'] == version):
+            return 'fresh'
+
+        report_id = str(uuid.uuid4())
+        repositories.generated_reports.create_pending(report_id, patient_id, digest)
+        try:
+            with cpu_manager.background(self.threads):
+                report, model_version = self.generate(patient_info, queries, self._interrupted)
+        except Exception:
+            # A leftover 'processing' row would make this context look in flight
+            repositories.generated_reports.delete(report_id)
+            raise
+        if report is None:
+            # Nobody was handed this id: find_reusable only returns completed rows to requests
+            repositories.generated_reports.delete(report_id)
+            return 'cancelled'
+        repositories.generated_reports.complete(report_id, report, model_version,
+                                                reusable=report != GENERATION_ERROR)
+        print(f"Pre-generated report {report_id} for {patient_id}")
+        return 'generated' if report != GENERATION_ERROR else 'failed'
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'queued': len(self.due),
+                'ready': sum(1 for due in self.due.values() if due <= now),
+                'window_open': in_window(self.windows),
+                'interactive_in_flight': self.interactive_in_flight,
+                'may_run': self.may_run(),
+                'counters': dict(self.counters),
+            }
+
+
+def init_report_scheduler(app, generate, current_version=None):
+    """The scheduler when PREGEN_ENABLED=1, else None; registers GET /admin/pregen either way."""
+    scheduler = ReportScheduler(generate, current_version) if PREGEN_ENABLED else None
+
+    @app.route('/admin/pregen', methods=['GET'])
+    @admin_required
+    def pregen_status():
+        if scheduler is None:
+            return jsonify({'enabled': False}), 200
+        return jsonify({'enabled': True, **scheduler.snapshot()}), 200
+
+    return scheduler
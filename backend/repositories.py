@@ -0,0 +1,224 @@
+"""
+Data access for users, Patients, MedicalReports and GeneratedReports.
+
+Routes go through these repositories instead of opening sqlite3 connections,
+so the same code runs on SQLite (development, DATABASE_URL unset) and on
+PostgreSQL with a pooled engine (production, see database.py). Every method
+runs in its own transaction. Writes that change a patient's inputs also update
+PatientSummaries in that same transaction.
+
+Rows are returned as plain dicts keyed by column name. Large report bodies are
+stored compressed in ReportBlobs and resolved on read (see blob_store.py).
+"""
+import os
+import json
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, and_, or_
+
+import database as db
+import blob_store
+import patient_summary
+from ttl_cache import TTLCache
+
+# Keeps IN (...) lists well under the bound-parameter limits of both backends
+IN_CHUNK_SIZE = 500
+# Patient records read on every authenticated request; other nodes see updates after at most this long
+IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', '30'))
+IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', '10000'))
+
+
+class Repository:
+    table = None
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _first(self, stmt):
+        with self.engine.connect() as conn:
+            row = conn.execute(stmt).mappings().first()
+        return dict(row) if row else None
+
+    def _existing(self, column, values):
+        found = set()
+        values = list(values)
+        with self.engine.connect() as conn:
+            for i in range(0, len(values), IN_CHUNK_SIZE):
+                chunk = values[i:i + IN_CHUNK_SIZE]
+                found.update(conn.execute(select(column).where(column.in_(chunk))).scalars())
+        return found
+
+    def stream(self, stmt, batch_size=1000):
+        """Yield lists of row dicts; server-side cursor on PostgreSQL, so exports never load the whole table."""
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+            for partition in result.mappings().partitions():
+                yield [dict(row) for row in partition]
+
+
+class UserRepository(Repository):
+    table = db.users
+
+    def create(self, user_id, username, password_hash, patient_id):
+        """Raises sqlalchemy.exc.IntegrityError when the username is taken."""
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert().values(
+                user_id=user_id, username=username, password=password_hash, patient_id=patient_id))
+
+    def get_by_username(self, username):
+        return self._first(select(self.table).where(self.table.c.username == username))
+
+    def update_password(self, user_id, password_hash):
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.user_id == user_id).values(password=password_hash))
+
+
+class PatientRepository(Repository):
+    table = db.patients
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+
+    def get(self, patient_id):
+        patient = self.cache.get_or_load(
+            patient_id, lambda: self._first(select(self.table).where(self.table.c.patient_id == patient_id)))
+        # Callers get their own copy, the cached dict is shared between threads
+        return dict(patient) if patient else None
+
+    def upsert(self, patient):
+        self.upsert_many([patient])
+
+    def upsert_many(self, patients):
+        """Insert or replace patients (column dicts) and refresh their summaries."""
+        with self.engine.begin() as conn:
+            db.upsert(conn, self.table, patients, ['patient_id'])
+            patient_summary.upsert_profiles(conn, patients)
+        for patient in patients:
+            self.cache.invalidate(patient['patient_id'])
+
+    def existing_ids(self, patient_ids):
+        return self._existing(self.table.c.patient_id, patient_ids)
+
+    def load_patient_data(self, patient_id):
+        """RAG payload for one patient from the materialized summary (see patient_summary.py)."""
+        with self.engine.begin() as conn:
+            # begin(), not connect(): a missing summary is backfilled on first read
+            return patient_summary.load_patient_data(conn, patient_id)
+
+    def stream_all(self, batch_size=1000):
+        return self.stream(select(self.table).order_by(self.table.c.patient_id), batch_size)
+
+    def cohort(self, hospital=None, provider=None):
+        """Rows for panel analytics: timeline/weight columns plus summary findings, one per patient."""
+        p, summary = self.table, db.patient_summaries
+        stmt = (select(p.c.patient_id, p.c.dob, p.c.lmp, p.c.due_date, p.c.height_cm, p.c.pre_pregnancy_weight,
+                       p.c.current_weight, summary.c.risk_factors, summary.c.test_results)
+                .select_from(p.outerjoin(summary, summary.c.patient_id == p.c.patient_id)))
+        if hospital:
+            stmt = stmt.where(p.c.hospital == hospital)
+        if provider:
+            stmt = stmt.where(p.c.healthcare_provider == provider)
+        with self.engine.connect() as conn:
+            return conn.execute(stmt).all()
+
+
+class MedicalReportRepository(Repository):
+    table = db.medical_reports
+
+    def add(self, report, analysis):
+        self.add_many([report], {report['patient_id']: [analysis]})
+
+    def add_many(self, reports, analyses_by_patient):
+        """reports are column dicts; analyses_by_patient feeds the summaries ({patient_id: [analysis, ...]})."""
+        with self.engine.begin() as conn:
+            for report in reports:
+                # Imported RAG reports carry their full body too
+                report['analysis_results'] = blob_store.offload_analysis(conn, report.get('analysis_results'))
+            conn.execute(self.table.insert(), reports)
+            patient_summary.append_reports(conn, analyses_by_patient)
+
+    def add_rag_report(self, report_id, patient_id, report_content):
+        now = datetime.now().isoformat()
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert().values(
+                report_id=report_id, patient_id=patient_id, type="RAG", category="Maternal Health Assessment",
+                date=now, file_url="", notes="Automatically generated maternal health report",
+                analysis_results=json.dumps({"report_content": blob_store.offload(conn, report_content)}),
+                created_at=now))
+            patient_summary.record_rag_report(conn, patient_id, report_id)
+
+    def get(self, report_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.report_id == report_id)).mappings().first()
+            return blob_store.inflate_analyses(conn, [dict(row)])[0] if row else None
+
+    def list_for_patient(self, patient_id):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(self.table).where(self.table.c.patient_id == patient_id)).mappings().all()
+            return blob_store.inflate_analyses(conn, [dict(row) for row in rows])
+
+    def existing_ids(self, report_ids):
+        return self._existing(self.table.c.report_id, report_ids)
+
+    def stream_all(self, patient_id=None, batch_size=1000):
+        stmt = select(self.table)
+        if patient_id:
+            stmt = stmt.where(self.table.c.patient_id == patient_id)
+        for rows in self.stream(stmt.order_by(self.table.c.patient_id, self.table.c.created_at), batch_size):
+            with self.engine.connect() as conn:
+                yield blob_store.inflate_analyses(conn, rows)
+
+
+class GeneratedReportRepository(Repository):
+    table = db.generated_reports
+
+    def create_pending(self, report_id, patient_id, input_digest=None):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert().values(
+                report_id=report_id, patient_id=patient_id, status='processing',
+                created_at=datetime.now().isoformat(), input_digest=input_digest))
+
+    def complete(self, report_id, report_content, model_version=None, reusable=True):
+        """reusable=False (a failed generation) drops the digest so the report is never served from cache."""
+        with self.engine.begin() as conn:
+            values = dict(report_content=blob_store.offload(conn, report_content), status='completed',
+                          completed_at=datetime.now().isoformat(), model_version=model_version)
+            if not reusable:
+                values['input_digest'] = None
+            conn.execute(update(self.table).where(self.table.c.report_id == report_id).values(**values))
+
+    def find_reusable(self, patient_id, input_digest, statuses=('completed',), processing_since=None):
+        """
+        Newest report generated from exactly this patient context, as {report_id, status, model_version}.
+        With processing_since (ISO time), older 'processing' rows count as abandoned and are ignored.
+        """
+        t = self.table
+        status_clause = t.c.status.in_(statuses)
+        if processing_since and 'processing' in statuses:
+            status_clause = or_(t.c.status.in_([s for s in statuses if s != 'processing']),
+                                and_(t.c.status == 'processing', t.c.created_at >= processing_since))
+        return self._first(
+            select(t.c.report_id, t.c.status, t.c.model_version)
+            .where(t.c.patient_id == patient_id, t.c.input_digest == input_digest, status_clause)
+            .order_by(t.c.created_at.desc()))
+
+    def delete(self, report_id):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.report_id == report_id))
+
+    def get(self, report_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.report_id == report_id)).mappings().first()
+            if not row:
+                return None
+            report = dict(row)
+            report['report_content'] = blob_store.resolve(conn, report['report_content'])
+        return report
+
+
+# Bound to the process-wide engine from DATABASE_URL
+users = UserRepository(db.engine)
+patients = PatientRepository(db.engine)
+medical_reports = MedicalReportRepository(db.engine)
+generated_reports = GeneratedReportRepository(db.engine)
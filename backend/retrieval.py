@@ -0,0 +1,271 @@
+"""
+Hybrid guideline retrieval: dense FAISS hits fused with BM25 hits from an SQLite
+FTS5 index over the same chunks, optionally reranked by a small cross-encoder,
+then packed into a token budget.
+
+Environment variables:
+  RERANKER_MODEL               cross-encoder to load ('' disables reranking)
+  RETRIEVAL_CANDIDATES         candidates taken from each of dense and BM25 (default 20)
+  RETRIEVAL_LATENCY_BUDGET_MS  skip reranking while its moving-average cost exceeds this
+  RERANK_MAX_IN_FLIGHT         skip reranking when more retrievals than this run at once
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+from cpu_resources import workload
+
+# The offline profile (MATERNA_OFFLINE=1) never downloads a reranker
+RERANKER_MODEL = os.environ.get('RERANKER_MODEL', '' if os.environ.get('MATERNA_OFFLINE') == '1'
+                                else 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RETRIEVAL_CANDIDATES = int(os.environ.get('RETRIEVAL_CANDIDATES', '20'))
+RETRIEVAL_LATENCY_BUDGET_MS = float(os.environ.get('RETRIEVAL_LATENCY_BUDGET_MS', '250'))
+RERANK_MAX_IN_FLIGHT = int(os.environ.get('RERANK_MAX_IN_FLIGHT', '4'))
+RRF_K = 60
+MIN_TRIMMED_TOKENS = 32
+
+_TERM_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'kg',
+    'cm', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'with', 'name', 'unknown', 'yes', 'no',
+}
+
+
+def ensure_bm25_index(docstore_path):
+    """Build the FTS5 inverted index over docstore chunks if it does not exist yet."""
+    conn = sqlite3.connect(docstore_path)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE name = 'chunks_fts'")
+        if c.fetchone():
+            return True
+        c.execute('''CREATE VIRTUAL TABLE chunks_fts USING fts5(
+            page_content, content='chunks', content_rowid='position', tokenize='porter')''')
+        c.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('rebuild')")
+        conn.commit()
+        print(f"Built BM25 index in {docstore_path}")
+        return True
+    except sqlite3.OperationalError as e:
+        if 'already exists' in str(e):
+            # Another worker built it concurrently
+            return True
+        print(f"FTS5 unavailable ({e}), retrieval will be dense-only")
+        return False
+    finally:
+        conn.close()
+
+
+def fts_query(text, max_terms=32):
+    terms = []
+    for term in _TERM_RE.findall(text.lower()):
+        if term in STOPWORDS or len(term) < 3 or term.isdigit() or term in terms:
+            continue
+        terms.append(term)
+    return ' OR '.join(f'"{term}"' for term in terms[:max_terms])
+
+
+def count_tokens(text, tokenizer=None):
+    if tokenizer is None:
+        # Rough English average when no tokenizer is at hand
+        return int(len(text.split()) * 1.3) + 1
+    try:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    except TypeError:
+        return len(tokenizer.encode(text))
+
+
+def trim_to_tokens(text, max_tokens, tokenizer=None):
+    words = text.split()
+    tokens = count_tokens(text, tokenizer)
+    if tokens <= max_tokens:
+        return text
+    keep = max(int(len(words) * max_tokens / tokens), 1)
+    while keep > 1 and count_tokens(' '.join(words[:keep]), tokenizer) > max_tokens:
+        keep = int(keep * 0.9)
+    trimmed = ' '.join(words[:keep])
+    # Prefer ending on a sentence boundary when one is reasonably close
+    cut = trimmed.rfind('. ')
+    if cut > len(trimmed) * 0.6:
+        trimmed = trimmed[:cut + 1]
+    return trimmed
+
+
+class HybridRetriever:
+    def __init__(self, vector_store, reranker_model=RERANKER_MODEL, candidates=RETRIEVAL_CANDIDATES,
+                 latency_budget_ms=RETRIEVAL_LATENCY_BUDGET_MS, max_in_flight=RERANK_MAX_IN_FLIGHT):
+        self.vector_store = vector_store
+        self.candidates = candidates
+        self.latency_budget_ms = latency_budget_ms
+        self.max_in_flight = max_in_flight
+        self.docstore_path = getattr(vector_store, 'docstore_path', None)
+        self.bm25_enabled = bool(self.docstore_path) and ensure_bm25_index(self.docstore_path)
+        self.reranker = self._load_reranker(reranker_model)
+        self.rerank_ewma_ms = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _load_reranker(model_name):
+        if not model_name:
+            return None
+        try:
+            from sentence_transformers import CrossEncoder
+            return CrossEncoder(model_name)
+        except Exception as e:
+            print(f"Cross-encoder {model_name} unavailable ({e}), reranking disabled")
+            return None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.docstore_path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def bm25_search(self, query, k):
+        match = fts_query(query)
+        if not self.bm25_enabled or not match:
+            return []
+        c = self._connection().cursor()
+        c.execute('''SELECT chunks.page_content FROM chunks_fts
+                     JOIN chunks ON chunks.position = chunks_fts.rowid
+                     WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?''', (match, k))
+        return [row[0] for row in c.fetchall()]
+
+    def dense_search(self, query, k):
+        return [doc.page_content for doc, _ in self.vector_store.similarity_search_with_score(query, k=k)]
+
+    def dense_search_many(self, queries, k):
+        """Embed all queries in one batch and run one batched FAISS search."""
+        vs = self.vector_store
+        vectors = np.asarray(vs.embeddings.embed_documents(queries), dtype=np.float32)
+        if hasattr(vs, 'search_vectors'):
+            _, positions = vs.search_vectors(vectors, k)
+            documents = vs.fetch_documents(sorted({int(p) for p in positions.ravel() if p >= 0}))
+            return [[documents[int(p)].page_content for p in row if int(p) in documents] for row in positions]
+        # Plain LangChain FAISS store (stub and offline setups)
+        _, positions = vs.index.search(vectors, k)
+        return [[vs.docstore.search(vs.index_to_docstore_id[int(p)]).page_content for p in row if p >= 0]
+                for row in positions]
+
+    def _should_rerank(self):
+        if self.reranker is None:
+            return False
+        with self._lock:
+            busy = self._in_flight > self.max_in_flight
+            over_budget = self.rerank_ewma_ms > self.latency_budget_ms
+            if over_budget:
+                # Decay while skipping so reranking is retried once load subsides
+                self.rerank_ewma_ms *= 0.9
+        return not busy and not over_budget
+
+    def rerank(self, query, passages):
+        with workload('embeddings'):
+            start = time.perf_counter()
+            scores = self.reranker.predict([(query, passage) for passage in passages])
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.rerank_ewma_ms = elapsed_ms if not self.rerank_ewma_ms else 0.8 * self.rerank_ewma_ms + 0.2 * elapsed_ms
+        ranked = sorted(zip(passages, scores), key=lambda item: item[1], reverse=True)
+        return [passage for passage, _ in ranked]
+
+    def retrieve(self, query, k=3, token_budget=None, tokenizer=None, rerank=None):
+        """Return up to k passages (plain strings), best first, within token_budget tokens."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            dense = self.dense_search(query, self.candidates)
+            sparse = self.bm25_search(query, self.candidates)
+
+            # Reciprocal rank fusion over the union of both candidate lists
+            scores = {}
+            for ranking in (dense, sparse):
+                for rank, passage in enumerate(ranking):
+                    scores[passage] = scores.get(passage, 0.0) + 1.0 / (RRF_K + rank + 1)
+            fused = sorted(scores, key=scores.get, reverse=True)
+
+            if rerank is None:
+                rerank = self._should_rerank()
+            if rerank and self.reranker is not None and fused:
+                fused = self.rerank(query, fused)
+
+            return self.pack(fused[:k], token_budget, tokenizer)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def retrieve_many(self, queries, k=None, token_budget=None, tokenizer=None, rerank=None):
+        """
+        Retrieve for several short queries at once. Passages are de-duplicated across
+        queries and picked round-robin so every query contributes its best hit.
+        """
+        if not queries:
+            return []
+        k = k or len(queries)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            candidates = max(self.candidates // len(queries), 5)
+            dense_rankings = self.dense_search_many(queries, candidates)
+            per_query = []
+            for query, dense in zip(queries, dense_rankings):
+                scores = {}
+                for ranking in (dense, self.bm25_search(query, candidates)):
+                    for rank, passage in enumerate(ranking):
+                        scores[passage] = scores.get(passage, 0.0) + 1.0 / (RRF_K + rank + 1)
+                per_query.append(sorted(scores, key=scores.get, reverse=True))
+
+            if rerank is None:
+                rerank = self._should_rerank()
+            if rerank and self.reranker is not None:
+                per_query = [self.rerank(query, ranking[:10]) if ranking else ranking
+                             for query, ranking in zip(queries, per_query)]
+
+            selected = []
+            depth = 0
+            while len(selected) < k and any(depth < len(r) for r in per_query):
+                for ranking in per_query:
+                    if depth < len(ranking) and ranking[depth] not in selected and len(selected) < k:
+                        selected.append(ranking[depth])
+                depth += 1
+            return self.pack(selected, token_budget, tokenizer)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def pack(passages, token_budget=None, tokenizer=None):
+        if token_budget is None:
+            return list(passages)
+        packed = []
+        remaining = token_budget
+        for passage in passages:
+            tokens = count_tokens(passage, tokenizer)
+            if tokens <= remaining:
+                packed.append(passage)
+                remaining -= tokens
+            elif remaining >= MIN_TRIMMED_TOKENS:
+                packed.append(trim_to_tokens(passage, remaining, tokenizer))
+                remaining = 0
+            if remaining < MIN_TRIMMED_TOKENS:
+                break
+        return packed
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(vector_store):
+    """One HybridRetriever per vector store (the reranker is loaded once)."""
+    with _retrievers_lock:
+        entry = _retrievers.get(id(vector_store))
+        if entry is None or entry.vector_store is not vector_store:
+            entry = HybridRetriever(vector_store)
+            _retrievers[id(vector_store)] = entry
+        return entry
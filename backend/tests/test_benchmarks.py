@@ -0,0 +1,110 @@
+"""
+pytest-benchmark suite for the hot paths, on the offline profile (see conftest.py).
+
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave
+    python -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=median:25%
+
+The second run fails when any median is more than 25% slower than the last
+saved run. Compare runs recorded on the same kind of machine.
+"""
+import io
+
+import pytest
+
+from loadtest.offline_bench import synthetic_frame, login, expect
+from loadtest.synthetic import make_patient, make_report, rag_patient_data, new_rng
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture(scope='module')
+def client(offline_app):
+    return offline_app.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def session(client):
+    """A signed-up patient with stored lab reports: (headers, patient_id, profile, reports)."""
+    rng = new_rng(0)
+    patient = make_patient(rng, 0)
+    headers, patient_id = login(client, patient)
+    expect(client.post('/register-patient', json=patient['profile'], headers=headers), 201)
+    reports = [make_report(rng) for _ in range(3)]
+    for report in reports:
+        expect(client.post('/store-report', json=report, headers=headers), 201)
+    return headers, patient_id, patient['profile'], reports
+
+
+@pytest.fixture(scope='module')
+def generation_inputs(offline_app, session):
+    """(patient_info, queries, tokenizer, retriever) as /generate_report would build them."""
+    from retrieval import get_retriever
+    from report_generation import extract_patient_context
+    from query_planner import plan_queries
+
+    _, patient_id, profile, reports = session
+    payload = rag_patient_data(patient_id, profile, reports)
+    patient_info = extract_patient_context(payload['patient_data'], patient_id)
+    queries = plan_queries(payload['patient_data'][patient_id])
+    tokenizer = offline_app.model_registry.current('llm')['tokenizer']
+    return patient_info, queries, tokenizer, get_retriever(offline_app.vector_store)
+
+
+def test_predict(benchmark, client):
+    frame = synthetic_frame()
+
+    def predict():
+        return client.post('/predict', data={'image': (io.BytesIO(frame), 'frame.png', 'image/png')},
+                           content_type='multipart/form-data')
+
+    response = benchmark(predict)
+    assert response.status_code == 200
+    assert response.get_json()['model_version'] == 'builtin'
+
+
+def test_retrieve(benchmark, generation_inputs):
+    patient_info, _, tokenizer, retriever = generation_inputs
+    passages = benchmark(retriever.retrieve, patient_info, k=3, tokenizer=tokenizer)
+    assert passages
+
+
+def test_retrieve_many(benchmark, generation_inputs):
+    _, queries, tokenizer, retriever = generation_inputs
+    passages = benchmark(retriever.retrieve_many, queries, tokenizer=tokenizer)
+    assert passages
+
+
+def test_prompt_assembly(benchmark, generation_inputs):
+    from report_generation import build_report_prompt
+
+    patient_info, queries, tokenizer, retriever = generation_inputs
+    medical_context = "\n".join(retriever.retrieve_many(queries, tokenizer=tokenizer))
+    prompt, stats, budget = benchmark(build_report_prompt, patient_info, medical_context, tokenizer)
+    assert stats['total_tokens'] <= budget
+    assert prompt.rstrip().endswith('5. Next Steps')
+
+
+def test_register_patient(benchmark, client, session):
+    headers, _, profile, _ = session
+    response = benchmark(client.post, '/register-patient', json=profile, headers=headers)
+    assert response.status_code == 201
+
+
+def test_store_report(benchmark, client, session):
+    headers = session[0]
+    rng = new_rng(1)
+    response = benchmark(lambda: client.post('/store-report', json=make_report(rng), headers=headers))
+    assert response.status_code == 201
+
+
+def test_patient_data(benchmark, client, session):
+    headers, patient_id = session[0], session[1]
+    response = benchmark(client.get, '/patient-data', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['patient_id'] == patient_id
+
+
+def test_medical_reports(benchmark, client, session):
+    response = benchmark(client.get, '/medical-reports', headers=session[0])
+    assert response.status_code == 200
+    assert len(response.get_json()) >= 3
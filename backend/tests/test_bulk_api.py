@@ -0,0 +1,31 @@
+"""Bulk import batches on SQLite and PostgreSQL (see conftest.py for the engines)."""
+import pytest
+
+import repositories
+from repositories import PatientRepository
+from test_repositories import make_patient
+
+pytest.importorskip('flask')
+import bulk_api  # noqa: E402
+
+
+@pytest.fixture
+def patients(engine, monkeypatch):
+    repository = PatientRepository(engine)
+    monkeypatch.setattr(repositories, 'patients', repository)
+    return repository
+
+
+def test_flush_patients_keeps_last_row_per_patient(patients):
+    patients.upsert(make_patient('p1'))
+    batch = [(1, make_patient('p1', first_name='Meera')),
+             (2, make_patient('p2', first_name='Lata')),
+             (3, make_patient('p2', first_name='Divya')),
+             (4, make_patient('p3'))]
+    result = bulk_api.ImportResult()
+    bulk_api._flush_patients(batch, result)
+
+    assert (result.inserted, result.updated) == (2, 2)
+    assert patients.get('p1')['first_name'] == 'Meera'
+    assert patients.get('p2')['first_name'] == 'Divya'
+    assert patients.existing_ids(['p1', 'p2', 'p3']) == {'p1', 'p2', 'p3'}
@@ -0,0 +1,201 @@
+"""Repository layer on SQLite and PostgreSQL (see conftest.py for the engines)."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import MetaData, Table, Column, String, Text, inspect, select, func
+from sqlalchemy.exc import IntegrityError
+
+import blob_store
+import database as db
+import patient_summary
+import repositories
+from repositories import PatientRepository, MedicalReportRepository, GeneratedReportRepository
+
+RISK_FACTOR = {'test_name': 'Haemoglobin', 'result_value': 9.1, 'result_unit': 'g/dL',
+               'reference_range': '11 - 15', 'risk_level': 'high_risk'}
+
+
+def make_patient(patient_id, **overrides):
+    patient = {column.name: None for column in db.patients.columns}
+    patient.update(patient_id=patient_id, first_name='Asha', last_name='Rao', gender='Female',
+                   email=f"{patient_id}@example.com", dob='1994-05-01', lmp='2025-01-06', gravida=1, para=0,
+                   registration_date=datetime.now().isoformat(), last_updated=datetime.now().isoformat())
+    patient.update(overrides)
+    return patient
+
+
+def make_report(report_id, patient_id, analysis=None):
+    return {'report_id': report_id, 'patient_id': patient_id, 'type': 'Blood Test', 'category': 'Laboratory',
+            'date': '2025-03-01', 'file_url': f"https://example.com/{report_id}.pdf", 'notes': None,
+            'analysis_results': json.dumps(analysis or {}), 'created_at': datetime.now().isoformat()}
+
+
+def count_rows(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_upsert_updates_existing_patient(engine):
+    patients = PatientRepository(engine)
+    patients.upsert(make_patient('p1'))
+    assert patients.get('p1')['first_name'] == 'Asha'
+
+    patients.upsert(make_patient('p1', first_name='Meera'))
+    assert patients.get('p1')['first_name'] == 'Meera'
+    patients.upsert_many([make_patient('p1', current_weight=64.5), make_patient('p2')])
+
+    assert count_rows(engine, db.patients) == 2
+    patient = patients.get('p1')
+    assert patient['first_name'] == 'Asha'
+    assert patient['current_weight'] == 64.5
+    # The summary follows the upsert in the same transaction
+    assert patients.load_patient_data('p1')['personal_info']['current_weight'] == 64.5
+
+
+def test_add_many_stores_reports_and_summaries(engine):
+    PatientRepository(engine).upsert(make_patient('p1'))
+    reports = MedicalReportRepository(engine)
+    analysis = {'risk_factors': [RISK_FACTOR], 'test_results': []}
+    reports.add_many([make_report('r1', 'p1', analysis), make_report('r2', 'p1'), make_report('r3', 'p1')],
+                     {'p1': [analysis, {}, {}]})
+
+    stored = reports.list_for_patient('p1')
+    assert sorted(report['report_id'] for report in stored) == ['r1', 'r2', 'r3']
+    assert PatientRepository(engine).load_patient_data('p1')['risk_factors'] == [RISK_FACTOR]
+
+
+def test_summary_keeps_latest_finding_per_test(engine, monkeypatch):
+    monkeypatch.setattr(patient_summary, 'MAX_SUMMARY_FINDINGS', 2)
+    patients = PatientRepository(engine)
+    patients.upsert(make_patient('p1'))
+    reports = MedicalReportRepository(engine)
+    older = {'risk_factors': [RISK_FACTOR], 'test_results': []}
+    newer = {'risk_factors': [dict(RISK_FACTOR, result_value=8.4)], 'test_results': []}
+    reports.add_many([make_report('r1', 'p1', older), make_report('r2', 'p1', newer)], {'p1': [older, newer]})
+    assert patients.load_patient_data('p1')['risk_factors'] == newer['risk_factors']
+
+    others = [dict(RISK_FACTOR, test_name=name) for name in ('Platelets', 'TSH')]
+    reports.add(make_report('r3', 'p1', {'risk_factors': others}), {'risk_factors': others})
+    assert patients.load_patient_data('p1')['risk_factors'] == others
+
+    with engine.begin() as conn:
+        patient_summary.rebuild_summary(conn, 'p1')
+    assert patients.load_patient_data('p1')['risk_factors'] == others
+
+
+def test_add_many_rejects_duplicate_report_ids(engine):
+    PatientRepository(engine).upsert(make_patient('p1'))
+    reports = MedicalReportRepository(engine)
+    reports.add(make_report('r1', 'p1'), {})
+    with pytest.raises(IntegrityError):
+        reports.add_many([make_report('r2', 'p1'), make_report('r1', 'p1')], {'p1': [{}, {}]})
+    # The whole batch rolled back, summary included
+    assert [report['report_id'] for report in reports.list_for_patient('p1')] == ['r1']
+
+
+def test_client_text_is_never_read_as_a_blob_reference(engine):
+    PatientRepository(engine).upsert(make_patient('p1'))
+    reports = MedicalReportRepository(engine)
+    long_report = 'Assessment. ' * 1000
+    reports.add_rag_report('rag', 'p1', long_report)
+    assert json.loads(reports.get('rag')['analysis_results'])['report_content'] == long_report
+
+    with engine.connect() as conn:
+        stored = conn.execute(select(db.medical_reports.c.analysis_results)
+                              .where(db.medical_reports.c.report_id == 'rag')).scalar()
+    forged = json.loads(stored)['report_content']
+    assert forged.startswith(blob_store.REF_PREFIX)
+    reports.add(make_report('r1', 'p1', {'report_content': forged}), {})
+    reports.add_rag_report('rag2', 'p1', forged)
+    for report_id in ('r1', 'rag2'):
+        assert json.loads(reports.get(report_id)['analysis_results'])['report_content'] == forged
+
+    generated = GeneratedReportRepository(engine)
+    generated.create_pending('g1', 'p1')
+    generated.complete('g1', blob_store.ESCAPE_PREFIX + 'text')
+    assert generated.get('g1')['report_content'] == blob_store.ESCAPE_PREFIX + 'text'
+
+
+def test_existing_ids_across_chunks(engine, monkeypatch):
+    monkeypatch.setattr(repositories, 'IN_CHUNK_SIZE', 2)
+    patients = PatientRepository(engine)
+    patients.upsert_many([make_patient(f"p{i}") for i in range(5)])
+
+    assert patients.existing_ids(['p0', 'p1', 'p2', 'p3', 'p4', 'missing']) == {f"p{i}" for i in range(5)}
+    assert patients.existing_ids(iter(['p3', 'nope'])) == {'p3'}
+    assert patients.existing_ids([]) == set()
+
+
+def test_stream_all_yields_ordered_batches(engine):
+    patients = PatientRepository(engine)
+    patients.upsert_many([make_patient(f"p{i}") for i in (3, 0, 4, 1, 2)])
+
+    batches = list(patients.stream_all(batch_size=2))
+    assert all(1 <= len(batch) <= 2 for batch in batches)
+    assert [row['patient_id'] for batch in batches for row in batch] == ['p0', 'p1', 'p2', 'p3', 'p4']
+
+    reports = MedicalReportRepository(engine)
+    reports.add_many([make_report(f"r{i}", 'p1' if i % 2 else 'p2') for i in range(5)], {})
+    streamed = [row for batch in reports.stream_all(patient_id='p1', batch_size=1) for row in batch]
+    assert sorted(row['report_id'] for row in streamed) == ['r1', 'r3']
+
+
+def test_find_reusable(engine):
+    generated = GeneratedReportRepository(engine)
+    generated.create_pending('a', 'p1', 'digest')
+    assert generated.find_reusable('p1', 'digest') is None
+    generated.complete('a', 'report text', model_version='v1')
+    generated.create_pending('b', 'p1', 'digest')
+
+    assert generated.find_reusable('p1', 'digest') == {'report_id': 'a', 'status': 'completed',
+                                                       'model_version': 'v1'}
+    assert generated.find_reusable('p1', 'digest', ('completed', 'processing'))['report_id'] == 'b'
+    # A 'processing' row older than the cutoff is abandoned
+    future = (datetime.now() + timedelta(minutes=1)).isoformat()
+    assert generated.find_reusable('p1', 'digest', ('completed', 'processing'),
+                                   processing_since=future)['report_id'] == 'a'
+    assert generated.find_reusable('p1', 'other') is None
+    assert generated.find_reusable('p2', 'digest') is None
+
+    generated.delete('b')
+    generated.complete('a', 'failed', reusable=False)
+    assert generated.find_reusable('p1', 'digest', ('completed', 'processing')) is None
+
+
+def test_upgrade_existing_tables_adds_columns_and_indexes(bare_engine):
+    # GeneratedReports as created before model_version and input_digest existed
+    old = MetaData()
+    old_reports = Table('GeneratedReports', old,
+                        Column('report_id', Text, primary_key=True),
+                        Column('patient_id', String(50), nullable=False),
+                        Column('report_content', Text),
+                        Column('status', Text, nullable=False),
+                        Column('created_at', String(32)),
+                        Column('completed_at', String(32)))
+    old.create_all(bare_engine)
+    with bare_engine.begin() as conn:
+        conn.execute(old_reports.insert().values(report_id='old', patient_id='p1', report_content='text',
+                                                 status='completed', created_at='2024-01-01T00:00:00'))
+
+    db.init_db(bare_engine)
+    # Idempotent on an up-to-date schema
+    db.init_db(bare_engine)
+
+    inspector = inspect(bare_engine)
+    columns = {column['name'] for column in inspector.get_columns('GeneratedReports')}
+    assert {'model_version', 'input_digest'} <= columns
+    indexes = {index['name'] for index in inspector.get_indexes('GeneratedReports')}
+    assert 'idx_generated_reports_patient_digest' in indexes
+
+    report = GeneratedReportRepository(bare_engine).get('old')
+    assert report['report_content'] == 'text'
+    assert report['model_version'] is None and report['input_digest'] is None
+
+
+def test_reports_need_a_known_patient_on_postgres(engine):
+    if engine.dialect.name != 'postgresql':
+        pytest.skip('SQLite connections do not enable foreign keys')
+    with pytest.raises(IntegrityError):
+        MedicalReportRepository(engine).add(make_report('r1', 'ghost'), {})
+    assert count_rows(engine, db.medical_reports) == 0
@@ -0,0 +1,137 @@
+"""
+Memory-mapped FAISS index with a lazily-read SQLite docstore.
+
+LangChain's FAISS.save_local writes index.faiss plus a pickled index.pkl whose
+docstore is fully deserialized into RAM on load. Here the pickle is converted
+once into docstore.sqlite (one row per chunk, keyed by FAISS position) and the
+index is opened with IO_FLAG_MMAP, so workers share the index pages through the
+page cache and chunk text is only read for the top-k hits.
+
+    python vector_index.py maternal_care_faiss_index   # convert an existing LangChain index
+"""
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+INDEX_FILE = 'index.faiss'
+DOCSTORE_FILE = 'docstore.sqlite'
+
+
+def has_compact_store(index_dir):
+    return (os.path.exists(os.path.join(index_dir, INDEX_FILE))
+            and os.path.exists(os.path.join(index_dir, DOCSTORE_FILE)))
+
+
+def export_docstore(vector_store, index_dir):
+    """Write the chunks of a LangChain FAISS store to docstore.sqlite, keyed by FAISS position."""
+    path = os.path.join(index_dir, DOCSTORE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE chunks (
+        position INTEGER PRIMARY KEY,
+        doc_id TEXT NOT NULL,
+        page_content TEXT NOT NULL,
+        metadata TEXT
+    )''')
+    rows = []
+    for position, doc_id in vector_store.index_to_docstore_id.items():
+        doc = vector_store.docstore.search(doc_id)
+        rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+    c.executemany("INSERT INTO chunks (position, doc_id, page_content, metadata) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    # Atomic replace so concurrently starting workers never see a half-written docstore
+    os.replace(tmp_path, path)
+    print(f"Exported {len(rows)} chunks to {path}")
+    return path
+
+
+def convert_langchain_index(index_dir, embeddings=None):
+    """One-off conversion of index.pkl to docstore.sqlite (needs the pickle's LangChain classes)."""
+    from langchain_community.vectorstores import FAISS
+    vector_store = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    return export_docstore(vector_store, index_dir)
+
+
+def read_index(path, mmap=True):
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            # Not every index type supports mmap in every faiss build
+            print(f"mmap read of {path} unavailable ({e}), loading into memory")
+    return faiss.read_index(path)
+
+
+class MmapFAISSStore:
+    """
+    Read-only drop-in for the parts of LangChain's FAISS store the report
+    pipeline uses (similarity_search and friends).
+    """
+
+    def __init__(self, index_dir, embeddings, mmap=True):
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.index = read_index(os.path.join(index_dir, INDEX_FILE), mmap=mmap)
+        self.docstore_path = os.path.join(index_dir, DOCSTORE_FILE)
+        self._local = threading.local()
+
+    @property
+    def embedding_function(self):
+        return self.embeddings
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.docstore_path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def fetch_documents(self, positions):
+        positions = [int(p) for p in positions if p >= 0]
+        if not positions:
+            return {}
+        placeholders = ','.join('?' * len(positions))
+        c = self._connection().cursor()
+        c.execute(f"SELECT position, page_content, metadata FROM chunks WHERE position IN ({placeholders})",
+                  positions)
+        return {
+            position: Document(page_content=content, metadata=json.loads(metadata) if metadata else {})
+            for position, content, metadata in c.fetchall()
+        }
+
+    def search_vectors(self, vectors, k=4):
+        """Batched FAISS search, returns (distances, positions) arrays of shape (n, k)."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        return self.index.search(matrix, k)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        distances, positions = self.search_vectors([embedding], k)
+        documents = self.fetch_documents(positions[0])
+        return [(documents[int(p)], float(d)) for d, p in zip(distances[0], positions[0]) if int(p) in documents]
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4):
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k)
+
+    def similarity_search(self, query, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+if __name__ == '__main__':
+    from embedding_engine import load_embeddings
+    target = sys.argv[1] if len(sys.argv) > 1 else 'maternal_care_faiss_index'
+    convert_langchain_index(target, load_embeddings())
@@ -0,0 +1,139 @@
+"""
+Confidence-gated cascade for /predict.
+
+The distilled student (vision_models.CascadeStudent) answers both tasks in one
+ResNet-18 forward. A task escalates to its full ResNet-34 classifier only when
+the student's softmax confidence for it falls below CASCADE_THRESHOLD (percent,
+the same scale predict() reports). Easy sweep frames therefore cost one small
+forward instead of two large ones.
+
+CASCADE_MODE:
+  off      full classifiers only (default; also used when no student is trained)
+  on       cascade
+  shadow   cascade, plus run the full classifiers on a CASCADE_SHADOW_RATE
+           fraction of the frames the student answered, to measure live
+           agreement without changing responses
+
+CascadeStats tracks the escalation rate and the mean latency per path. It also
+tracks agreement with the full models, in two places. On answers the student
+served, agreement is measured by the shadow runs; this is the accuracy that
+matters. On escalated tasks, it measures how often the full model changed the
+answer. The stats are exposed at /admin/cascade. Behind model_server.py, the
+stats come from the vision worker that serves the request, since each forked
+worker keeps its own counters.
+"""
+import os
+import time
+import random
+import threading
+
+from flask import jsonify
+
+from admin_auth import admin_required
+from profiling import profiled
+from cpu_resources import workload
+from vision_models import preprocess_image, predict, predict_student, orientation_classes, plane_classes
+
+CASCADE_MODE = os.environ.get('CASCADE_MODE', 'off')
+CASCADE_THRESHOLD = float(os.environ.get('CASCADE_THRESHOLD', '90'))
+CASCADE_SHADOW_RATE = float(os.environ.get('CASCADE_SHADOW_RATE', '0.05'))
+TASKS = ('orientation', 'plane')
+
+
+class CascadeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.escalations = {task: 0 for task in TASKS}
+        self.frames_escalated = 0
+        # Student answer vs full model answer, on served (shadowed) and on escalated tasks
+        self.compared = {kind: {task: 0 for task in TASKS} for kind in ('accepted', 'escalated')}
+        self.agreed = {kind: {task: 0 for task in TASKS} for kind in ('accepted', 'escalated')}
+        self.latency_ms = {'student_only': 0.0, 'escalated': 0.0}
+        self.latency_count = {'student_only': 0, 'escalated': 0}
+
+    def record(self, escalated_tasks, comparisons, elapsed_ms, shadow=False):
+        with self._lock:
+            self.frames += 1
+            for task in escalated_tasks:
+                self.escalations[task] += 1
+            path = 'escalated' if escalated_tasks else 'student_only'
+            if escalated_tasks:
+                self.frames_escalated += 1
+            if elapsed_ms is not None:
+                self.latency_ms[path] += elapsed_ms
+                self.latency_count[path] += 1
+            kind = 'accepted' if shadow else 'escalated'
+            for task, agreed in comparisons.items():
+                self.compared[kind][task] += 1
+                self.agreed[kind][task] += int(agreed)
+
+    def snapshot(self):
+        with self._lock:
+            frames = self.frames
+            total_ms = sum(self.latency_ms.values())
+            timed = sum(self.latency_count.values())
+            return {
+                'mode': CASCADE_MODE,
+                'threshold': CASCADE_THRESHOLD,
+                'frames': frames,
+                'escalation_rate': self.frames_escalated / frames if frames else 0.0,
+                'task_escalation_rate': {task: self.escalations[task] / frames if frames else 0.0
+                                         for task in TASKS},
+                'agreement_with_full': {
+                    kind: {task: self.agreed[kind][task] / self.compared[kind][task]
+                           if self.compared[kind][task] else None for task in TASKS}
+                    for kind in self.compared},
+                'agreement_samples': {kind: dict(counts) for kind, counts in self.compared.items()},
+                'mean_latency_ms': total_ms / timed if timed else 0.0,
+                'mean_latency_ms_by_path': {path: self.latency_ms[path] / self.latency_count[path]
+                                            if self.latency_count[path] else None for path in self.latency_ms},
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def _result(prediction):
+    return {'prediction': prediction[0], 'confidence': float(prediction[1])}
+
+
+@profiled('classify_cascade')
+def classify_image_cascade(image_data, student, orientation_classifier, plane_classifier, device,
+                           threshold=CASCADE_THRESHOLD, shadow_rate=None):
+    if shadow_rate is None:
+        shadow_rate = CASCADE_SHADOW_RATE if CASCADE_MODE == 'shadow' else 0.0
+    start = time.perf_counter()
+    image = preprocess_image(image_data)
+    full_models = {'orientation': (orientation_classifier, orientation_classes),
+                   'plane': (plane_classifier, plane_classes)}
+
+    with workload('vision'):
+        student_answers = dict(zip(TASKS, predict_student(image, student, device)))
+        escalated = [task for task in TASKS if student_answers[task][1] < threshold]
+        shadow = not escalated and shadow_rate > 0 and random.random() < shadow_rate
+        full_answers = {}
+        for task in (TASKS if shadow else escalated):
+            model, classes = full_models[task]
+            full_answers[task] = predict(image, model, device, classes)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    comparisons = {task: full_answers[task][0] == student_answers[task][0] for task in full_answers}
+    # Shadow runs are measurement only: their latency would misstate the student-only path
+    cascade_stats.record(escalated, comparisons, None if shadow else elapsed_ms, shadow=shadow)
+
+    result = {}
+    for task in TASKS:
+        answer = full_answers[task] if task in escalated else student_answers[task]
+        result[task] = _result(answer)
+        result[task]['model'] = 'full' if task in escalated else 'student'
+    return result
+
+
+def init_cascade_api(app, model_client=None):
+    @app.route('/admin/cascade', methods=['GET'])
+    @admin_required
+    def cascade_status():
+        if model_client is not None:
+            return jsonify(model_client.cascade_stats()), 200
+        return jsonify(cascade_stats.snapshot()), 200
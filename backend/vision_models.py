@@ -0,0 +1,234 @@
+"""
+Ultrasound orientation/plane classifiers: ResNet-34 definition, checkpoint
+loading, preprocessing and prediction. Shared by app.py and model_server.py.
+
+CascadeStudent is the small two-headed ResNet-18 distilled from both
+classifiers (see distill_student.py and vision_cascade.py). It is saved as a
+plain state_dict, so it has no __main__ pickling constraint.
+
+The checkpoints were pickled with these classes living in __main__, so any
+entry point that loads them must import BasicBlock, ResNet and ImageClassifier
+into its own namespace.
+"""
+import io
+import os
+
+import torch
+import torch.nn as nn
+import pytorch_lightning as pl
+from torchvision import transforms
+from PIL import Image
+
+from profiling import profiled
+from cpu_resources import workload, prepare_classifier, prepare_input
+
+class BasicBlock(nn.Module):
+    expansion = 1
+    def __init__(self, inplanes, planes, stride=1, downsample=None):
+        super().__init__()
+        self.conv1 = nn.Conv2d(inplanes, planes, kernel_size=3, stride=stride, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(planes)
+        self.relu = nn.ReLU(inplace=True)
+        self.conv2 = nn.Conv2d(planes, planes, kernel_size=3, stride=1, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(planes)
+        self.downsample = downsample
+        self.stride = stride
+    
+    def forward(self, x):
+        identity = x
+        out = self.conv1(x)
+        out = self.bn1(out)
+        out = self.relu(out)
+        out = self.conv2(out)
+        out = self.bn2(out)
+        if self.downsample is not None:
+            identity = self.downsample(x)
+        out += identity
+        return out
+
+class ResNet(nn.Module):
+    def __init__(self, block, layers, num_classes=4):
+        super().__init__()
+        self.inplanes = 64
+        self.conv1 = nn.Conv2d(3, self.inplanes, kernel_size=7, stride=2, padding=3, bias=False)
+        self.bn1 = nn.BatchNorm2d(self.inplanes)
+        self.relu = nn.ReLU(inplace=True)
+        self.maxpool = nn.MaxPool2d(kernel_size=3, stride=2, padding=1)
+        self.layer1 = self._make_layer(block, 64, layers[0])
+        self.layer2 = self._make_layer(block, 128, layers[1], stride=2)
+        self.layer3 = self._make_layer(block, 256, layers[2], stride=2)
+        self.layer4 = self._make_layer(block, 512, layers[3], stride=2)
+        self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+        self.fc = nn.Linear(512, num_classes)
+    
+    def _make_layer(self, block, planes, blocks, stride=1):
+        downsample = None
+        if stride != 1 or self.inplanes != planes:
+            downsample = nn.Sequential(
+                nn.Conv2d(self.inplanes, planes, 1, stride, bias=False), 
+                nn.BatchNorm2d(planes)
+            )
+        layers = []
+        layers.append(block(self.inplanes, planes, stride, downsample))
+        self.inplanes = planes
+        for _ in range(1, blocks):
+            layers.append(block(self.inplanes, planes))
+        return nn.Sequential(*layers)
+    
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.bn1(x)
+        x = self.relu(x)
+        x = self.maxpool(x)
+        x = self.layer1(x)
+        x = self.layer2(x)
+        x = self.layer3(x)
+        x = self.layer4(x)
+        x = self.avgpool(x)
+        x = torch.flatten(x, 1)
+        x = self.fc(x)
+        return x
+
+def resnet34():
+    return ResNet(BasicBlock, [3, 4, 6, 3])
+
+def resnet18():
+    return ResNet(BasicBlock, [2, 2, 2, 2])
+
+def get_model():
+    return resnet34()
+
+class CascadeStudent(nn.Module):
+    """One ResNet-18 trunk with an orientation head and a plane head: both answers from a single forward."""
+    def __init__(self, num_orientation=4, num_plane=4):
+        super().__init__()
+        self.backbone = resnet18()
+        self.backbone.fc = nn.Identity()
+        self.orientation_head = nn.Linear(512, num_orientation)
+        self.plane_head = nn.Linear(512, num_plane)
+
+    def forward(self, x):
+        features = self.backbone(x)
+        return self.orientation_head(features), self.plane_head(features)
+
+class ImageClassifier(pl.LightningModule):
+    def __init__(self, model, num_classes=4, lr=1e-3):
+        super().__init__()
+        self.save_hyperparameters(ignore=['model'])
+        self.model = model
+    
+    def forward(self, x):
+        return self.model(x)
+
+
+# Define class names
+orientation_classes = ('hdvb', 'hdvf', 'huvb', 'huvf')
+plane_classes = ('AC_PLANE', 'BPD_PLANE', 'NO_Plane', 'FL_PLANE')
+
+orientation_model_path = 'Orientation_RES34.pth'
+plane_model_path = 'PLANE_34.pth'
+student_model_path = os.environ.get('STUDENT_MODEL_PATH', 'student_resnet18.pth')
+
+# Map checkpoint storages from the page cache instead of copying them into each process
+MMAP_CHECKPOINTS = os.environ.get('MMAP_CHECKPOINTS', '1') == '1'
+
+
+def _load_checkpoint(path, device):
+    if MMAP_CHECKPOINTS and device.type == 'cpu':
+        try:
+            return torch.load(path, map_location=device, weights_only=False, mmap=True)
+        except (TypeError, RuntimeError) as e:
+            # Older torch or legacy (non-zip) checkpoint format
+            print(f"mmap load of {path} unavailable ({e}), falling back to a regular load")
+    return torch.load(path, map_location=device, weights_only=False)
+
+
+def load_classifiers(device, orientation_path=None, plane_path=None):
+    try:
+        orientation_classifier = _load_checkpoint(orientation_path or orientation_model_path, device)
+        orientation_classifier.to(device)
+        prepare_classifier(orientation_classifier)
+    except Exception as e:
+        print(f"Error loading orientation model: {e}")
+        raise
+
+    try:
+        plane_model = get_model()
+        plane_classifier = ImageClassifier(plane_model)
+        state_dict = _load_checkpoint(plane_path or plane_model_path, device)
+        plane_classifier.load_state_dict(state_dict)
+        plane_classifier.to(device)
+        prepare_classifier(plane_classifier)
+    except Exception as e:
+        print(f"Error loading plane model: {e}")
+        raise
+
+    return orientation_classifier, plane_classifier
+
+
+def load_student(device, path=None):
+    """The distilled cascade student, or None when no checkpoint has been trained yet."""
+    path = path or student_model_path
+    if not os.path.exists(path):
+        print(f"No cascade student at {path}, run distill_student.py to train one")
+        return None
+    student = CascadeStudent()
+    student.load_state_dict(_load_checkpoint(path, device))
+    student.to(device)
+    return prepare_classifier(student)
+
+
+def preprocess_image(image_data):
+    transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+    ])
+    image = Image.open(io.BytesIO(image_data)).convert('RGB')
+    image = transform(image)
+    image = image.unsqueeze(0)
+    return image
+
+def _top_class(outputs, classes):
+    probabilities = torch.softmax(outputs, dim=1)[0]
+    predicted_class_idx = torch.argmax(probabilities).item()
+    return classes[predicted_class_idx], probabilities[predicted_class_idx].item() * 100
+
+@profiled('predict')
+def predict(image, model, device, classes):
+    image = prepare_input(image.to(device))
+    with torch.inference_mode():
+        outputs = model(image)
+        predicted_class, confidence = _top_class(outputs, classes)
+    return predicted_class, confidence
+
+@profiled('predict_student')
+def predict_student(image, student, device):
+    """((orientation, confidence), (plane, confidence)) from the cascade student."""
+    image = prepare_input(image.to(device))
+    with torch.inference_mode():
+        orientation_outputs, plane_outputs = student(image)
+        return _top_class(orientation_outputs, orientation_classes), _top_class(plane_outputs, plane_classes)
+
+
+def classify_image(image_data, orientation_classifier, plane_classifier, device):
+    image = preprocess_image(image_data)
+
+    with workload('vision'):
+        orientation_pred, orientation_conf = predict(
+            image, orientation_classifier, device, orientation_classes
+        )
+
+        plane_pred, plane_conf = predict(
+            image, plane_classifier, device, plane_classes
+        )
+
+    return {
+        'orientation': {
+            'prediction': orientation_pred,
+            'confidence': float(orientation_conf)
+        },
+        'plane': {
+            'prediction': plane_pred,
+            'confidence': float(plane_conf)
+        }
+    }